@@ -1,30 +1,16 @@
 from opensimplex import OpenSimplex
-import random, math
 
 buckets = 20
-samples = 1000000
 rng_range = 100000
 char_width = 50
 
 os = OpenSimplex(0)
-histogram2 = [0] * (buckets)
-histogram3 = [0] * (buckets)
-histogram4 = [0] * (buckets)
 
-for i in range(samples):
-	x = random.uniform(-rng_range, rng_range)
-	y = random.uniform(-rng_range, rng_range)
-	z = random.uniform(-rng_range, rng_range)
-	w = random.uniform(-rng_range, rng_range)
-	v2 = os.noise2(x, y)
-	b2 = round((v2+1) / 2 * (buckets-1))
-	histogram2[b2] += 1
-	v3 = os.noise3(x, y, z)
-	b3 = round((v3+1) / 2 * (buckets-1))
-	histogram3[b3] += 1
-	v4 = os.noise4(x, y, z, w)
-	b4 = round((v4+1) / 2 * (buckets-1))
-	histogram4[b4] += 1
+# Roughly 1M samples for each noise, spread out over a large domain. The noise is never stored, the samples are
+# reduced straight into the histogram buckets.
+histogram2, _ = os.noise_histogram(2, [(-rng_range, rng_range)] * 2, 1000, bins=buckets)
+histogram3, _ = os.noise_histogram(3, [(-rng_range, rng_range)] * 3, 100, bins=buckets)
+histogram4, _ = os.noise_histogram(4, [(-rng_range, rng_range)] * 4, 32, bins=buckets)
 
 def print_histogram(histogram):
 	biggest = max(histogram)
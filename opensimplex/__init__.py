@@ -2,3 +2,4 @@ __author__ = "Alex"
 __version__ = "0.4.5"
 
 from .api import *
+from . import graph, jit, ufunc
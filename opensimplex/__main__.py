@@ -0,0 +1,107 @@
+# Command line generator, writing noise sampled on a regular grid to a file:
+#
+#   python -m opensimplex noise.png --shape 4096 4096 --step 0.01 --octaves 4
+#
+# The noise is generated and written block by block, each block being generated in parallel by the array kernels.
+# The blocks are sized to stay within the memory budget (--memory), whatever the size of the output.
+
+import argparse
+import os
+import sys
+import time
+
+from .api import DEFAULT_SEED, OpenSimplex, _chunks
+from .constants import np
+from .writers import NpyWriter, PngWriter, RawWriter
+
+
+def _fractal(generate, octaves, persistence):
+    # The noise summed over the octaves, normalized to the range of a single octave.
+    scale = sum(persistence**k for k in range(octaves))
+
+    def fractal(*coords):
+        noise = generate(*coords)
+        for k in range(1, octaves):
+            noise += generate(*(c * 2**k for c in coords)) * persistence**k
+        if octaves > 1:
+            noise /= scale
+        return noise
+
+    return fractal
+
+
+def _per_dimension(parser, name, values, dims):
+    if len(values) == 1:
+        return values * dims
+    if len(values) != dims:
+        parser.error("%s takes 1 or %d values, got %d" % (name, dims, len(values)))
+    return values
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m opensimplex",
+        description="Generates OpenSimplex noise on a regular grid and streams it to a file.",
+    )
+    parser.add_argument("output", help="file to write")
+    parser.add_argument(
+        "--shape", type=int, nargs="+", required=True, help="shape of the output, 2 to 4 dimensions (x last)"
+    )
+    parser.add_argument(
+        "--origin", type=float, nargs="+", default=[0.0], help="coordinates of the first sample, in x, y, z, w order"
+    )
+    parser.add_argument(
+        "--step", type=float, nargs="+", default=[1.0], help="spacing of the samples, in x, y, z, w order"
+    )
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="seed of the noise")
+    parser.add_argument("--octaves", type=int, default=1, help="number of octaves, each with twice the frequency")
+    parser.add_argument("--persistence", type=float, default=0.5, help="amplitude of each octave relative to the last")
+    parser.add_argument(
+        "--format", choices=("raw", "npy", "png"), help="output format, by default from the extension (raw otherwise)"
+    )
+    parser.add_argument("--dtype", choices=("float32", "float64"), default="float32", help="samples of raw/npy output")
+    parser.add_argument("--bits", type=int, choices=(8, 16), default=8, help="bits per sample of png output")
+    parser.add_argument("--memory", type=float, default=64, help="memory budget in MiB (default: 64)")
+    parser.add_argument("--quiet", action="store_true", help="don't report the progress and throughput")
+    args = parser.parse_args(argv)
+
+    dims = len(args.shape)
+    if not 2 <= dims <= 4:
+        parser.error("--shape takes 2 to 4 dimensions, got %d" % dims)
+    if min(args.shape) < 1 or args.octaves < 1:
+        parser.error("--shape and --octaves must be positive")
+    shape = tuple(args.shape)
+    origin = _per_dimension(parser, "--origin", args.origin, dims)
+    step = _per_dimension(parser, "--step", args.step, dims)
+    output_format = args.format or {".npy": "npy", ".png": "png"}.get(os.path.splitext(args.output)[1].lower(), "raw")
+    if output_format == "png":
+        writer = PngWriter(args.output, shape, args.bits)
+    else:
+        writer = (NpyWriter if output_format == "npy" else RawWriter)(args.output, shape, args.dtype)
+
+    simplex = OpenSimplex(args.seed)
+    generate = _fractal(getattr(simplex, "noise%darray" % dims), args.octaves, args.persistence)
+    grid = [origin[d] + step[d] * np.arange(shape[dims - 1 - d]) for d in range(dims)]  # In x, y, z, w order
+    # A block takes three times its size in memory at most (the noise, one octave and the converted output)
+    size = max(int(args.memory * 2**20) // (3 * 8), 1)
+    total, done = int(np.prod(shape)), 0
+    start = reported = time.perf_counter()
+    with writer:
+        for _, block in _chunks(generate, grid, size):
+            writer.write(block.reshape(-1))
+            done += block.size
+            now = time.perf_counter()
+            if not args.quiet and now - reported >= 1.0:
+                rate = done / (now - start) / 1e6
+                print("%5.1f%% %.1f Msamples/s" % (100.0 * done / total, rate), end="\r", file=sys.stderr)
+                reported = now
+    seconds = time.perf_counter() - start
+    if not args.quiet:
+        rate = total / max(seconds, 1e-9) / 1e6
+        message = "Wrote %d samples to %s in %.2f s (%.1f Msamples/s)"
+        print(message % (total, args.output, seconds, rate), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
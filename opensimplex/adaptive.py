@@ -0,0 +1,71 @@
+# Adaptive sampling of the noise over a 2^dims-tree (a quadtree in 2D, an octree in 3D) of cells, refining only the
+# cells the noise isn't linear enough over. The tree is refined level by level, evaluating the new samples of a whole
+# level at once with the elementwise kernels.
+#
+# The samples are placed on an integer lattice, where a cell of the coarse grid spans 2**(max_depth + 1) units along
+# each axis, so the corners and centers of the cells down to max_depth all have integer coordinates. The lattice
+# coordinates of a sample are packed into a single integer key, to find the samples shared between cells.
+#
+# A cell is refined when the multilinear interpolation of its corners misses the noise at its center by more than
+# the tolerance, the error being what the tolerance bounds. The analytic gradients of the curl kernels (see
+# variants._curl_driver()) only exist for 2D and 3D, and tell how steep the noise is rather than how far from
+# linear, so they aren't used.
+
+import itertools
+
+from .constants import np
+from .internals import _points
+
+
+def _adaptive(dims, domain, resolution, tolerance, max_depth, perm, perm_grad_index3):
+    if dims not in (2, 3, 4):
+        raise ValueError("Expected 2, 3 or 4 dimensions, got %s" % dims)
+    if len(domain) != dims:
+        raise ValueError("Expected %d (low, high) pairs in domain, got %d" % (dims, len(domain)))
+    counts = np.broadcast_to(np.asarray(resolution, dtype=np.int64), (dims,))
+    if np.any(counts < 1) or max_depth < 0:
+        raise ValueError("Expected a positive resolution and a max_depth of 0 or more")
+    units = 2 ** (max_depth + 1)
+    extents = counts * units + 1  # Lattice points along each axis
+    if np.prod(extents.astype(np.double)) >= 2.0**62:
+        raise ValueError("The lattice of %s cells refined %d times is too large" % (tuple(counts), max_depth))
+    strides = np.cumprod(np.concatenate([[1], extents[:-1]]))
+    lows = np.array([low for low, high in domain], dtype=np.double)
+    cell_size = np.array([high - low for low, high in domain], dtype=np.double) / counts
+    corners = np.array(list(itertools.product((0, 1), repeat=dims)), dtype=np.int64)
+
+    keys, values = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.double)
+    cells = np.stack(np.meshgrid(*(np.arange(n) * units for n in counts), indexing="ij"), -1).reshape(-1, dims)
+    leaves, levels = [], []
+    for depth in range(max_depth + 1):
+        size = units >> depth
+        # Lattice coordinates of the corners (cells, 2**dims, dims) and the centers (cells, dims) of the cells
+        points = np.concatenate([cells[:, None, :] + corners * size, cells[:, None, :] + size // 2], axis=1)
+        wanted = points.reshape(-1, dims) @ strides
+        new = np.setdiff1d(wanted, keys)
+        if new.size:
+            coords = [lows[d] + (new // strides[d] % extents[d]) * (cell_size[d] / units) for d in range(dims)]
+            values = np.concatenate([values, _points(coords, perm, perm_grad_index3)])
+            keys = np.concatenate([keys, new])
+            order = np.argsort(keys, kind="stable")
+            keys, values = keys[order], values[order]
+        sampled = values[np.searchsorted(keys, wanted)].reshape(len(cells), -1)
+
+        # The error of the multilinear interpolation over the cell, at its center
+        error = np.abs(sampled[:, -1] - sampled[:, :-1].mean(axis=1))
+        refine = error > tolerance if depth < max_depth else np.zeros(len(cells), dtype=np.bool_)
+        leaves.append(cells[~refine])
+        levels.append(np.full(int(np.count_nonzero(~refine)), depth, dtype=np.int64))
+        cells = (cells[refine][:, None, :] + corners * (size // 2)).reshape(-1, dims)
+        if not len(cells):
+            break
+
+    points = np.stack([keys // strides[d] % extents[d] for d in range(dims)], axis=1)
+    leaves = np.concatenate(leaves)
+    return {
+        "points": lows + points * (cell_size / units),
+        "values": values,
+        "leaves": lows + leaves * (cell_size / units),
+        "levels": np.concatenate(levels),
+        "cell_size": cell_size,
+    }
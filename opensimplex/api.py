@@ -1,7 +1,27 @@
 from .constants import np
-from .internals import _init, _noise2, _noise3, _noise4, _noise2a, _noise3a, _noise4a
+from .internals import _init, _grad_index3, _noise2, _noise3, _noise4, _noise2a, _noise3a, _noise4a, _noise2pyramid
+from .internals import _coords, _launch, _single, _mask, _noise2m, _noise3m, _noise4m, _noise3a_lookup, _noise4a_lookup
+from .internals import _grid_stats, _grid_histogram, _noise3_bounds, _noise3_culled, _noise3_march
+from .internals import _threshold, _noise2t, _noise3t, _noise4t
+from .adaptive import _adaptive
+from .baked import BakedNoise
+from .jit import scalar as _scalar
+from .lazy import NoiseArray
+from .scrolling import ScrollingNoise2D, ScrollingNoise3D
+from .variants import _profile, _lookup_tables, _vector
+import atexit
+import inspect
+import itertools
+import os
+import sys
+import threading
 import time
 
+try:
+    from numba.core import event as _numba_event
+except ImportError:
+    _numba_event = None
+
 # Why 3 (and not just 0 or something)? I ran into a bug with"overflowing int" errors while refactoring in numpy and
 # using a non-zero seed value... This is a reminder
 DEFAULT_SEED = 3
@@ -43,6 +63,19 @@ def get_seed() -> int:
     """
     return _default.get_seed()
 
+
+def jit_state() -> tuple:
+    """
+    Return the state of the current seed for the functions of opensimplex.jit, which can be called from code compiled
+    with numba.njit. Seeding the module again doesn't change a state already returned.
+    :return: state as a tuple of the permutation tables
+
+    >>> opensimplex.jit.noise2(jit_state(), 0.5, 0.5) == noise2(0.5, 0.5)
+    True
+    """
+    return _default.jit_state
+
+
 def noise2(x: float, y: float) -> float:
     """
     Generate 2D OpenSimplex noise from X,Y coordinates.
@@ -56,21 +89,70 @@ def noise2(x: float, y: float) -> float:
     return _default.noise2(x, y)
 
 
-def noise2array(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+def scalar_noise(dims: int, seed: int = None):
+    """
+    Returns a function generating single samples of the noise of a seed, as noise(x, y[, z[, w]]), with as little
+    overhead per call as possible: the permutation tables are compiled into it and it's called without going through
+    the module function, the OpenSimplex method and numba's type dispatch. Meant for code taking many single samples,
+    where that overhead dominates: with numba, a call takes a third to a quarter of the time of noise2() etc. Each
+    function is compiled on first use for a seed (which takes about half a second).
+    :param dims: number of dimensions of the noise (2, 3 or 4)
+    :param seed: seed for the noise, or None to use the current seed of the module (later seeding doesn't change the
+                 returned function)
+    :return:     function taking dims floats and returning the noise as a float
+
+    >>> fast_noise2 = scalar_noise(2)
+    >>> fast_noise2(0.5, 0.5)
+    -0.43906247097569345
+    """
+    return (_default if seed is None else OpenSimplex(seed)).scalar_noise(dims)
+
+
+def noise2array(x: np.ndarray, y: np.ndarray, mask=None, out: np.ndarray = None):
     """
     Generates 2D OpenSimplex noise using Numpy arrays for increased performance.
-    :param x: numpy array of x-coords
-    :param y: numpy array of y-coords
-    :return:  2D numpy array of shape (y.size, x.size) with the generated noise
-              for the supplied coordinates
+    The coordinates can be any 1D float32 or float64 array, strided views and buffer-protocol objects (memoryview,
+    array.array) included, which are used without copying. Other inputs are copied to float64 arrays first.
+    :param x:    numpy array of x-coords
+    :param y:    numpy array of y-coords
+    :param mask: optional selection of the grid cells to generate, either as a boolean array of shape
+                 (y.size, x.size), a tuple of index arrays (as returned by numpy.nonzero()) or flat indices.
+                 Only the selected cells are evaluated, so the cost scales with their number.
+    :param out:  optional array of shape (y.size, x.size) to write the noise into, which is then returned.
+                 With a mask only the selected cells are written. A C-contiguous float64 or float32 array is
+                 filled in directly, without an intermediate float64 array.
+    :return:     2D numpy array of shape (y.size, x.size) with the generated noise
+                 for the supplied coordinates, or with a mask and no out, a tuple (values, indices) of
+                 the generated noise and the flat indices of the selected cells
 
     >>> rng = numpy.random.default_rng(seed=0)
     >>> ix, iy = rng.random(2), rng.random(2)
     >>> noise2array(ix, iy)
     array([[ 0.00449931, -0.01807883],
            [-0.00203524, -0.02358477]])
+    >>> noise2array(ix, iy, mask=[[True, False], [False, True]])
+    (array([ 0.00449931, -0.02358477]), array([0, 3]))
+    """
+    return _default.noise2array(x, y, mask, out)
+
+
+def noise2pyramid(x: np.ndarray, y: np.ndarray, levels: int, octaves: int = 1, persistence: float = 0.5) -> list:
+    """
+    Generates a level-of-detail pyramid of 2D multi-octave noise, where each level has half the resolution of the
+    level above it. Each octave is generated only once and reused on all the levels it contributes to.
+    :param x:           numpy array of x-coords for the finest level
+    :param y:           numpy array of y-coords for the finest level
+    :param levels:      number of levels in the pyramid
+    :param octaves:     number of octaves, each with twice the frequency of the previous
+    :param persistence: amplitude of each octave relative to the previous
+    :return:            list of 2D numpy arrays, where level l holds the noise for the coordinates x[::2**l] and
+                        y[::2**l], summing the first max(octaves - l, 1) octaves
+
+    >>> pyramid = noise2pyramid(numpy.linspace(0, 4, 256), numpy.linspace(0, 4, 256), levels=3, octaves=4)
+    >>> [level.shape for level in pyramid]
+    [(256, 256), (128, 128), (64, 64)]
     """
-    return _default.noise2array(x, y)
+    return _default.noise2pyramid(x, y, levels, octaves, persistence)
 
 
 def noise3(x: float, y: float, z: float) -> float:
@@ -87,14 +169,22 @@ def noise3(x: float, y: float, z: float) -> float:
     return _default.noise3(x, y, z)
 
 
-def noise3array(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+def noise3array(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, kernel: str = "branching", mask=None, out: np.ndarray = None
+):
     """
     Generates 3D OpenSimplex noise using Numpy arrays for increased performance.
-    :param x: numpy array of x-coords
-    :param y: numpy array of y-coords
-    :param z: numpy array of z-coords
-    :return:  3D numpy array of shape (z.size, y.size, x.size) with the generated
-              noise for the supplied coordinates
+    The coordinates are used without copying where possible, see noise2array().
+    :param x:      numpy array of x-coords
+    :param y:      numpy array of y-coords
+    :param z:      numpy array of z-coords
+    :param kernel: "branching" for the original kernel, or "lookup" for the table driven kernel without the
+                   nested branches (which gives bit-identical results, but runs about 30% slower with Numba)
+    :param mask:   optional selection of the grid cells to generate, see noise2array() (the lookup kernel
+                   doesn't support masks)
+    :param out:    optional array of shape (z.size, y.size, x.size) to write the noise into, see noise2array()
+    :return:       3D numpy array of shape (z.size, y.size, x.size) with the generated
+                   noise for the supplied coordinates, or (values, indices) with a mask, see noise2array()
 
     >>> rng = numpy.random.default_rng(seed=0)
     >>> ix, iy, iz = rng.random(2), rng.random(2), rng.random(2)
@@ -104,7 +194,97 @@ def noise3array(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
            [[0.48107672, 0.4881196 ],
             [0.45971748, 0.46684901]]])
     """
-    return _default.noise3array(x, y, z)
+    return _default.noise3array(x, y, z, kernel, mask, out)
+
+
+def noise3_bounds(block_origin, block_size) -> tuple:
+    """
+    Bounds the 3D noise over a box, without sampling it. The bounds are not tight, they're typically about 3 times
+    as far apart as the actual extremes for boxes a fraction of a unit in size, and grow quickly with the size of the
+    box. They hold as long as the kernel never skips a lattice vertex closer than a squared distance of 1.5 to the
+    point, which was checked empirically (the closest skipped vertex over 200000 random points was at 1.84), not
+    proven.
+    :param block_origin: (x, y, z) coordinates of the lowest corner of the box
+    :param block_size:   size of the box along each dimension, as a scalar or a (x, y, z) sequence
+    :return:             tuple (low, high) of the bounds of the noise
+
+    >>> low, high = noise3_bounds((0.5, 0.5, 0.5), 0.1)
+    >>> bool(low <= noise3(0.55, 0.6, 0.5) <= high)
+    True
+    """
+    return _default.noise3_bounds(block_origin, block_size)
+
+
+def noise3array_culled(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, threshold: float, block_size: int = 16, depth: int = 2
+) -> tuple:
+    """
+    Generates 3D noise on a grid like noise3array(), skipping the blocks of the grid proven to be entirely below or
+    above the threshold, as for voxel terrain where only the blocks crossing the surface noise == threshold matter.
+    A block is proven to be on one side of the threshold by bounding the noise over it (see noise3_bounds()),
+    splitting it in 8 up to depth times where the bounds straddle the threshold.
+    :param x:          numpy array of x-coords
+    :param y:          numpy array of y-coords
+    :param z:          numpy array of z-coords
+    :param threshold:  value the noise is compared to
+    :param block_size: number of samples along each dimension of a block
+    :param depth:      number of times a block can be split to prove it's on one side of the threshold
+    :return:           tuple of the noise, as a 3D numpy array of shape (z.size, y.size, x.size) holding NaN in the
+                       skipped blocks, and the classes of the blocks, as an int8 array of shape (blocks along z,
+                       blocks along y, blocks along x), -1 where the block is entirely below the threshold, 1 where
+                       it's entirely above it and 0 where the block was generated
+
+    >>> ix = numpy.linspace(0, 4, 128)
+    >>> noise, classes = noise3array_culled(ix, ix, ix, threshold=0.5)
+    >>> numpy.count_nonzero(classes), classes.size
+    (178, 512)
+    """
+    return _default.noise3array_culled(x, y, z, threshold, block_size, depth)
+
+
+def noise3_raymarch(
+    origins,
+    directions,
+    step: float,
+    steps: int,
+    octaves: int = 1,
+    persistence: float = 0.5,
+    bias: float = 0.0,
+    absorption: float = 1.0,
+    output: str = "transmittance",
+    cutoff: float = 1e-4,
+) -> np.ndarray:
+    """
+    Marches rays through the 3D noise taken as a density, as for volumetric clouds or fog, without generating a
+    volume of noise. The density is the noise (summed over the octaves, each with twice the frequency and persistence
+    times the amplitude of the last, normalized to the range of a single octave) plus the bias, clamped to zero. It's
+    sampled at the middle of each step along the rays, the rays being marched in parallel.
+    :param origins:     array of shape (..., 3) of the origins of the rays, broadcasted against the directions
+    :param directions:  array of shape (..., 3) of the directions of the rays, the points of a ray being at
+                        origin + direction * t for t from 0 to step * steps
+    :param step:        length of a step, in units of t
+    :param steps:       number of steps along each ray
+    :param octaves:     number of octaves summed in the density
+    :param persistence: amplitude of each octave relative to the last
+    :param bias:        added to the noise, the density being zero where the sum is negative
+    :param absorption:  absorption coefficient, scaling the optical depth into the transmittance
+    :param output:      "transmittance", exp(-absorption * depth), or "depth", the optical depth (the integral of the
+                        density along the ray)
+    :param cutoff:      transmittance below which a ray is stopped, as it's opaque for all intents and purposes (0 to
+                        march all the steps)
+    :return:            numpy array of the broadcasted shape of the rays, without the last dimension
+
+    >>> iy, ix = numpy.mgrid[0:4:64j, 0:4:64j]
+    >>> origins = numpy.stack([ix, iy, numpy.zeros_like(ix)], axis=-1)
+    >>> transmittance = noise3_raymarch(origins, (0.0, 0.0, 1.0), step=0.05, steps=80, octaves=3, bias=-0.1)
+    >>> transmittance.shape
+    (64, 64)
+    >>> print("%.4f" % transmittance.mean())
+    0.8454
+    """
+    return _default.noise3_raymarch(
+        origins, directions, step, steps, octaves, persistence, bias, absorption, output, cutoff
+    )
 
 
 def noise4(x: float, y: float, z: float, w: float) -> float:
@@ -122,15 +302,27 @@ def noise4(x: float, y: float, z: float, w: float) -> float:
     return _default.noise4(x, y, z, w)
 
 
-def noise4array(x: np.ndarray, y: np.ndarray, z: np.ndarray, w: np.ndarray) -> np.ndarray:
+def noise4array(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    w: np.ndarray,
+    kernel: str = "branching",
+    mask=None,
+    out: np.ndarray = None,
+):
     """
     Generates 4D OpenSimplex noise using Numpy arrays for increased performance.
-    :param x: numpy array of x-coords
-    :param y: numpy array of y-coords
-    :param z: numpy array of z-coords
-    :param w: numpy array of w-coords
-    :return:  4D numpy array of shape (w.size, z.size, y.size, x.size) with the
-              generated noise for the supplied coordinates
+    The coordinates are used without copying where possible, see noise2array().
+    :param x:      numpy array of x-coords
+    :param y:      numpy array of y-coords
+    :param z:      numpy array of z-coords
+    :param w:      numpy array of w-coords
+    :param kernel: "branching" or "lookup", see noise3array()
+    :param mask:   optional selection of the grid cells to generate, see noise3array()
+    :param out:    optional array of shape (w.size, z.size, y.size, x.size) to write the noise into
+    :return:       4D numpy array of shape (w.size, z.size, y.size, x.size) with the
+                   generated noise for the supplied coordinates, or (values, indices) with a mask
 
     >>> rng = numpy.random.default_rng(seed=0)
     >>> ix, iy, iz, iw = rng.random(2), rng.random(2), rng.random(2), rng.random(2)
@@ -144,37 +336,949 @@ def noise4array(x: np.ndarray, y: np.ndarray, z: np.ndarray, w: np.ndarray) -> n
             [[0.36930335, 0.36046537],
              [0.36360679, 0.35500328]]]])
     """
-    return _default.noise4array(x, y, z, w)
+    return _default.noise4array(x, y, z, w, kernel, mask, out)
+
+
+def noise2array_threshold(x: np.ndarray, y: np.ndarray, thresholds, packed: bool = False) -> np.ndarray:
+    """
+    Generates 2D noise like noise2array(), but writes the class of each cell instead of the noise: the number of
+    thresholds the noise is above, using 1 byte per cell (or 1 bit with packed), instead of 8.
+    :param x:          numpy array of x-coords
+    :param y:          numpy array of y-coords
+    :param thresholds: a threshold, or a sequence of up to 255 thresholds in increasing order
+    :param packed:     with a single threshold, pack the classes 8 to a byte along the x axis, in the layout of
+                       numpy.packbits(noise > threshold, axis=-1)
+    :return:           uint8 array of shape (y.size, x.size) holding the classes (0 or 1 with a single threshold,
+                       use .view(bool) for a boolean array), or of shape (y.size, ceil(x.size / 8)) with packed
+
+    >>> ix = numpy.linspace(0, 1, 5)
+    >>> noise2array_threshold(ix, ix, [-0.25, 0.25])
+    array([[1, 1, 1, 1, 0],
+           [0, 1, 1, 0, 0],
+           [0, 0, 0, 0, 1],
+           [0, 0, 0, 0, 1],
+           [0, 0, 0, 0, 1]], dtype=uint8)
+    """
+    return _default.noise2array_threshold(x, y, thresholds, packed)
+
+
+def noise3array_threshold(x: np.ndarray, y: np.ndarray, z: np.ndarray, thresholds, packed: bool = False) -> np.ndarray:
+    """
+    Generates 3D noise like noise3array(), but writes the class of each cell instead of the noise, see
+    noise2array_threshold().
+    :return: uint8 array of shape (z.size, y.size, x.size), or (z.size, y.size, ceil(x.size / 8)) with packed
+
+    >>> ix = numpy.linspace(0, 10, 100)
+    >>> caves = noise3array_threshold(ix, ix, ix, 0.3, packed=True)
+    >>> caves.shape, caves.nbytes
+    ((100, 100, 13), 130000)
+    """
+    return _default.noise3array_threshold(x, y, z, thresholds, packed)
+
+
+def noise4array_threshold(
+    x: np.ndarray, y: np.ndarray, z: np.ndarray, w: np.ndarray, thresholds, packed: bool = False
+) -> np.ndarray:
+    """
+    Generates 4D noise like noise4array(), but writes the class of each cell instead of the noise, see
+    noise2array_threshold().
+    :return: uint8 array of shape (w.size, z.size, y.size, x.size), or (w.size, z.size, y.size, ceil(x.size / 8))
+             with packed
+    """
+    return _default.noise4array_threshold(x, y, z, w, thresholds, packed)
+
+
+class Cancelled(Exception):
+    """
+    Raised by the chunked array functions when cancelled, between two chunks. The chunks generated so far are kept in
+    the out array, if one was given.
+    """
+
+
+class DeadlineExceeded(Cancelled, TimeoutError):
+    """
+    Raised by the chunked array functions when past their deadline, between two chunks.
+    """
+
+
+def noise2array_chunked(
+    x: np.ndarray,
+    y: np.ndarray,
+    progress=None,
+    cancel=None,
+    deadline: float = None,
+    chunk_size: int = 2**18,
+    out: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Generates 2D noise like noise2array(), in chunks of samples along the outer axes, so a long generation can report
+    its progress and be cancelled or stopped at a deadline. The noise is the same as generated by noise2array().
+    :param x:          numpy array of x-coords
+    :param y:          numpy array of y-coords
+    :param progress:   optional function, called as progress(done, total) with the numbers of samples generated so
+                       far and in total after each chunk
+    :param cancel:     optional threading.Event (or any object with an is_set() method), raising Cancelled before the
+                       next chunk once set
+    :param deadline:   optional time.monotonic() value, raising DeadlineExceeded before the next chunk once past
+    :param chunk_size: number of samples generated at a time (at least a row of the x axis)
+    :param out:        optional array of the shape of the noise to generate it into, keeping the chunks generated
+                       before a cancellation
+    :return:           2D numpy array of shape (y.size, x.size) with the generated noise
+
+    >>> done = []
+    >>> ix, iy = numpy.linspace(0, 1, 1000), numpy.linspace(0, 1, 600)
+    >>> noise = noise2array_chunked(ix, iy, progress=lambda done_, total: done.append(done_), chunk_size=100000)
+    >>> done
+    [100000, 200000, 300000, 400000, 500000, 600000]
+    """
+    return _default.noise2array_chunked(x, y, progress, cancel, deadline, chunk_size, out)
+
+
+def noise3array_chunked(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    progress=None,
+    cancel=None,
+    deadline: float = None,
+    chunk_size: int = 2**18,
+    out: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Generates 3D noise like noise3array(), in chunks, see noise2array_chunked().
+    :return: 3D numpy array of shape (z.size, y.size, x.size) with the generated noise
+    """
+    return _default.noise3array_chunked(x, y, z, progress, cancel, deadline, chunk_size, out)
+
+
+def noise4array_chunked(
+    x: np.ndarray,
+    y: np.ndarray,
+    z: np.ndarray,
+    w: np.ndarray,
+    progress=None,
+    cancel=None,
+    deadline: float = None,
+    chunk_size: int = 2**18,
+    out: np.ndarray = None,
+) -> np.ndarray:
+    """
+    Generates 4D noise like noise4array(), in chunks, see noise2array_chunked().
+
+    >>> import threading
+    >>> ix = numpy.linspace(0, 1, 100)
+    >>> cancel = threading.Event()
+    >>> noise4array_chunked(ix, ix, ix, ix, progress=lambda done, total: cancel.set(), cancel=cancel)
+    Traceback (most recent call last):
+     ...
+    opensimplex.api.Cancelled: Cancelled after 260000 of 100000000 samples
+    """
+    return _default.noise4array_chunked(x, y, z, w, progress, cancel, deadline, chunk_size, out)
+
+
+def noise_stats(dims: int, domain: list, resolution) -> dict:
+    """
+    Computes statistics over noise sampled on a regular grid, without storing the noise. The samples are taken at
+    the centers of the grid cells covering the domain and reduced in parallel, using constant memory.
+    :param dims:       number of dimensions of the noise (2, 3 or 4)
+    :param domain:     sequence of (low, high) coordinate pairs, one for each dimension in x, y, z, w order
+    :param resolution: number of samples along each dimension, as an integer or a sequence of integers
+    :return:           dict with the "count", "min", "max", "mean" and "var" (population variance) of the samples
+
+    >>> noise_stats(2, [(-1000, 1000), (-1000, 1000)], 1000)["count"]
+    1000000
+    """
+    return _default.noise_stats(dims, domain, resolution)
+
+
+def noise_histogram(dims: int, domain: list, resolution, bins: int = 20, range: tuple = (-1.0, 1.0)) -> tuple:
+    """
+    Computes a histogram over noise sampled on a regular grid, without storing the noise. See noise_stats() for the
+    sampling. Values outside of the range are ignored.
+    :param dims:       number of dimensions of the noise (2, 3 or 4)
+    :param domain:     sequence of (low, high) coordinate pairs, one for each dimension in x, y, z, w order
+    :param resolution: number of samples along each dimension, as an integer or a sequence of integers
+    :param bins:       number of equal-width bins
+    :param range:      (low, high) range of the bins
+    :return:           tuple of the histogram and the bin edges, as in numpy.histogram()
+
+    >>> hist, edges = noise_histogram(2, [(-1000, 1000), (-1000, 1000)], 1000, bins=4)
+    >>> hist
+    array([ 79981, 418969, 423713,  77337])
+    """
+    return _default.noise_histogram(dims, domain, resolution, bins, range)
+
+
+def vector2array(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Generates 2D vector noise, in a single pass over the lattice for all components. Component c is the noise of
+    seed + c, so the first component is the same as noise2array().
+    :param x: numpy array of x-coords
+    :param y: numpy array of y-coords
+    :return:  3D numpy array of shape (y.size, x.size, 2) with the generated vectors
+
+    >>> vector2array(numpy.array([0.5, 1.5]), numpy.array([0.5]))[0, 0]
+    array([-0.43906247,  0.33139634])
+    """
+    return _default.vector2array(x, y)
+
+
+def vector3array(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """
+    Generates 3D vector noise, see vector2array().
+    :param x: numpy array of x-coords
+    :param y: numpy array of y-coords
+    :param z: numpy array of z-coords
+    :return:  4D numpy array of shape (z.size, y.size, x.size, 3) with the generated vectors
+    """
+    return _default.vector3array(x, y, z)
+
+
+def curl2array(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Generates 2D curl noise, the divergence-free field (dn/dy, -dn/dx) of the noise n of noise2array(). The partial
+    derivatives are computed analytically, along with the noise.
+    :param x: numpy array of x-coords
+    :param y: numpy array of y-coords
+    :return:  3D numpy array of shape (y.size, x.size, 2) with the generated vectors
+    """
+    return _default.curl2array(x, y)
+
+
+def curl3array(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """
+    Generates 3D curl noise, the divergence-free curl of the vector noise of vector3array() (used as a vector
+    potential). The partial derivatives are computed analytically, along with the noise, in a single pass.
+    :param x: numpy array of x-coords
+    :param y: numpy array of y-coords
+    :param z: numpy array of z-coords
+    :return:  4D numpy array of shape (z.size, y.size, x.size, 3) with the generated vectors
+    """
+    return _default.curl3array(x, y, z)
+
+
+def lazy_array(dims: int, shape, origin=0.0, step=1.0, seed: int = None) -> NoiseArray:
+    """
+    Returns an array-like object holding the noise sampled on a regular grid, which is only generated for the elements
+    it is indexed with (so it can stand in for arrays far too large to fit in memory).
+    :param dims:   number of dimensions of the noise (2, 3 or 4)
+    :param shape:  shape of the array, with the axes in the same order as noise2array() etc. (the x axis last)
+    :param origin: coordinates of the first element, as a scalar or a sequence in x, y, z, w order
+    :param step:   spacing of the elements along each dimension, as a scalar or a sequence in x, y, z, w order
+    :param seed:   seed for the noise, or None to use the current seed of the module
+    :return:       NoiseArray, supporting .shape, .dtype, numpy's basic indexing and numpy.asarray()
+
+    >>> planet = lazy_array(2, (10**9, 10**9), origin=(-5e8, -5e8), step=1.0)
+    >>> planet[0, :3]
+    array([ 0.13627403, -0.61299117, -0.07183678])
+    """
+    return (_default if seed is None else OpenSimplex(seed)).lazy_array(dims, shape, origin, step)
+
+
+def scrolling_window(dims: int, shape, origin=0.0, step=1.0, seed: int = None):
+    """
+    Returns a window of noise on a regular grid that can be moved by whole cells, as around a moving camera. The
+    window is held in a ring buffer, so moving it only generates the newly exposed rows and columns.
+    :param dims:   number of dimensions of the noise (2 or 3)
+    :param shape:  shape of the window, with the axes in the same order as noise2array() etc. (the x axis last)
+    :param origin: coordinates of the grid cell 0, as a scalar or a sequence in x, y, z order
+    :param step:   spacing of the grid along each dimension, as a scalar or a sequence in x, y, z order
+    :param seed:   seed for the noise, or None to use the current seed of the module
+    :return:       ScrollingNoise2D or ScrollingNoise3D, with shift(dx, dy[, dz]) moving the window, window() copying it
+                   out in order, and buffer and offset giving the ring buffer itself
+
+    >>> view = scrolling_window(2, (256, 256), step=0.05)
+    >>> view.shift(3, -2)
+    >>> numpy.array_equal(view.window(), noise2array(0.05 * numpy.arange(3, 259), 0.05 * numpy.arange(-2, 254)))
+    True
+    """
+    return (_default if seed is None else OpenSimplex(seed)).scrolling_window(dims, shape, origin, step)
+
+
+def adaptive_sample(
+    dims: int, domain: list, resolution, tolerance: float = 0.01, max_depth: int = 6, seed: int = None
+) -> dict:
+    """
+    Samples the noise adaptively over a quadtree (2D), octree (3D) or its 4D equivalent, refining only the cells
+    where the noise varies too fast to be interpolated linearly. Starting from a coarse grid of cells, the noise is
+    evaluated at the corners and the center of each cell, and the cells where the center differs from the mean of
+    the corners by more than the tolerance are split in 2**dims cells of half the size, up to max_depth times.
+    :param dims:       number of dimensions of the noise (2, 3 or 4)
+    :param domain:     sequence of (low, high) coordinate pairs, one for each dimension in x, y, z, w order
+    :param resolution: number of cells of the coarse grid along each dimension, as an integer or a sequence of
+                       integers in x, y, z, w order
+    :param tolerance:  largest error allowed for the linear interpolation over a cell
+    :param max_depth:  number of times a cell of the coarse grid can be split
+    :param seed:       seed for the noise, or None to use the current seed of the module
+    :return:           dict with the evaluated "points" (array of shape (n, dims), in x, y, z, w order, sorted) and
+                       their "values", the lower corners of the "leaves" of the tree (array of shape (k, dims)) and
+                       their "levels" (their size being "cell_size" / 2**level, "cell_size" is the size of the
+                       cells of the coarse grid along each dimension)
+
+    >>> tree = adaptive_sample(2, [(0, 8), (0, 8)], 8, tolerance=0.02)
+    >>> len(tree["values"]), len(tree["leaves"])
+    (6646, 3010)
+    """
+    simplex = _default if seed is None else OpenSimplex(seed)
+    return simplex.adaptive_sample(dims, domain, resolution, tolerance, max_depth)
+
+
+def bake(
+    dims: int,
+    domain: list,
+    resolution,
+    interpolation: str = "cubic",
+    octaves: int = 1,
+    persistence: float = 0.5,
+    path: str = None,
+    seed: int = None,
+) -> BakedNoise:
+    """
+    Bakes the noise over a bounded domain into a regular grid of samples, answering point queries by interpolating
+    between the samples. For low-frequency noise queried many times, a grid of a few samples per unit of the noise
+    coordinates keeps the approximation error small (see BakedNoise.error()) at a fraction of the cost of the noise.
+    :param dims:          number of dimensions of the noise (2, 3 or 4)
+    :param domain:        sequence of (low, high) coordinate pairs, one for each dimension in x, y, z, w order
+    :param resolution:    number of samples along each dimension (borders included, at least 2), as an integer or a
+                          sequence of integers in x, y, z, w order
+    :param interpolation: "cubic" (Catmull-Rom splines over 4 samples along each dimension) or "linear" (over 2)
+    :param octaves:       number of octaves baked into the samples, each with twice the frequency of the previous
+                          (the sum is normalized to the range of a single octave)
+    :param persistence:   amplitude of each octave relative to the previous
+    :param path:          optional path of a .npy file to hold the samples, which is then memory-mapped
+    :param seed:          seed for the noise, or None to use the current seed of the module
+    :return:              BakedNoise, called with the coordinates of a point (baked(x, y)), or with arrays of
+                          coordinates through baked.sample(x, y)
+
+    >>> baked = bake(2, [(0, 10), (0, 10)], 101)
+    >>> print("%.4f %.4f" % (baked(2.5, 7.25), noise2(2.5, 7.25)))
+    -0.2575 -0.2574
+    >>> baked.error()["max"] < 0.01
+    True
+    """
+    simplex = _default if seed is None else OpenSimplex(seed)
+    return simplex.bake(dims, domain, resolution, interpolation, octaves, persistence, path)
+
+
+def profile_noise2(x: np.ndarray, y: np.ndarray) -> dict:
+    """
+    Runs a profiling build of the 2D noise kernel over the given points, counting how often each branch of the
+    lattice region selection is taken and how many vertices contribute to the samples. The profiling build is
+    compiled on the first call and is a lot slower than the normal kernels.
+    :param x: numpy array of x-coords
+    :param y: numpy array of y-coords, same size as x
+    :return:  dict with the number of "samples", the total number of contributing "vertices", the number of
+              attenuation "early_outs" (vertices evaluated but too far away to contribute) and the "branches", as a
+              dict of {"line: condition": (times true, times false)}
+
+    >>> rng = numpy.random.default_rng(seed=0)
+    >>> report = profile_noise2(rng.random(1000) * 100, rng.random(1000) * 100)
+    >>> report["samples"], report["vertices"] / report["samples"]
+    (1000, 3.658)
+    """
+    return _default.profile_noise2(x, y)
+
+
+def profile_noise3(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> dict:
+    """
+    Runs a profiling build of the 3D noise kernel over the given points, see profile_noise2().
+    """
+    return _default.profile_noise3(x, y, z)
+
+
+def profile_noise4(x: np.ndarray, y: np.ndarray, z: np.ndarray, w: np.ndarray) -> dict:
+    """
+    Runs a profiling build of the 4D noise kernel over the given points, see profile_noise2().
+    """
+    return _default.profile_noise4(x, y, z, w)
 
 
 ################################################################################
+# Opt-in runtime statistics. While disabled, the methods of OpenSimplex are left untouched so there's no overhead.
+
+
+def enable_stats(callback=None) -> None:
+    """
+    Starts recording runtime statistics for the noise functions, of both the module and all OpenSimplex instances.
+    Numba compilations and cache usage are also tracked, if Numba is available.
+    :param callback: optional function, called as callback(name, points, seconds, nbytes) after each noise call
+                     for exporting the numbers to other metric systems
+
+    >>> enable_stats(lambda name, points, seconds, nbytes: print(name, points))
+    >>> _ = noise2(0.5, 0.5)
+    noise2 1
+    >>> disable_stats()
+    >>> reset_stats()
+    """
+    global _stats_callback, _stats_enabled
+    _stats_callback = callback
+    if _stats_enabled:
+        return
+    _stats_enabled = True
+    for name in _instrumented():
+        setattr(OpenSimplex, name, _instrument(name, getattr(OpenSimplex, name)))
+    if _numba_event is not None:
+        _numba_event.register("numba:compile", _compile_listener)
+
+
+def disable_stats() -> None:
+    """
+    Stops recording runtime statistics. The statistics recorded so far are kept.
+
+    >>> disable_stats()
+    """
+    global _stats_callback, _stats_enabled
+    _stats_callback = None
+    if not _stats_enabled:
+        return
+    _stats_enabled = False
+    for name in _instrumented():
+        setattr(OpenSimplex, name, getattr(OpenSimplex, name).__wrapped__)
+    if _numba_event is not None:
+        _numba_event.unregister("numba:compile", _compile_listener)
+
+
+def stats() -> dict:
+    """
+    Return the runtime statistics recorded since the last reset.
+    :return: dict with the number of calls, points evaluated, wall time in seconds and bytes allocated for the
+             outputs per function, plus the number and duration of Numba compilations and the Numba cache hits/misses
+
+    >>> enable_stats()
+    >>> _ = noise2(0.5, 0.5)
+    >>> stats()["functions"]["noise2"]["calls"]
+    1
+    >>> disable_stats()
+    >>> reset_stats()
+    """
+    with _stats_lock:
+        hits, misses = _cache_counts()
+        return {
+            "functions": {name: dict(counts) for name, counts in _stats["functions"].items()},
+            "compile": dict(_stats["compile"]),
+            "cache": {"hits": hits - _stats["cache"]["hits"], "misses": misses - _stats["cache"]["misses"]},
+        }
+
+
+def reset_stats() -> None:
+    """
+    Clears the recorded runtime statistics.
+
+    >>> reset_stats()
+    """
+    with _stats_lock:
+        hits, misses = _cache_counts()
+        _stats["functions"] = {}
+        _stats["compile"] = {"count": 0, "seconds": 0.0}
+        _stats["cache"] = {"hits": hits, "misses": misses}
+
+
+def _instrumented():
+    return [name for name, value in vars(OpenSimplex).items() if name.startswith("noise") and callable(value)]
+
+
+def _instrument(name, method):
+    # Positions of the mask and out arguments of the method (self included), if it takes them.
+    parameters = list(inspect.signature(method).parameters)
+    positions = {argument: parameters.index(argument) for argument in ("mask", "out") if argument in parameters}
+
+    def argument(args, kwargs, name):
+        if name in kwargs:
+            return kwargs[name]
+        position = positions.get(name)
+        return args[position] if position is not None and position < len(args) else None
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = method(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        mask, out = argument(args, kwargs, "mask"), argument(args, kwargs, "out")
+        # The points are the samples evaluated: the cells left after culling, the cells selected by the mask, or else
+        # the size of the (first) output, as (values, indices) results only hold one sample per cell. The bytes are
+        # those of the outputs allocated by the call, so not of out.
+        outputs = result if isinstance(result, (list, tuple)) else [result]
+        if name in _EVALUATED:
+            points = _EVALUATED[name](result)
+        elif mask is not None:
+            mask = np.asarray(mask)
+            points = int(np.count_nonzero(mask)) if mask.dtype == np.bool_ else mask.size
+        else:
+            points = outputs[0].size if outputs and isinstance(outputs[0], np.ndarray) else 1
+        nbytes = sum(output.nbytes for output in outputs if isinstance(output, np.ndarray) and output is not out)
+        with _stats_lock:
+            counts = _stats["functions"].setdefault(name, {"calls": 0, "points": 0, "seconds": 0.0, "bytes": 0})
+            counts["calls"] += 1
+            counts["points"] += points
+            counts["seconds"] += seconds
+            counts["bytes"] += nbytes
+        callback = _stats_callback
+        if callback is not None:
+            callback(name, points, seconds, nbytes)
+        return result
+
+    wrapper.__wrapped__ = method
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def _cache_counts():
+    # Only the kernels defined at the top of the modules are cached on disk, the ones built at runtime (for a seed, a
+    # graph or a variant) aren't. graph.py imports this module, so the modules are looked up once they're loaded.
+    hits = misses = 0
+    for name in _KERNEL_MODULES:
+        module = sys.modules.get(__package__ + "." + name)
+        for value in vars(module).values() if module is not None else ():
+            cache_stats = getattr(value, "stats", None)
+            if cache_stats is not None and hasattr(cache_stats, "cache_hits"):
+                hits += sum(cache_stats.cache_hits.values())
+                misses += sum(cache_stats.cache_misses.values())
+    return hits, misses
+
+
+if _numba_event is not None:
+
+    class _CompileListener(_numba_event.Listener):
+        # Compilations are nested (a kernel compiles the functions it calls), so only the outermost one is timed.
+        def __init__(self):
+            self._local = threading.local()
+
+        def on_start(self, event):
+            starts = self._local.__dict__.setdefault("starts", [])
+            starts.append(time.perf_counter())
+
+        def on_end(self, event):
+            start = self._local.starts.pop()
+            with _stats_lock:
+                _stats["compile"]["count"] += 1
+                if not self._local.starts:
+                    _stats["compile"]["seconds"] += time.perf_counter() - start
+
+    _compile_listener = _CompileListener()
+
+
+_KERNEL_MODULES = ("internals", "baked", "graph", "jit", "variants")
+# Samples actually evaluated by the functions skipping some of the cells of their output
+_EVALUATED = {"noise3array_culled": lambda result: int(np.count_nonzero(~np.isnan(result[0])))}
+_stats_lock = threading.Lock()
+_stats_enabled = False
+_stats_callback = None
+_stats = {}
+reset_stats()
+
+
+################################################################################
+
 
 # This class is provided for backwards compatibility and might disappear in the future. Use at your own risk.
 class OpenSimplex(object):
-    def __init__(self, seed: int) -> None:
-        self._perm, self._perm_grad_index3 = _init(seed)
+    __slots__ = ("_seed", "_perm", "_perm_grad_index3", "_segment", "_component_tables")
+
+    def __init__(self, seed: int, shared: bool = False) -> None:
+        if shared:
+            self._perm, self._perm_grad_index3, self._segment = _shared_tables(seed)
+        else:
+            self._perm, self._perm_grad_index3 = _init(seed)
+            self._segment = None
         self._seed = seed
+        self._component_tables = None
+
+    def __reduce__(self):
+        # Only the permutation table is pickled (or the name of the shared memory segment holding the tables).
+        if self._segment is not None:
+            return _unpickle_shared, (self._seed, self._segment.name)
+        return _unpickle, (self._seed, self._perm.tobytes())
 
     def get_seed(self) -> int:
         return self._seed
 
+    @property
+    def jit_state(self) -> tuple:
+        # See opensimplex.jit, the layout of the state must stay the same across releases.
+        return (self._perm, self._perm_grad_index3)
+
+    def scalar_noise(self, dims: int):
+        return _scalar(self.jit_state, dims)
+
     def noise2(self, x: float, y: float) -> float:
         return _noise2(x, y, self._perm)
 
-    def noise2array(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
-        return _noise2a(x, y, self._perm)
+    def noise2array(self, x: np.ndarray, y: np.ndarray, mask=None, out: np.ndarray = None):
+        coords = _coords(x, y)
+        if mask is not None:
+            return _masked(_noise2m, coords, (self._perm,), mask, out)
+        return _grid(_noise2a, coords, (self._perm,), out)
+
+    def noise2pyramid(
+        self, x: np.ndarray, y: np.ndarray, levels: int, octaves: int = 1, persistence: float = 0.5
+    ) -> list:
+        return _noise2pyramid(*_coords(x, y), levels, octaves, persistence, self._perm)
 
     def noise3(self, x: float, y: float, z: float) -> float:
         return _noise3(x, y, z, self._perm, self._perm_grad_index3)
 
-    def noise3array(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
-        return _noise3a(x, y, z, self._perm, self._perm_grad_index3)
+    def noise3array(
+        self, x: np.ndarray, y: np.ndarray, z: np.ndarray, kernel: str = "branching", mask=None, out: np.ndarray = None
+    ):
+        coords, tables = _coords(x, y, z), (self._perm, self._perm_grad_index3)
+        if _kernel(kernel, mask):
+            return _grid(_noise3a_lookup, coords, tables + _lookup_tables(3), out)
+        if mask is not None:
+            return _masked(_noise3m, coords, tables, mask, out)
+        return _grid(_noise3a, coords, tables, out)
+
+    def noise3_bounds(self, block_origin, block_size) -> tuple:
+        x0, y0, z0 = (float(c) for c in block_origin)
+        sx, sy, sz = np.broadcast_to(np.asarray(block_size, dtype=np.double), (3,))
+        low, high = _noise3_bounds(x0, y0, z0, x0 + sx, y0 + sy, z0 + sz, self._perm, self._perm_grad_index3)
+        return float(low), float(high)
+
+    def noise3array_culled(
+        self, x: np.ndarray, y: np.ndarray, z: np.ndarray, threshold: float, block_size: int = 16, depth: int = 2
+    ) -> tuple:
+        if block_size < 1 or depth < 0:
+            raise ValueError("Expected a positive block_size and a depth of 0 or more")
+        coords = _coords(x, y, z)
+        noise = np.empty(tuple(c.size for c in reversed(coords)), dtype=np.double)
+        classes = np.empty(tuple(-(-n // block_size) for n in noise.shape), dtype=np.int8)
+        if noise.size:
+            tables = (self._perm, self._perm_grad_index3)
+            _launch(_noise3_culled, 3, *coords, float(threshold), int(block_size), int(depth), *tables, noise, classes)
+        return noise, classes
+
+    def noise3_raymarch(
+        self,
+        origins,
+        directions,
+        step: float,
+        steps: int,
+        octaves: int = 1,
+        persistence: float = 0.5,
+        bias: float = 0.0,
+        absorption: float = 1.0,
+        output: str = "transmittance",
+        cutoff: float = 1e-4,
+    ) -> np.ndarray:
+        if output not in ("transmittance", "depth"):
+            raise ValueError("Unknown output '%s', expected 'transmittance' or 'depth'" % output)
+        if step <= 0 or steps < 0 or octaves < 1 or absorption <= 0:
+            raise ValueError("Expected a positive step, absorption and number of octaves, and 0 or more steps")
+        origins, directions = np.broadcast_arrays(
+            np.asarray(origins, dtype=np.double), np.asarray(directions, dtype=np.double)
+        )
+        if origins.shape[-1:] != (3,):
+            raise ValueError("Expected origins and directions of shape (..., 3), got %s" % (origins.shape,))
+        depth = np.empty(origins.shape[:-1], dtype=np.double)
+        limit = -np.log(cutoff) / absorption if output == "transmittance" and cutoff > 0 else np.inf
+        _noise3_march(
+            np.ascontiguousarray(origins.reshape(-1, 3)),
+            np.ascontiguousarray(directions.reshape(-1, 3)),
+            float(step),
+            int(steps),
+            int(octaves),
+            float(persistence),
+            float(bias),
+            float(limit),
+            depth.reshape(-1),
+            self._perm,
+            self._perm_grad_index3,
+        )
+        return depth if output == "depth" else np.exp(-absorption * depth)
 
     def noise4(self, x: float, y: float, z: float, w: float) -> float:
         return _noise4(x, y, z, w, self._perm)
 
-    def noise4array(self, x: np.ndarray, y: np.ndarray, z: np.ndarray, w: np.ndarray) -> np.ndarray:
-        return _noise4a(x, y, z, w, self._perm)
+    def noise4array(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray,
+        w: np.ndarray,
+        kernel: str = "branching",
+        mask=None,
+        out: np.ndarray = None,
+    ):
+        coords = _coords(x, y, z, w)
+        if _kernel(kernel, mask):
+            return _grid(_noise4a_lookup, coords, (self._perm,) + _lookup_tables(4), out)
+        if mask is not None:
+            return _masked(_noise4m, coords, (self._perm,), mask, out)
+        return _grid(_noise4a, coords, (self._perm,), out)
+
+    def noise2array_threshold(self, x: np.ndarray, y: np.ndarray, thresholds, packed: bool = False) -> np.ndarray:
+        return _threshold(_noise2t, _coords(x, y), (self._perm,), thresholds, packed)
+
+    def noise3array_threshold(
+        self, x: np.ndarray, y: np.ndarray, z: np.ndarray, thresholds, packed: bool = False
+    ) -> np.ndarray:
+        tables = (self._perm, self._perm_grad_index3)
+        return _threshold(_noise3t, _coords(x, y, z), tables, thresholds, packed)
+
+    def noise4array_threshold(
+        self, x: np.ndarray, y: np.ndarray, z: np.ndarray, w: np.ndarray, thresholds, packed: bool = False
+    ) -> np.ndarray:
+        return _threshold(_noise4t, _coords(x, y, z, w), (self._perm,), thresholds, packed)
+
+    def noise2array_chunked(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        progress=None,
+        cancel=None,
+        deadline: float = None,
+        chunk_size: int = 2**18,
+        out: np.ndarray = None,
+    ) -> np.ndarray:
+        return _chunked(_noise2a, _coords(x, y), (self._perm,), progress, cancel, deadline, chunk_size, out)
+
+    def noise3array_chunked(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray,
+        progress=None,
+        cancel=None,
+        deadline: float = None,
+        chunk_size: int = 2**18,
+        out: np.ndarray = None,
+    ) -> np.ndarray:
+        tables = (self._perm, self._perm_grad_index3)
+        return _chunked(_noise3a, _coords(x, y, z), tables, progress, cancel, deadline, chunk_size, out)
+
+    def noise4array_chunked(
+        self,
+        x: np.ndarray,
+        y: np.ndarray,
+        z: np.ndarray,
+        w: np.ndarray,
+        progress=None,
+        cancel=None,
+        deadline: float = None,
+        chunk_size: int = 2**18,
+        out: np.ndarray = None,
+    ) -> np.ndarray:
+        return _chunked(_noise4a, _coords(x, y, z, w), (self._perm,), progress, cancel, deadline, chunk_size, out)
+
+    def noise_stats(self, dims: int, domain: list, resolution) -> dict:
+        return _grid_stats(dims, domain, resolution, self._perm, self._perm_grad_index3)
+
+    def noise_histogram(self, dims: int, domain: list, resolution, bins: int = 20, range: tuple = (-1.0, 1.0)) -> tuple:
+        return _grid_histogram(dims, domain, resolution, bins, range, self._perm, self._perm_grad_index3)
+
+    def vector2array(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return _vector(2, _coords(x, y), self._components(2, 2))
+
+    def vector3array(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+        return _vector(3, _coords(x, y, z), self._components(3, 3))
+
+    def curl2array(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return _vector(2, _coords(x, y), self._components(2, 1), curl=True)
+
+    def curl3array(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+        return _vector(3, _coords(x, y, z), self._components(3, 3), curl=True)
+
+    def _components(self, dims, count):
+        # The stacked tables for the components of vector and curl noise, the noise of this seed and the seeds
+        # following it.
+        if self._component_tables is None:
+            tables = [(self._perm, self._perm_grad_index3)] + [_init(self._seed + c) for c in (1, 2)]
+            self._component_tables = tuple(np.stack(table) for table in zip(*tables))
+        perms, grad_indices = self._component_tables
+        return (perms[:count], grad_indices[:count]) if dims == 3 else (perms[:count],)
+
+    def lazy_array(self, dims: int, shape, origin=0.0, step=1.0) -> NoiseArray:
+        return NoiseArray(self, dims, shape, origin, step)
+
+    def scrolling_window(self, dims: int, shape, origin=0.0, step=1.0):
+        if dims not in (2, 3):
+            raise ValueError("Expected 2 or 3 dimensions, got %s" % dims)
+        return (ScrollingNoise2D if dims == 2 else ScrollingNoise3D)(self, shape, origin, step)
+
+    def adaptive_sample(self, dims: int, domain: list, resolution, tolerance: float = 0.01, max_depth: int = 6) -> dict:
+        return _adaptive(dims, domain, resolution, tolerance, max_depth, self._perm, self._perm_grad_index3)
+
+    def bake(
+        self,
+        dims: int,
+        domain: list,
+        resolution,
+        interpolation: str = "cubic",
+        octaves: int = 1,
+        persistence: float = 0.5,
+        path: str = None,
+    ) -> BakedNoise:
+        return BakedNoise(self, dims, domain, resolution, interpolation, octaves, persistence, path)
+
+    def profile_noise2(self, x: np.ndarray, y: np.ndarray) -> dict:
+        return _profile(2, (x, y), (self._perm,))
+
+    def profile_noise3(self, x: np.ndarray, y: np.ndarray, z: np.ndarray) -> dict:
+        return _profile(3, (x, y, z), (self._perm, self._perm_grad_index3))
+
+    def profile_noise4(self, x: np.ndarray, y: np.ndarray, z: np.ndarray, w: np.ndarray) -> dict:
+        return _profile(4, (x, y, z, w), (self._perm,))
+
+
+def _kernel(kernel, mask=None):
+    # Returns True if the lookup table kernels should be used.
+    if kernel not in ("branching", "lookup"):
+        raise ValueError("Unknown kernel '%s', expected 'branching' or 'lookup'" % kernel)
+    if kernel == "lookup" and mask is not None:
+        raise ValueError("The lookup kernels don't support masks")
+    return kernel == "lookup"
+
+
+def _grid(kernel, coords, tables, out):
+    # Runs a grid kernel straight into out when it's a writeable C-contiguous float64 or float32 array of the shape of
+    # the grid, else into a new float64 array (copied into out, if given).
+    shape = tuple(c.size for c in reversed(coords))
+    direct = isinstance(out, np.ndarray) and out.shape == shape and out.dtype in (np.double, np.single)
+    if not (direct and out.flags.c_contiguous and out.flags.writeable and out.flags.aligned):
+        return _into(_launch(kernel, len(coords), *coords, *tables, np.empty(shape, dtype=np.double)), out)
+    if out.dtype == np.single:
+        kernel = _single(kernel)
+    return _launch(kernel, len(coords), *coords, *tables, out)
+
+
+def _into(noise, out):
+    if out is None:
+        return noise
+    if not isinstance(out, np.ndarray) or out.shape != noise.shape:
+        raise ValueError("Expected out to be an array of shape %s" % (noise.shape,))
+    np.copyto(out, noise, casting="same_kind")
+    return out
+
+
+def _chunked(kernel, coords, tables, progress, cancel, deadline, chunk_size, out):
+    # Runs the grid kernel itself on each chunk, rather than the noiseNarray() methods, which may be instrumented
+    # by enable_stats() and would then record every chunk on top of the chunked call.
+    def generate(*chunk):
+        return _grid(kernel, chunk, tables, None)
+
+    shape = tuple(c.size for c in reversed(coords))
+    if out is None:
+        out = np.empty(shape, dtype=np.double)
+    elif not isinstance(out, np.ndarray) or out.shape != shape:
+        raise ValueError("Expected out to be an array of shape %s" % (shape,))
+    if out.size == 0:
+        return out
+    done = 0
+    for selection, chunk in _chunks(generate, coords, chunk_size, cancel, deadline):
+        out[selection] = chunk
+        done += chunk.size
+        if progress is not None:
+            progress(done, out.size)
+    return out
+
+
+def _chunks(generate, coords, chunk_size, cancel=None, deadline=None):
+    # Yields the selection (a tuple of slices of the grid) and the noise of each chunk of at most chunk_size samples,
+    # in C order. The outermost axis whose slices fit in a chunk is split into chunks, the axes before it are iterated
+    # over one index at a time. Used by the chunked functions and the command line generator.
+    shape = tuple(c.size for c in reversed(coords))
+    dims, size = len(shape), max(int(chunk_size), 1)
+    axis = next(a for a in range(dims) if int(np.prod(shape[a + 1 :])) <= size)
+    count = max(size // int(np.prod(shape[axis + 1 :])), 1)
+    total, done = int(np.prod(shape)), 0
+    for outer in itertools.product(*(range(n) for n in shape[:axis])):
+        for start in range(0, shape[axis], count):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled("Cancelled after %d of %d samples" % (done, total))
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("Deadline exceeded after %d of %d samples" % (done, total))
+            selection = tuple(slice(i, i + 1) for i in outer) + (slice(start, start + count),)
+            selection += (slice(None),) * (dims - len(selection))
+            chunk = generate(*(coords[d][selection[dims - 1 - d]] for d in range(dims)))
+            done += chunk.size
+            yield selection, chunk
+
+
+def _masked(kernel, coords, tables, mask, out):
+    # Evaluates only the selected cells of the grid, returned as (values, indices) or written into out.
+    shape = tuple(c.size for c in reversed(coords))
+    indices = _mask(mask, shape)
+    values = _launch(kernel, len(coords), *coords, indices, *tables)
+    if out is None:
+        return values, indices
+    if not isinstance(out, np.ndarray) or out.shape != shape:
+        raise ValueError("Expected out to be an array of shape %s" % (shape,))
+    out.flat[indices] = values
+    return out
+
+
+################################################################################
+# Pickling and shared memory support for OpenSimplex instances.
+
+
+def _from_tables(seed, perm, perm_grad_index3, segment=None):
+    simplex = object.__new__(OpenSimplex)
+    simplex._seed = seed
+    simplex._perm = perm
+    simplex._perm_grad_index3 = perm_grad_index3
+    simplex._segment = segment
+    simplex._component_tables = None
+    return simplex
+
+
+def _unpickle(seed, perm):
+    perm = np.frombuffer(perm, dtype=np.uint8).copy()
+    return _from_tables(seed, perm, _grad_index3(perm))
+
+
+def _unpickle_shared(seed, name):
+    return _from_tables(seed, *_shared_tables(seed, name))
+
+
+def _unlink(segment, pid):
+    from multiprocessing import resource_tracker
+
+    if os.getpid() == pid:
+        if os.name == "posix":
+            resource_tracker.register(segment._name, "shared_memory")  # unlink() unregisters it again
+        segment.unlink()
+
+
+# The segment layout: the permutation table, the 3D gradient index table and a flag set once both are filled in.
+_SEGMENT_SIZE = 2 * 256 + 1
+_segments = {}
+
+
+def _fill_segment(segment, seed):
+    perm, perm_grad_index3 = _init(seed)
+    segment.buf[:256] = perm.tobytes()
+    segment.buf[256:512] = perm_grad_index3.tobytes()
+    segment.buf[_SEGMENT_SIZE - 1] = 1
+
+
+def _shared_tables(seed, name=None):
+    # There's one segment per seed, which is created by the first process asking for it and attached to by all the
+    # others. Each process maps it only once. A segment whose creator has exited is gone, so unpickling an instance
+    # after that creates the segment again (owned by the unpickling process).
+    from multiprocessing import resource_tracker, shared_memory
+
+    if name is None:
+        name = "opensimplex_%016x" % (seed & 0xFFFFFFFFFFFFFFFF)
+    segment = _segments.get(name)
+    if segment is None:
+        try:
+            segment = shared_memory.SharedMemory(name, create=True, size=_SEGMENT_SIZE)
+        except FileExistsError:
+            segment = shared_memory.SharedMemory(name)
+            if not segment.buf[_SEGMENT_SIZE - 1]:
+                # Not filled in yet, or never will be if the creator was killed in between. The tables only depend on
+                # the seed, so they are filled in again rather than waited for: both processes write the same bytes.
+                _fill_segment(segment, seed)
+        else:
+            _fill_segment(segment, seed)
+            atexit.register(_unlink, segment, os.getpid())
+        if os.name == "posix":
+            # The resource tracker would unlink the segment as soon as any process attached to it exits, the creating
+            # process unlinks it at exit instead.
+            resource_tracker.unregister(segment._name, "shared_memory")
+        _segments[name] = segment
+    perm = np.ndarray(256, dtype=np.uint8, buffer=segment.buf)
+    perm_grad_index3 = np.ndarray(256, dtype=np.uint8, buffer=segment.buf, offset=256)
+    return perm, perm_grad_index3, segment
 
 
 _default = OpenSimplex(DEFAULT_SEED)
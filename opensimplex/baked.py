@@ -0,0 +1,230 @@
+# Noise baked into a regular grid of samples, answering point queries by interpolating between the samples instead
+# of evaluating the noise. Meant for low-frequency layers queried many times over a bounded region, where a grid of a
+# few samples per unit of the noise resolves the field well and a lookup is cheaper than the noise itself.
+
+from .constants import np
+from .internals import njit, prange, _points
+
+# Number of samples generated at a time when baking, bounding the memory taken on top of the samples.
+_BAKE_CHUNK = 2**22
+
+
+@njit(cache=True)
+def _axis(coordinate, low, scale, n, taps):
+    # Returns the index of the first sample to interpolate along an axis of n samples, and the weights of the samples,
+    # either linear over the 2 samples around the coordinate or a Catmull-Rom spline over 4.
+    u = min(max((coordinate - low) * scale, 0.0), n - 1.0)
+    i = min(int(u), n - 2)
+    t = u - i
+    if taps == 2:
+        return i, (1.0 - t, t, 0.0, 0.0)
+    w0 = ((-t + 2.0) * t - 1.0) * t / 2.0
+    w1 = ((3.0 * t - 5.0) * t * t + 2.0) / 2.0
+    w2 = ((-3.0 * t + 4.0) * t + 1.0) * t / 2.0
+    w3 = (t - 1.0) * t * t / 2.0
+    # Past the borders, the samples are extrapolated linearly from the last two
+    if i == 0:
+        w0, w1, w2 = 0.0, w1 + 2.0 * w0, w2 - w0
+    if i == n - 2:
+        w1, w2, w3 = w1 - w3, w2 + 2.0 * w3, 0.0
+    return i - 1, (w0, w1, w2, w3)
+
+
+def _interpolator(dims, taps):
+    # Compiles the kernels interpolating a point and arrays of points, with the number of taps along each axis fixed
+    # at compile time so the loops over the samples are unrolled.
+    if dims == 2:
+
+        @njit()
+        def point(samples, lows, scales, x, y):
+            ny, nx = samples.shape
+            i, wx = _axis(x, lows[0], scales[0], nx, taps)
+            j, wy = _axis(y, lows[1], scales[1], ny, taps)
+            value = 0.0
+            for b in range(taps):
+                row = min(max(j + b, 0), ny - 1)
+                for a in range(taps):
+                    value += wy[b] * wx[a] * samples[row, min(max(i + a, 0), nx - 1)]
+            return value
+
+        @njit(parallel=True)
+        def points(samples, lows, scales, x, y, out):
+            for i in prange(out.size):
+                out[i] = point(samples, lows, scales, x[i], y[i])
+
+    elif dims == 3:
+
+        @njit()
+        def point(samples, lows, scales, x, y, z):
+            nz, ny, nx = samples.shape
+            i, wx = _axis(x, lows[0], scales[0], nx, taps)
+            j, wy = _axis(y, lows[1], scales[1], ny, taps)
+            k, wz = _axis(z, lows[2], scales[2], nz, taps)
+            value = 0.0
+            for c in range(taps):
+                plane = min(max(k + c, 0), nz - 1)
+                for b in range(taps):
+                    row = min(max(j + b, 0), ny - 1)
+                    weight = wz[c] * wy[b]
+                    for a in range(taps):
+                        value += weight * wx[a] * samples[plane, row, min(max(i + a, 0), nx - 1)]
+            return value
+
+        @njit(parallel=True)
+        def points(samples, lows, scales, x, y, z, out):
+            for i in prange(out.size):
+                out[i] = point(samples, lows, scales, x[i], y[i], z[i])
+
+    else:
+
+        @njit()
+        def point(samples, lows, scales, x, y, z, w):
+            nw, nz, ny, nx = samples.shape
+            i, wx = _axis(x, lows[0], scales[0], nx, taps)
+            j, wy = _axis(y, lows[1], scales[1], ny, taps)
+            k, wz = _axis(z, lows[2], scales[2], nz, taps)
+            l, ww = _axis(w, lows[3], scales[3], nw, taps)
+            value = 0.0
+            for e in range(taps):
+                volume = min(max(l + e, 0), nw - 1)
+                for c in range(taps):
+                    plane = min(max(k + c, 0), nz - 1)
+                    for b in range(taps):
+                        row = min(max(j + b, 0), ny - 1)
+                        weight = ww[e] * wz[c] * wy[b]
+                        for a in range(taps):
+                            value += weight * wx[a] * samples[volume, plane, row, min(max(i + a, 0), nx - 1)]
+            return value
+
+        @njit(parallel=True)
+        def points(samples, lows, scales, x, y, z, w, out):
+            for i in prange(out.size):
+                out[i] = point(samples, lows, scales, x[i], y[i], z[i], w[i])
+
+    return point, points
+
+
+_interpolators = {}
+
+
+class BakedNoise(object):
+    """
+    Noise sampled on a regular grid spanning the domain (borders included), interpolated at the queried points.
+    The samples are held in memory, or in a memory-mapped .npy file when a path is given. Points outside of the
+    domain are clamped to its border.
+    """
+
+    __slots__ = (
+        "_simplex",
+        "_samples",
+        "_array",
+        "_domain",
+        "_lows",
+        "_scales",
+        "_octaves",
+        "_persistence",
+        "_kernels",
+    )
+
+    def __init__(
+        self,
+        simplex,
+        dims: int,
+        domain,
+        resolution,
+        interpolation: str = "cubic",
+        octaves: int = 1,
+        persistence: float = 0.5,
+        path=None,
+        dtype=np.double,
+    ) -> None:
+        if dims not in (2, 3, 4):
+            raise ValueError("Expected 2, 3 or 4 dimensions, got %s" % dims)
+        if len(domain) != dims:
+            raise ValueError("Expected %d (low, high) pairs in domain, got %d" % (dims, len(domain)))
+        if interpolation not in ("linear", "cubic"):
+            raise ValueError("Unknown interpolation '%s', expected 'linear' or 'cubic'" % interpolation)
+        counts = np.broadcast_to(np.asarray(resolution, dtype=np.int64), (dims,))
+        if np.any(counts < 2):
+            raise ValueError("Expected at least 2 samples along each dimension, got %s" % (resolution,))
+        self._simplex = simplex
+        self._domain = tuple((float(low), float(high)) for low, high in domain)
+        if any(low == high for low, high in self._domain):
+            raise ValueError("Expected a domain of non-empty (low, high) ranges, got %s" % (self._domain,))
+        self._lows = np.array([low for low, high in self._domain])
+        self._scales = (counts - 1) / np.array([high - low for low, high in self._domain])
+        self._octaves, self._persistence = int(octaves), float(persistence)
+        key = (dims, 2 if interpolation == "linear" else 4)
+        if key not in _interpolators:
+            _interpolators[key] = _interpolator(*key)
+        self._kernels = _interpolators[key]
+        shape = tuple(counts[::-1].tolist())  # In array order, the x axis last
+        if path is None:
+            self._samples = np.empty(shape, dtype=dtype)
+        else:
+            self._samples = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape)
+        self._bake()
+        self._array = np.asarray(self._samples)
+
+    def _bake(self):
+        # Generates the samples in slabs along the first axis.
+        dims, samples = len(self._domain), self._samples
+        grid = [np.linspace(low, high, n) for (low, high), n in zip(self._domain, reversed(samples.shape))]
+        count = max(_BAKE_CHUNK // (samples.size // samples.shape[0]), 1)
+        for start in range(0, samples.shape[0], count):
+            coords = grid[:-1] + [grid[-1][start : start + count]]
+            samples[start : start + count] = self._noise(getattr(self._simplex, "noise%darray" % dims), coords)
+        if isinstance(samples, np.memmap):
+            samples.flush()
+
+    def _noise(self, generate, coords):
+        # The noise summed over the octaves, normalized to the range of a single octave.
+        noise = generate(*coords)
+        for k in range(1, self._octaves):
+            noise += generate(*(c * 2**k for c in coords)) * self._persistence**k
+        if self._octaves > 1:
+            noise /= sum(self._persistence**k for k in range(self._octaves))
+        return noise
+
+    @property
+    def samples(self) -> np.ndarray:
+        return self._samples
+
+    @property
+    def domain(self) -> tuple:
+        return self._domain
+
+    def __repr__(self) -> str:
+        return "BakedNoise(shape=%s, domain=%s)" % (self._samples.shape, self._domain)
+
+    def __call__(self, *point) -> float:
+        if len(point) != len(self._domain):
+            raise TypeError("Expected %d coordinates, got %d" % (len(self._domain), len(point)))
+        return self._kernels[0](self._array, self._lows, self._scales, *point)
+
+    def sample(self, *coords) -> np.ndarray:
+        """
+        Interpolates the noise at the points given by the broadcasted coordinates (in x, y, z, w order).
+        :return: array of the broadcasted shape of the coordinates
+        """
+        if len(coords) != len(self._domain):
+            raise TypeError("Expected %d coordinate arrays, got %d" % (len(self._domain), len(coords)))
+        coords = np.broadcast_arrays(*(np.asarray(c, dtype=np.double) for c in coords))
+        out = np.empty(coords[0].shape, dtype=np.double)
+        self._kernels[1](self._array, self._lows, self._scales, *(c.ravel() for c in coords), out.reshape(-1))
+        return out
+
+    def error(self, points: int = 100000, seed: int = 0) -> dict:
+        """
+        Measures the approximation error against direct evaluation of the noise, at uniformly distributed random
+        points of the domain.
+        :param points: number of random points
+        :param seed:   seed of the random points
+        :return:       dict with the "max", "mean" and "rms" absolute error over the points
+        """
+        rng = np.random.default_rng(seed)
+        coords = [rng.uniform(low, high, points) for low, high in self._domain]
+        tables = (self._simplex._perm, self._simplex._perm_grad_index3)
+        exact = self._noise(lambda *coords: _points(coords, *tables), coords)
+        errors = np.abs(self.sample(*coords) - exact)
+        return {"max": float(errors.max()), "mean": float(errors.mean()), "rms": float(np.sqrt(np.mean(errors**2)))}
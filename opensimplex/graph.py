@@ -0,0 +1,377 @@
+"""
+Noise graphs: expressions of noise layers (sources of a seed and frequency, arithmetic, domain warping, clamping and
+curves) compiled into a single kernel, evaluating the whole expression at each point in one pass instead of
+generating each layer into an array of its own and combining the arrays with numpy.
+
+>>> from opensimplex import graph
+>>> mask = graph.clamp(graph.noise(seed=3, frequency=0.5) * 2.0 + 0.5, 0.0, 1.0)
+>>> terrain = graph.fbm(seed=1, octaves=5) + graph.ridged(seed=2, frequency=2.0, octaves=3) * mask
+>>> terrain = graph.warp(terrain, graph.noise(seed=4) * 0.3, graph.noise(seed=5) * 0.3)
+>>> heightmap = terrain.compile(2)(numpy.linspace(0, 8, 1024), numpy.linspace(0, 8, 1024))
+>>> heightmap.shape
+(1024, 1024)
+
+The kernels of the 64 most recently compiled structures of graphs are cached: the seeds, frequencies and constants
+are passed to the kernel as arguments, so graphs differing only by those share the same compiled kernel. Compiling a
+new structure takes a few seconds with numba, so graphs are best built once and evaluated many times.
+"""
+
+import builtins
+import functools
+import operator
+
+from . import internals
+from .api import DEFAULT_SEED
+from .constants import np
+from .internals import _coords, _init, njit
+
+
+class Node(object):
+    """
+    Node of a noise graph, combined with others by the arithmetic operators (+, -, *, / with nodes or numbers, unary
+    - and abs()) and the functions of this module.
+    """
+
+    __slots__ = ("_op", "_children", "_values", "_seed")
+
+    def __init__(self, op, children=(), values=(), seed=None):
+        self._op = op
+        self._children = tuple(_node(child) for child in children)
+        self._values = tuple(float(value) for value in values)
+        self._seed = seed
+
+    def __repr__(self) -> str:
+        arguments = [repr(child) for child in self._children] + [repr(value) for value in self._values]
+        if self._seed is not None:
+            arguments.append("seed=%d" % self._seed)
+        return "%s(%s)" % (self._op, ", ".join(arguments))
+
+    def __add__(self, other):
+        return Node("add", (self, other))
+
+    def __radd__(self, other):
+        return Node("add", (other, self))
+
+    def __sub__(self, other):
+        return Node("sub", (self, other))
+
+    def __rsub__(self, other):
+        return Node("sub", (other, self))
+
+    def __mul__(self, other):
+        return Node("mul", (self, other))
+
+    def __rmul__(self, other):
+        return Node("mul", (other, self))
+
+    def __truediv__(self, other):
+        return Node("div", (self, other))
+
+    def __rtruediv__(self, other):
+        return Node("div", (other, self))
+
+    def __neg__(self):
+        return Node("neg", (self,))
+
+    def __abs__(self):
+        return Node("abs", (self,))
+
+    def compile(self, dims: int) -> "Kernel":
+        """
+        Compiles the graph into a kernel evaluating it over dims-dimensional coordinates, with the sources being
+        dims-dimensional noise.
+        :param dims: number of dimensions (2, 3 or 4)
+        :return:     Kernel, evaluating the graph on a grid when called, or at points with sample()
+        """
+        return Kernel(self, dims)
+
+
+def _node(value):
+    if isinstance(value, Node):
+        return value
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return Node("const", values=(value,))
+    raise TypeError("Expected a noise graph node or a number, got %s" % type(value).__name__)
+
+
+def noise(seed: int = DEFAULT_SEED, frequency: float = 1.0) -> Node:
+    """
+    Source node, the noise of the seed at the coordinates scaled by the frequency.
+    """
+    return Node("noise", values=(frequency,), seed=operator.index(seed))
+
+
+def fbm(
+    seed: int = DEFAULT_SEED,
+    frequency: float = 1.0,
+    octaves: int = 4,
+    persistence: float = 0.5,
+    lacunarity: float = 2.0,
+) -> Node:
+    """
+    Fractal sum of octaves of the noise of the seed, each with lacunarity times the frequency and persistence times
+    the amplitude of the last, normalized to the range of a single octave.
+    """
+    _octaves(octaves)
+    layers = [noise(seed, frequency * lacunarity**k) * persistence**k for k in range(octaves)]
+    return sum(layers[1:], layers[0]) / sum(persistence**k for k in range(octaves))
+
+
+def ridged(
+    seed: int = DEFAULT_SEED,
+    frequency: float = 1.0,
+    octaves: int = 4,
+    persistence: float = 0.5,
+    lacunarity: float = 2.0,
+) -> Node:
+    """
+    Ridged fractal sum, as fbm() but of the octaves folded into ridges, (1 - |noise|)**2, between 0 and 1.
+    """
+    _octaves(octaves)
+    layers = []
+    for k in range(octaves):
+        ridge = 1.0 - abs(noise(seed, frequency * lacunarity**k))
+        layers.append(ridge * ridge * persistence**k)
+    return sum(layers[1:], layers[0]) / sum(persistence**k for k in range(octaves))
+
+
+def _octaves(octaves):
+    if operator.index(octaves) < 1:
+        raise ValueError("Expected a positive number of octaves, got %d" % octaves)
+
+
+def warp(node: Node, *offsets) -> Node:
+    """
+    Domain warping, evaluating the node at the coordinates moved by the offsets (nodes or numbers, one for each
+    dimension in x, y, z, w order, evaluated at the original coordinates).
+    """
+    return Node("warp", (node,) + offsets)
+
+
+def clamp(node: Node, low: float, high: float) -> Node:
+    """
+    Clamps the node between the low and high constants.
+    """
+    return Node("clamp", (node,), (low, high))
+
+
+def curve(node: Node, xs, ys) -> Node:
+    """
+    Remaps the node through the piecewise linear curve going through the points (xs, ys), as numpy.interp(): below
+    xs[0] (and above xs[-1]) the curve is flat.
+    """
+    xs, ys = np.asarray(xs, dtype=np.double).ravel(), np.asarray(ys, dtype=np.double).ravel()
+    if xs.size < 1 or xs.size != ys.size or np.any(np.diff(xs) < 0):
+        raise ValueError("Expected as many xs as ys, the xs being in increasing order")
+    return Node("curve", (node,), np.concatenate([xs, ys]))
+
+
+def remap(node: Node, low: float, high: float, new_low: float, new_high: float) -> Node:
+    """
+    Maps the range [low, high] of the node linearly onto [new_low, new_high] (without clamping).
+    """
+    return (node - low) * ((new_high - new_low) / (high - low)) + new_low
+
+
+def minimum(a, b) -> Node:
+    return Node("min", (a, b))
+
+
+def maximum(a, b) -> Node:
+    return Node("max", (a, b))
+
+
+def lerp(a, b, t) -> Node:
+    """
+    Linear interpolation between a and b by t (nodes or numbers), a + (b - a) * t.
+    """
+    return Node("lerp", (a, b, t))
+
+
+################################################################################
+# Code generation. A graph is compiled into the source of a point function, taking the coordinates, the tables of its
+# seeds and the values of its parameters, with one statement per node. A node used more than once (with the same
+# coordinates) is only evaluated once. The source only depends on the structure of the graph, and is used as the key
+# of the kernel cache.
+
+_AXES = "xyzw"
+_INDICES = "ijkl"
+_OPERATORS = {"add": "+", "sub": "-", "mul": "*", "div": "/"}
+
+
+class _Generator(object):
+    def __init__(self, dims):
+        self.dims = dims
+        self.lines = []
+        self.values = []
+        self.seeds = []
+        self._names = {}
+        self._count = 0
+
+    def _new(self, expression):
+        name = "v%d" % self._count
+        self._count += 1
+        self.lines.append("    %s = %s" % (name, expression))
+        return name
+
+    def _value(self, value):
+        self.values.append(value)
+        return "params[%d]" % (len(self.values) - 1)
+
+    def _tables(self, seed):
+        if seed not in self.seeds:
+            self.seeds.append(seed)
+        i = self.seeds.index(seed)
+        return "p%d, g%d" % (i, i) if self.dims == 3 else "p%d" % i
+
+    def tables(self):
+        # Names of the tables of the seeds (the 3D noise takes the gradient index tables too), and the statements
+        # taking them out of the stacked tables passed to the drivers.
+        names, lines = [], []
+        for i in range(len(self.seeds)):
+            names.append("p%d" % i)
+            lines.append("    p%d = perms[%d]" % (i, i))
+            if self.dims == 3:
+                names.append("g%d" % i)
+                lines.append("    g%d = grads[%d]" % (i, i))
+        return names, lines
+
+    def emit(self, node, coords):
+        key = (id(node), coords)
+        if key not in self._names:
+            self._names[key] = self._emit(node, coords)
+        return self._names[key]
+
+    def _emit(self, node, coords):
+        op, children = node._op, node._children
+        if op == "const":
+            return self._value(node._values[0])
+        if op == "noise":
+            frequency = self._value(node._values[0])
+            scaled = ", ".join("%s * %s" % (c, frequency) for c in coords)
+            return self._new("_noise%d(%s, %s)" % (self.dims, scaled, self._tables(node._seed)))
+        if op == "warp":
+            if len(children) != self.dims + 1:
+                raise ValueError("Expected %d warp offsets, got %d" % (self.dims, len(children) - 1))
+            offsets = [self.emit(child, coords) for child in children[1:]]
+            warped = tuple(self._new("%s + %s" % (c, offset)) for c, offset in zip(coords, offsets))
+            return self.emit(children[0], warped)
+        args = [self.emit(child, coords) for child in children]
+        if op in _OPERATORS:
+            return self._new("%s %s %s" % (args[0], _OPERATORS[op], args[1]))
+        if op == "neg":
+            return self._new("-%s" % args[0])
+        if op in ("abs", "min", "max"):
+            return self._new("%s(%s)" % (op, ", ".join(args)))
+        if op == "lerp":
+            return self._new("%s + (%s - %s) * %s" % (args[0], args[1], args[0], args[2]))
+        if op == "clamp":
+            low, high = (self._value(value) for value in node._values)
+            return self._new("min(max(%s, %s), %s)" % (args[0], low, high))
+        if op == "curve":
+            n = len(node._values) // 2
+            start = len(self.values)
+            self.values.extend(node._values)
+            return self._new("_curve(%s, params, %d, %d)" % (args[0], start, n))
+        raise ValueError("Unknown node '%s'" % op)
+
+
+@njit(cache=True)
+def _curve(value, params, start, n):
+    # The piecewise linear curve through the n points with their xs at params[start:] and ys at params[start + n:],
+    # computed as numpy.interp() does (which is slow for a single value in numba).
+    if not value > params[start]:
+        return params[start + n]
+    for i in range(start + 1, start + n):
+        if value < params[i]:
+            x0, x1, y0, y1 = params[i - 1], params[i], params[i - 1 + n], params[i + n]
+            return (y1 - y0) / (x1 - x0) * (value - x0) + y0
+    return params[start + 2 * n - 1]
+
+
+def _source(node, dims):
+    # The point function, and the drivers evaluating it on a grid (in the same order as noise2array() etc.) and at
+    # points. The drivers take the tables out of the stacked tables once, rather than for each point.
+    generator = _Generator(dims)
+    coords = _AXES[:dims]
+    result = generator.emit(node, tuple(coords))
+    names, unpack = generator.tables()
+    arguments = ", ".join(list(coords) + names + ["params"])
+    lines = ["def point(%s):" % arguments] + generator.lines + ["    return float(%s)" % result, ""]
+
+    lines += ["def grid(%s, out, perms, grads, params):" % ", ".join(coords)] + unpack
+    indent = "    "
+    for d in reversed(range(dims)):
+        loop = "prange" if d else "range"
+        lines.append("%sfor %s in %s(%s.size):" % (indent, _INDICES[d], loop, coords[d]))
+        indent += "    "
+    point = ", ".join(["%s[%s]" % (c, i) for c, i in zip(coords, _INDICES)] + names + ["params"])
+    lines += ["%sout[%s] = point(%s)" % (indent, ", ".join(reversed(_INDICES[:dims])), point), ""]
+
+    lines += ["def sample(%s, out, perms, grads, params):" % ", ".join(coords)] + unpack
+    point = ", ".join(["%s[n]" % c for c in coords] + names + ["params"])
+    lines += ["    for n in prange(out.size):", "        out[n] = point(%s)" % point, ""]
+    return "\n".join(lines), generator.values, generator.seeds
+
+
+@functools.lru_cache(maxsize=64)
+def _build(source):
+    # The kernels see the globals of internals.py (the noise functions, njit, prange and numpy) and _curve().
+    scope = dict(vars(internals), _curve=_curve)
+    exec(builtins.compile(source, "<noise graph>", "exec"), scope)
+    scope["point"] = njit()(scope["point"])
+    return njit(parallel=True)(scope["grid"]), njit(parallel=True)(scope["sample"])
+
+
+class Kernel(object):
+    """
+    Noise graph compiled into a single kernel, see Node.compile().
+    """
+
+    __slots__ = ("_dims", "_source", "_params", "_perms", "_grads", "_kernels")
+
+    def __init__(self, node: Node, dims: int) -> None:
+        if dims not in (2, 3, 4):
+            raise ValueError("Expected 2, 3 or 4 dimensions, got %s" % dims)
+        self._dims = dims
+        self._source, values, seeds = _source(_node(node), dims)
+        self._params = np.array(values, dtype=np.double)
+        tables = [_init(seed) for seed in seeds] or [_init(DEFAULT_SEED)]
+        self._perms = np.stack([perm for perm, _ in tables])
+        self._grads = np.stack([perm_grad_index3 for _, perm_grad_index3 in tables])
+        self._kernels = _build(self._source)
+
+    @property
+    def source(self) -> str:
+        """
+        Source code of the kernel, as generated from the graph.
+        """
+        return self._source
+
+    def __repr__(self) -> str:
+        return "Kernel(dims=%d, seeds=%d, params=%d)" % (self._dims, len(self._perms), self._params.size)
+
+    def __call__(self, *coords) -> np.ndarray:
+        """
+        Evaluates the graph on the grid of the coordinate arrays (in x, y, z, w order), as noise2array() etc.
+        :return: array of shape (..., y.size, x.size)
+        """
+        if len(coords) != self._dims:
+            raise TypeError("Expected %d coordinate arrays, got %d" % (self._dims, len(coords)))
+        coords = _coords(*coords)
+        out = np.empty(tuple(c.size for c in reversed(coords)), dtype=np.double)
+        self._kernels[0](*coords, out, self._perms, self._grads, self._params)
+        return out
+
+    def sample(self, *coords) -> np.ndarray:
+        """
+        Evaluates the graph at the points given by the broadcasted coordinates (in x, y, z, w order).
+        :return: array of the broadcasted shape of the coordinates
+        """
+        if len(coords) != self._dims:
+            raise TypeError("Expected %d coordinate arrays, got %d" % (self._dims, len(coords)))
+        coords = np.broadcast_arrays(*(np.asarray(c, dtype=np.double) for c in coords))
+        out = np.empty(coords[0].shape, dtype=np.double)
+        flat = [np.ascontiguousarray(c).reshape(-1) for c in coords]
+        self._kernels[1](*flat, out.reshape(-1), self._perms, self._grads, self._params)
+        return out
@@ -4,11 +4,13 @@
 from .constants import *
 from math import floor
 from ctypes import c_int64
+import threading
 
 try:
-    from numba import njit, prange
+    from numba import njit, prange, typeof, types
 except ImportError:
     prange = range
+    typeof = types = None
 
     def njit(*args, **kwargs):
         def wrapper(func):
@@ -27,8 +29,7 @@ def _overflow(x):
 
 def _init(seed):
     # Have to zero fill so we can properly loop over it later
-    perm = np.zeros(256, dtype=np.int64)
-    perm_grad_index3 = np.zeros(256, dtype=np.int64)
+    perm = np.zeros(256, dtype=np.uint8)
     source = np.arange(256)
     # Generates a proper permutation (i.e. doesn't merely perform N
     # successive pair swaps on a base array)
@@ -41,59 +42,719 @@ def _init(seed):
         if r < 0:
             r += i + 1
         perm[i] = source[r]
-        perm_grad_index3[i] = int((perm[i] % (len(GRADIENTS3) / 3)) * 3)
         source[r] = source[i]
-    return perm, perm_grad_index3
+    return perm, _grad_index3(perm)
+
+
+def _grad_index3(perm):
+    # The tables only hold bytes (uint8), the kernels cast the entries to int before using them in any arithmetic.
+    return (perm % (len(GRADIENTS3) // 3) * 3).astype(np.uint8)
 
 
 @njit(cache=True)
 def _extrapolate2(perm, xsb, ysb, dx, dy):
-    index = perm[(perm[xsb & 0xFF] + ysb) & 0xFF] & 0x0E
+    index = int(perm[(int(perm[xsb & 0xFF]) + ysb) & 0xFF]) & 0x0E
     g1, g2 = GRADIENTS2[index : index + 2]
     return g1 * dx + g2 * dy
 
 
 @njit(cache=True)
 def _extrapolate3(perm, perm_grad_index3, xsb, ysb, zsb, dx, dy, dz):
-    index = perm_grad_index3[(perm[(perm[xsb & 0xFF] + ysb) & 0xFF] + zsb) & 0xFF]
+    index = int(perm_grad_index3[(int(perm[(int(perm[xsb & 0xFF]) + ysb) & 0xFF]) + zsb) & 0xFF])
     g1, g2, g3 = GRADIENTS3[index : index + 3]
     return g1 * dx + g2 * dy + g3 * dz
 
 
 @njit(cache=True)
 def _extrapolate4(perm, xsb, ysb, zsb, wsb, dx, dy, dz, dw):
-    index = perm[(perm[(perm[(perm[xsb & 0xFF] + ysb) & 0xFF] + zsb) & 0xFF] + wsb) & 0xFF] & 0xFC
+    index = int(perm[(int(perm[xsb & 0xFF]) + ysb) & 0xFF])
+    index = int(perm[(int(perm[(index + zsb) & 0xFF]) + wsb) & 0xFF]) & 0xFC
     g1, g2, g3, g4 = GRADIENTS4[index : index + 4]
     return g1 * dx + g2 * dy + g3 * dz + g4 * dw
 
 
+def _coords(*coords):
+    # Returns the coordinates as 1D arrays of one of the dtypes the array kernels are compiled for. Strided views and
+    # buffer-protocol objects (memoryview, array.array, ...) of float32 or float64 are used as is. Everything else is
+    # copied: other dtypes, float32 mixed with float64, read-only or unaligned buffers, non-contiguous multidimensional
+    # arrays and Python sequences.
+    coords = [np.asarray(c) for c in coords]
+    dtype = np.float32 if all(c.dtype == np.float32 for c in coords) else np.double
+    coords = [np.asarray(c, dtype=dtype).reshape(-1) for c in coords]
+    return tuple(c if c.flags.writeable and c.flags.aligned else c.copy() for c in coords)
+
+
+# The array kernels are compiled on first use for coordinates of any layout ('A') of both dtypes, along with the types
+# of the other arguments of that first call (tables and outputs, which are always made the same way). Compiling is
+# then disabled, so contiguous coordinates are converted to the 'A' layout instead of getting a build of their own for
+# every combination of layouts.
+_launched = set()
+_launch_lock = threading.Lock()
+
+
+def _launch(kernel, dims, *args):
+    # Runs the kernel, given the coordinates as its first dims arguments.
+    if typeof is not None and kernel not in _launched:
+        with _launch_lock:
+            if kernel not in _launched:
+                others = tuple(typeof(arg) for arg in args[dims:])
+                for dtype in (types.float32, types.float64):
+                    kernel.compile((types.Array(dtype, 1, "A"),) * dims + others)
+                kernel.disable_compile()
+                _launched.add(kernel)
+    return kernel(*args)
+
+
+_singles = {}
+
+
+def _single(kernel):
+    # Returns a second build of a grid kernel, for filling in float32 noise arrays. It's a separate dispatcher, so the
+    # float32 specializations are only compiled (by _launch) when such an array is first given, and not by everyone.
+    if typeof is None:
+        return kernel
+    with _launch_lock:
+        if kernel not in _singles:
+            options = {k: v for k, v in kernel.targetoptions.items() if k != "nopython"}
+            _singles[kernel] = njit(cache=True, **options)(kernel.py_func)
+        return _singles[kernel]
+
+
+# The grid kernels below fill in the noise array they are given, of shape (y.size, x.size) in 2D, (z.size, y.size,
+# x.size) in 3D and so on.
+
+
 @njit(cache=True, parallel=True)
-def _noise2a(x, y, perm):
-    noise = np.empty((y.size, x.size), dtype=np.double)
+def _noise2a(x, y, perm, noise):
     for y_i in prange(y.size):
         for x_i in prange(x.size):
-            noise[y_i, x_i] = _noise2(x[x_i], y[y_i], perm)
+            noise[y_i, x_i] = _noise2(float(x[x_i]), float(y[y_i]), perm)
+    return noise
+
+
+@njit(cache=True, parallel=True)
+def _noise3a(x, y, z, perm, perm_grad_index3, noise):
+    for z_i in prange(z.size):
+        for y_i in prange(y.size):
+            for x_i in prange(x.size):
+                noise[z_i, y_i, x_i] = _noise3(float(x[x_i]), float(y[y_i]), float(z[z_i]), perm, perm_grad_index3)
+    return noise
+
+
+@njit(cache=True, parallel=True)
+def _noise4a(x, y, z, w, perm, noise):
+    for w_i in prange(w.size):
+        for z_i in prange(z.size):
+            for y_i in prange(y.size):
+                for x_i in prange(x.size):
+                    noise[w_i, z_i, y_i, x_i] = _noise4(
+                        float(x[x_i]), float(y[y_i]), float(z[z_i]), float(w[w_i]), perm
+                    )
+    return noise
+
+
+@njit(cache=True, parallel=True)
+def _noise2m(x, y, indices, perm):
+    # Evaluates only the grid cells at the given flat indices (see _mask()), in the order they are given.
+    noise = np.empty(indices.size, dtype=np.double)
+    for i in prange(indices.size):
+        y_i, x_i = divmod(indices[i], x.size)
+        noise[i] = _noise2(float(x[x_i]), float(y[y_i]), perm)
+    return noise
+
+
+@njit(cache=True, parallel=True)
+def _noise3m(x, y, z, indices, perm, perm_grad_index3):
+    noise = np.empty(indices.size, dtype=np.double)
+    for i in prange(indices.size):
+        z_i, rest = divmod(indices[i], y.size * x.size)
+        y_i, x_i = divmod(rest, x.size)
+        noise[i] = _noise3(float(x[x_i]), float(y[y_i]), float(z[z_i]), perm, perm_grad_index3)
+    return noise
+
+
+@njit(cache=True, parallel=True)
+def _noise4m(x, y, z, w, indices, perm):
+    noise = np.empty(indices.size, dtype=np.double)
+    for i in prange(indices.size):
+        w_i, rest = divmod(indices[i], z.size * y.size * x.size)
+        z_i, rest = divmod(rest, y.size * x.size)
+        y_i, x_i = divmod(rest, x.size)
+        noise[i] = _noise4(float(x[x_i]), float(y[y_i]), float(z[z_i]), float(w[w_i]), perm)
     return noise
 
 
+# The threshold kernels write the class of each cell of the grid instead of the noise, the number of thresholds
+# (sorted in increasing order) the noise is above. The output is a (rows, width) uint8 array, zeroed up front, with one
+# row for each combination of the outer coordinates. With packed, a single threshold is given and the classes are
+# packed 8 to a byte along the rows, most significant bit first (as numpy.packbits() does).
+
+
+@njit(cache=True)
+def _classify(value, thresholds, out, row, x_i, packed):
+    label = 0
+    for t in thresholds:
+        if value > t:
+            label += 1
+    if packed:
+        out[row, x_i >> 3] |= label << (7 - (x_i & 7))
+    else:
+        out[row, x_i] = label
+
+
+@njit(cache=True, parallel=True)
+def _noise2t(x, y, thresholds, packed, out, perm):
+    for y_i in prange(y.size):
+        for x_i in range(x.size):
+            _classify(_noise2(float(x[x_i]), float(y[y_i]), perm), thresholds, out, y_i, x_i, packed)
+
+
+@njit(cache=True, parallel=True)
+def _noise3t(x, y, z, thresholds, packed, out, perm, perm_grad_index3):
+    for z_i in prange(z.size):
+        for y_i in prange(y.size):
+            for x_i in range(x.size):
+                value = _noise3(float(x[x_i]), float(y[y_i]), float(z[z_i]), perm, perm_grad_index3)
+                _classify(value, thresholds, out, z_i * y.size + y_i, x_i, packed)
+
+
+@njit(cache=True, parallel=True)
+def _noise4t(x, y, z, w, thresholds, packed, out, perm):
+    for w_i in prange(w.size):
+        for z_i in prange(z.size):
+            for y_i in prange(y.size):
+                row = (w_i * z.size + z_i) * y.size + y_i
+                for x_i in range(x.size):
+                    value = _noise4(float(x[x_i]), float(y[y_i]), float(z[z_i]), float(w[w_i]), perm)
+                    _classify(value, thresholds, out, row, x_i, packed)
+
+
+def _threshold(kernel, coords, tables, thresholds, packed):
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=np.double))
+    if thresholds.ndim != 1 or thresholds.size < 1 or np.any(np.diff(thresholds) < 0):
+        raise ValueError("Expected a threshold or a non-empty sequence of thresholds in increasing order")
+    if thresholds.size > 255 or (packed and thresholds.size > 1):
+        raise ValueError("Expected at most 255 thresholds, and a single one with packed")
+    shape = tuple(c.size for c in reversed(coords))
+    width = (shape[-1] + 7) // 8 if packed else shape[-1]
+    out = np.zeros((int(np.prod(shape[:-1])), width), dtype=np.uint8)
+    _launch(kernel, len(coords), *coords, np.ascontiguousarray(thresholds), bool(packed), out, *tables)
+    return out.reshape(shape[:-1] + (width,))
+
+
+def _mask(mask, shape):
+    # Returns the selected cells of a grid as flat (C order) indices, given either a boolean array of the grid's shape,
+    # a tuple of index arrays (one for each axis, as returned by numpy.nonzero()) or a sequence of flat indices.
+    if isinstance(mask, tuple):
+        return np.ascontiguousarray(np.ravel_multi_index(mask, shape), dtype=np.int64).reshape(-1)
+    mask = np.asarray(mask)
+    if mask.dtype == np.bool_:
+        if mask.shape != shape:
+            raise ValueError("Expected a boolean mask of shape %s, got %s" % (shape, mask.shape))
+        return np.flatnonzero(mask).astype(np.int64, copy=False)
+    size = int(np.prod(shape))
+    indices = np.ascontiguousarray(mask, dtype=np.int64).reshape(-1)
+    if indices.size and (indices.min() < -size or indices.max() >= size):
+        raise IndexError("Mask index out of bounds for a grid of shape %s" % (shape,))
+    return np.where(indices < 0, indices + size, indices)
+
+
+def _noise2pyramid(x, y, levels, octaves, persistence, perm):
+    # Level lod is sampled at every (2 ** lod):th coordinate and includes one octave less than the level above it (as
+    # halving the resolution also halves the highest frequency it can show), but never less than the first octave.
+    # Each octave is only generated once, on the finest level it contributes to, and is then subsampled for the
+    # coarser levels.
+    pyramid = [np.zeros((y[:: 2**lod].size, x[:: 2**lod].size), dtype=np.double) for lod in range(levels)]
+    scale = sum(persistence**k for k in range(octaves))
+    for k in range(octaves):
+        octave = _launch(_noise2a, 2, x * 2**k, y * 2**k, perm, np.empty((y.size, x.size), dtype=np.double))
+        octave *= persistence**k / scale
+        for lod in range(levels if k == 0 else min(levels, octaves - k)):
+            pyramid[lod] += octave[:: 2**lod, :: 2**lod]
+    return pyramid
+
+
+# The elementwise kernels below work on flat arrays of equal size, already broadcasted against each other.
+# Only the elements flagged in `where` are written to `out`.
+
+
+@njit(cache=True, parallel=True)
+def _noise2v(x, y, where, out, perm):
+    for i in prange(out.size):
+        if where[i]:
+            out[i] = _noise2(x[i], y[i], perm)
+
+
+@njit(cache=True, parallel=True)
+def _noise3v(x, y, z, where, out, perm, perm_grad_index3):
+    for i in prange(out.size):
+        if where[i]:
+            out[i] = _noise3(x[i], y[i], z[i], perm, perm_grad_index3)
+
+
+@njit(cache=True, parallel=True)
+def _noise4v(x, y, z, w, where, out, perm):
+    for i in prange(out.size):
+        if where[i]:
+            out[i] = _noise4(x[i], y[i], z[i], w[i], perm)
+
+
+def _points(coords, perm, perm_grad_index3):
+    # Evaluates the noise at the points given by a list of 1D coordinate arrays of equal size (x, y, z, w order).
+    out = np.empty(coords[0].size, dtype=np.double)
+    where = np.ones(out.size, dtype=np.bool_)
+    if len(coords) == 2:
+        _noise2v(*coords, where, out, perm)
+    elif len(coords) == 3:
+        _noise3v(*coords, where, out, perm, perm_grad_index3)
+    else:
+        _noise4v(*coords, where, out, perm)
+    return out
+
+
+# The reductions below sample the noise on a regular grid, without ever storing it. The grid is described by the
+# lowest coordinates, step sizes and number of samples along each axis (as arrays of length 4, using only the first
+# `dims` entries). The samples are split into chunks that are reduced in parallel, each into its own row of `partials`.
+
+
+@njit(cache=True)
+def _grid_sample(dims, i, lows, steps, counts, perm, perm_grad_index3):
+    x = lows[0] + (i % counts[0]) * steps[0]
+    i //= counts[0]
+    y = lows[1] + (i % counts[1]) * steps[1]
+    if dims == 2:
+        return _noise2(x, y, perm)
+    i //= counts[1]
+    z = lows[2] + (i % counts[2]) * steps[2]
+    if dims == 3:
+        return _noise3(x, y, z, perm, perm_grad_index3)
+    i //= counts[2]
+    w = lows[3] + (i % counts[3]) * steps[3]
+    return _noise4(x, y, z, w, perm)
+
+
+@njit(cache=True, parallel=True)
+def _noise_stats(dims, lows, steps, counts, perm, perm_grad_index3, partials):
+    # Each row of partials gets the count, min, max, mean and sum of squared differences from the mean (M2) of a
+    # chunk, using Welford's algorithm.
+    total = 1
+    for d in range(dims):
+        total *= counts[d]
+    chunk = -(-total // partials.shape[0])
+    for c in prange(partials.shape[0]):
+        n, low, high, mean, m2 = 0, np.inf, -np.inf, 0.0, 0.0
+        for i in range(c * chunk, min(total, (c + 1) * chunk)):
+            value = _grid_sample(dims, i, lows, steps, counts, perm, perm_grad_index3)
+            n += 1
+            delta = value - mean
+            mean += delta / n
+            m2 += delta * (value - mean)
+            low = min(low, value)
+            high = max(high, value)
+        partials[c, 0] = n
+        partials[c, 1] = low
+        partials[c, 2] = high
+        partials[c, 3] = mean
+        partials[c, 4] = m2
+
+
+@njit(cache=True, parallel=True)
+def _noise_histogram(dims, lows, steps, counts, low, high, perm, perm_grad_index3, partials):
+    # Values outside of [low, high] are ignored, same as numpy.histogram().
+    total = 1
+    for d in range(dims):
+        total *= counts[d]
+    bins = partials.shape[1]
+    chunk = -(-total // partials.shape[0])
+    for c in prange(partials.shape[0]):
+        for i in range(c * chunk, min(total, (c + 1) * chunk)):
+            value = _grid_sample(dims, i, lows, steps, counts, perm, perm_grad_index3)
+            if low <= value <= high:
+                partials[c, min(int((value - low) / (high - low) * bins), bins - 1)] += 1
+
+
+def _grid_counts(dims, domain, resolution):
+    # Returns the first sample, step and number of samples along each axis (of 4, the unused ones of a single sample),
+    # placing the samples in the centers of the grid cells covering the domain.
+    if len(domain) != dims:
+        raise ValueError("Expected %d (low, high) pairs in domain, got %d" % (dims, len(domain)))
+    counts = np.ones(4, dtype=np.int64)
+    counts[:dims] = resolution
+    lows, steps = np.zeros(4, dtype=np.double), np.zeros(4, dtype=np.double)
+    for d, (low, high) in enumerate(domain):
+        steps[d] = (high - low) / counts[d]
+        lows[d] = low + steps[d] / 2
+    return lows, steps, counts
+
+
+_REDUCE_CHUNKS = 1024
+
+
+def _grid_stats(dims, domain, resolution, perm, perm_grad_index3):
+    lows, steps, counts = _grid_counts(dims, domain, resolution)
+    partials = np.zeros((_REDUCE_CHUNKS, 5), dtype=np.double)
+    _noise_stats(dims, lows, steps, counts, perm, perm_grad_index3, partials)
+    # Merges the chunks, using the parallel variant of Welford's algorithm (by Chan et al.)
+    n, low, high, mean, m2 = 0, np.inf, -np.inf, 0.0, 0.0
+    for n_b, low_b, high_b, mean_b, m2_b in partials[partials[:, 0] > 0]:
+        delta = mean_b - mean
+        total = n + n_b
+        mean += delta * n_b / total
+        m2 += m2_b + delta * delta * n * n_b / total
+        n = total
+        low = min(low, low_b)
+        high = max(high, high_b)
+    variance = m2 / n if n else np.nan
+    return {"count": int(n), "min": float(low), "max": float(high), "mean": float(mean), "var": float(variance)}
+
+
+def _grid_histogram(dims, domain, resolution, bins, value_range, perm, perm_grad_index3):
+    lows, steps, counts = _grid_counts(dims, domain, resolution)
+    low, high = value_range
+    partials = np.zeros((_REDUCE_CHUNKS, bins), dtype=np.int64)
+    _noise_histogram(dims, lows, steps, counts, low, high, perm, perm_grad_index3, partials)
+    return partials.sum(axis=0), np.linspace(low, high, bins + 1)
+
+
+################################################################################
+# Vertex contributions for the multi-component (vector and curl noise) variants of _noise2() and _noise3(), see
+# variants._Components. Each component is a noise field of its own, given by a row of the stacked permutation tables.
+
+
+@njit(cache=True)
+def _accumulate2(out, attn, perms, xsv, ysv, dx, dy):
+    attn *= attn
+    for c in range(out.shape[0]):
+        out[c] += attn * attn * _extrapolate2(perms[c], xsv, ysv, dx, dy)
+
+
+@njit(cache=True)
+def _accumulate3(out, attn, perms, grad_indices, xsv, ysv, zsv, dx, dy, dz):
+    attn *= attn
+    for c in range(out.shape[0]):
+        out[c] += attn * attn * _extrapolate3(perms[c], grad_indices[c], xsv, ysv, zsv, dx, dy, dz)
+
+
+# The gradient variants also add the partial derivatives of the contribution attn**4 * (g . d) to out[c, 1:], which
+# are attn**4 * g - 8 * attn**3 * (g . d) * d (the displacement d moves along with the input coordinates). The
+# gradient g of the vertex is looked up just like in _extrapolate2() and _extrapolate3().
+
+
+@njit(cache=True)
+def _accumulate2_gradient(out, attn, perms, xsv, ysv, dx, dy):
+    attn2 = attn * attn
+    for c in range(out.shape[0]):
+        perm = perms[c]
+        index = int(perm[(int(perm[xsv & 0xFF]) + ysv) & 0xFF]) & 0x0E
+        gx, gy = GRADIENTS2[index : index + 2]
+        value = gx * dx + gy * dy
+        out[c, 0] += attn2 * attn2 * value
+        out[c, 1] += attn2 * attn2 * gx - 8 * attn2 * attn * value * dx
+        out[c, 2] += attn2 * attn2 * gy - 8 * attn2 * attn * value * dy
+
+
+@njit(cache=True)
+def _accumulate3_gradient(out, attn, perms, grad_indices, xsv, ysv, zsv, dx, dy, dz):
+    attn2 = attn * attn
+    for c in range(out.shape[0]):
+        perm = perms[c]
+        index = int(grad_indices[c, (int(perm[(int(perm[xsv & 0xFF]) + ysv) & 0xFF]) + zsv) & 0xFF])
+        gx, gy, gz = GRADIENTS3[index : index + 3]
+        value = gx * dx + gy * dy + gz * dz
+        out[c, 0] += attn2 * attn2 * value
+        out[c, 1] += attn2 * attn2 * gx - 8 * attn2 * attn * value * dx
+        out[c, 2] += attn2 * attn2 * gy - 8 * attn2 * attn * value * dy
+        out[c, 3] += attn2 * attn2 * gz - 8 * attn2 * attn * value * dz
+
+
+################################################################################
+# Conservative bounds of the 3D noise over a box, for culling blocks of a grid.
+#
+# The noise at a point is the sum of the contributions attn**4 * (g . d) / NORM_CONSTANT3 of the lattice vertices
+# within the radius of the kernel, where d is the displacement from the vertex and attn = 2 - d . d. Over a box, d
+# ranges over the box translated by the vertex, so both attn and g . d can be bounded exactly, and their product
+# (ignoring their correlation) gives an interval holding the contribution. The kernel skips some of the vertices
+# near the edge of its radius, which is accounted for by widening the interval of those vertices to include zero.
+
+# Squared distance beyond which the kernel may skip a vertex. This is empirical rather than derived: the closest vertex
+# it skipped over 200000 random points was at 1.84, so this leaves a margin. Widening the interval of every vertex
+# instead would be strictly conservative, but culls up to a third fewer blocks.
+_SKIPPED_RADIUS3 = 1.5
+
+
+@njit(cache=True)
+def _noise3_bounds(x0, y0, z0, x1, y1, z1, perm, perm_grad_index3):
+    # Range of the stretched coordinates of the box grown by the radius of the kernel, which holds the lattice
+    # coordinates of the vertices within reach. The stretch constant is negative, so each stretched coordinate is
+    # lowest at the low end of its own axis and the high end of the others.
+    r = 2.0**0.5
+    x0r, y0r, z0r, x1r, y1r, z1r = x0 - r, y0 - r, z0 - r, x1 + r, y1 + r, z1 + r
+    xs0, xs1 = x0r + (x0r + y1r + z1r) * STRETCH_CONSTANT3, x1r + (x1r + y0r + z0r) * STRETCH_CONSTANT3
+    ys0, ys1 = y0r + (x1r + y0r + z1r) * STRETCH_CONSTANT3, y1r + (x0r + y1r + z0r) * STRETCH_CONSTANT3
+    zs0, zs1 = z0r + (x1r + y1r + z0r) * STRETCH_CONSTANT3, z1r + (x0r + y0r + z1r) * STRETCH_CONSTANT3
+
+    noise_low, noise_high = 0.0, 0.0
+    for xsb in range(floor(xs0), floor(xs1) + 1):
+        for ysb in range(floor(ys0), floor(ys1) + 1):
+            for zsb in range(floor(zs0), floor(zs1) + 1):
+                squish_offset = (xsb + ysb + zsb) * SQUISH_CONSTANT3
+                dx0, dx1 = x0 - xsb - squish_offset, x1 - xsb - squish_offset
+                dy0, dy1 = y0 - ysb - squish_offset, y1 - ysb - squish_offset
+                dz0, dz1 = z0 - zsb - squish_offset, z1 - zsb - squish_offset
+                near = max(dx0, 0.0, -dx1) ** 2 + max(dy0, 0.0, -dy1) ** 2 + max(dz0, 0.0, -dz1) ** 2
+                if near >= 2.0:
+                    continue
+                far = max(dx0 * dx0, dx1 * dx1) + max(dy0 * dy0, dy1 * dy1) + max(dz0 * dz0, dz1 * dz1)
+                attn_low, attn_high = max(2.0 - far, 0.0) ** 4, (2.0 - near) ** 4
+
+                # g . d is linear in d, so it reaches its bounds at the corners of the box
+                g1 = _extrapolate3(perm, perm_grad_index3, xsb, ysb, zsb, 1.0, 0.0, 0.0)
+                g2 = _extrapolate3(perm, perm_grad_index3, xsb, ysb, zsb, 0.0, 1.0, 0.0)
+                g3 = _extrapolate3(perm, perm_grad_index3, xsb, ysb, zsb, 0.0, 0.0, 1.0)
+                dot_low = min(g1 * dx0, g1 * dx1) + min(g2 * dy0, g2 * dy1) + min(g3 * dz0, g3 * dz1)
+                dot_high = max(g1 * dx0, g1 * dx1) + max(g2 * dy0, g2 * dy1) + max(g3 * dz0, g3 * dz1)
+
+                products = (attn_low * dot_low, attn_low * dot_high, attn_high * dot_low, attn_high * dot_high)
+                contribution_low, contribution_high = min(products), max(products)
+                if far > _SKIPPED_RADIUS3:
+                    contribution_low, contribution_high = min(contribution_low, 0.0), max(contribution_high, 0.0)
+                noise_low += contribution_low
+                noise_high += contribution_high
+    return noise_low / NORM_CONSTANT3, noise_high / NORM_CONSTANT3
+
+
+@njit(cache=True)
+def _noise3_side(x0, y0, z0, x1, y1, z1, threshold, depth, perm, perm_grad_index3):
+    # Returns -1 or 1 if the noise is proven to be entirely below or above the threshold over the box, 0 otherwise.
+    # Boxes the bounds don't decide are split in 8, up to depth times, until all the parts are decided the same way.
+    boxes = [(x0, y0, z0, x1, y1, z1, 0)]
+    side = 0
+    while len(boxes):
+        x0, y0, z0, x1, y1, z1, level = boxes.pop()
+        low, high = _noise3_bounds(x0, y0, z0, x1, y1, z1, perm, perm_grad_index3)
+        part = -1 if high < threshold else (1 if low > threshold else 0)
+        if part == 0 and level < depth:
+            xm, ym, zm = (x0 + x1) / 2, (y0 + y1) / 2, (z0 + z1) / 2
+            for corner in range(8):
+                xa, xb = (xm, x1) if corner & 1 else (x0, xm)
+                ya, yb = (ym, y1) if corner & 2 else (y0, ym)
+                za, zb = (zm, z1) if corner & 4 else (z0, zm)
+                boxes.append((xa, ya, za, xb, yb, zb, level + 1))
+            continue
+        if part == 0 or (side != 0 and part != side):
+            return 0
+        side = part
+    return side
+
+
+@njit(cache=True, parallel=True)
+def _noise3_culled(x, y, z, threshold, block, depth, perm, perm_grad_index3, noise, classes):
+    # Evaluates the blocks of block**3 samples that aren't proven to be entirely below (class -1) or above (class 1)
+    # the threshold, and fills the others with NaN.
+    blocks_y, blocks_x = classes.shape[1], classes.shape[2]
+    for b in prange(classes.size):
+        k0 = b // (blocks_y * blocks_x) * block
+        j0 = b // blocks_x % blocks_y * block
+        i0 = b % blocks_x * block
+        k1, j1, i1 = min(k0 + block, z.size), min(j0 + block, y.size), min(i0 + block, x.size)
+        x0, x1 = x[i0:i1].min(), x[i0:i1].max()
+        y0, y1 = y[j0:j1].min(), y[j0:j1].max()
+        z0, z1 = z[k0:k1].min(), z[k0:k1].max()
+        side = _noise3_side(x0, y0, z0, x1, y1, z1, threshold, depth, perm, perm_grad_index3)
+        classes[k0 // block, j0 // block, i0 // block] = side
+        for k in range(k0, k1):
+            for j in range(j0, j1):
+                for i in range(i0, i1):
+                    value = np.nan
+                    if side == 0:
+                        value = _noise3(float(x[i]), float(y[j]), float(z[k]), perm, perm_grad_index3)
+                    noise[k, j, i] = value
+
+
+################################################################################
+# Ray marching through the 3D noise taken as a density, for volumetric effects (clouds, fog). Each ray is marched on
+# its own, sampling the density at the middle of each step, so no volume of noise is ever held in memory.
+
+
+@njit(cache=True, parallel=True)
+def _noise3_march(origins, directions, step, steps, octaves, persistence, bias, limit, out, perm, perm_grad_index3):
+    # Writes the optical depth of each ray, the integral along it of the density: the noise summed over the octaves
+    # (normalized to the range of a single octave) plus the bias, clamped to zero. A ray is stopped once its depth is
+    # past the limit, where it's opaque for all intents and purposes.
+    scale = 0.0
+    for k in range(octaves):
+        scale += persistence**k
+    for r in prange(out.size):
+        depth = 0.0
+        for i in range(steps):
+            t = (i + 0.5) * step
+            x = origins[r, 0] + directions[r, 0] * t
+            y = origins[r, 1] + directions[r, 1] * t
+            z = origins[r, 2] + directions[r, 2] * t
+            value, amplitude, frequency = 0.0, 1.0, 1.0
+            for k in range(octaves):
+                value += amplitude * _noise3(x * frequency, y * frequency, z * frequency, perm, perm_grad_index3)
+                amplitude *= persistence
+                frequency *= 2.0
+            density = value / scale + bias
+            if density > 0.0:
+                depth += density * step
+                if depth > limit:
+                    break
+        out[r] = depth
+
+
+################################################################################
+# Lookup table kernels for 3D and 4D noise.
+#
+# Instead of walking down the if/else tree of _noise3() and _noise4(), these kernels compute a region code from a
+# few comparisons of the coordinates within the super-cell, and look up the list of lattice vertices that the
+# original kernels would have used for that region. All vertices in the list are evaluated, with the attenuation
+# clamped to zero instead of skipped, so the loop over them has no branches. The vertices are evaluated in the same
+# order and with the same arithmetic as the original kernels: the displacement from each vertex is computed by
+# subtracting the same constants from the displacement from the origin, in the same order, as the original does in
+# that region. So the results are bit-identical.
+#
+# The tables are generated from the original kernels, see variants._lookup_tables(). Points too close to a region
+# boundary (where rounding could put them on the other side compared to the original) fall back to the original.
+
+_LOOKUP_MARGIN = 1e-12
+
+
+@njit(cache=True)
+def _edge(value):
+    # Distance to the nearest integer.
+    return abs(value - round(value))
+
+
+@njit(cache=True)
+def _region3(xins, yins, zins):
+    in_sum = xins + yins + zins
+    base = floor(in_sum)
+    code = int(xins > yins) | int(xins > zins) << 1 | int(yins > zins) << 2 | base << 3
+    code |= (floor(in_sum + xins) - base) << 5 | (floor(in_sum + yins) - base) << 6 | (floor(in_sum + zins) - base) << 7
+    margin = min(abs(xins - yins), abs(xins - zins), abs(yins - zins))
+    margin = min(margin, _edge(in_sum), _edge(in_sum + xins), _edge(in_sum + yins), _edge(in_sum + zins))
+    return code, margin
+
+
+@njit(cache=True)
+def _region4(xins, yins, zins, wins):
+    in_sum = xins + yins + zins + wins
+    base = floor(in_sum)
+    code = int(xins > yins) | int(xins > zins) << 1 | int(xins > wins) << 2
+    code |= int(yins > zins) << 3 | int(yins > wins) << 4 | int(zins > wins) << 5 | base << 6
+    code |= (floor(in_sum + xins) - base) << 8 | (floor(in_sum + yins) - base) << 9
+    code |= (floor(in_sum + zins) - base) << 10 | (floor(in_sum + wins) - base) << 11
+    margin = min(abs(xins - yins), abs(xins - zins), abs(xins - wins))
+    margin = min(margin, abs(yins - zins), abs(yins - wins), abs(zins - wins), _edge(in_sum))
+    margin = min(margin, _edge(in_sum + xins), _edge(in_sum + yins), _edge(in_sum + zins), _edge(in_sum + wins))
+    return code, margin
+
+
+@njit(cache=True)
+def _noise3_lookup(x, y, z, perm, perm_grad_index3, regions, vertices, steps, counts):
+    stretch_offset = (x + y + z) * STRETCH_CONSTANT3
+    xs = x + stretch_offset
+    ys = y + stretch_offset
+    zs = z + stretch_offset
+    xsb = floor(xs)
+    ysb = floor(ys)
+    zsb = floor(zs)
+    squish_offset = (xsb + ysb + zsb) * SQUISH_CONSTANT3
+    dx0 = x - (xsb + squish_offset)
+    dy0 = y - (ysb + squish_offset)
+    dz0 = z - (zsb + squish_offset)
+
+    code, margin = _region3(xs - xsb, ys - ysb, zs - zsb)
+    region = regions[code]
+    if region < 0 or margin < _LOOKUP_MARGIN:
+        return _noise3(x, y, z, perm, perm_grad_index3)
+
+    value = 0.0
+    for i in range(counts[region]):
+        xsv, ysv, zsv = vertices[region, i, 0], vertices[region, i, 1], vertices[region, i, 2]
+        dx = dx0 - steps[region, i, 0, 0] - steps[region, i, 0, 1] - steps[region, i, 0, 2]
+        dy = dy0 - steps[region, i, 1, 0] - steps[region, i, 1, 1] - steps[region, i, 1, 2]
+        dz = dz0 - steps[region, i, 2, 0] - steps[region, i, 2, 1] - steps[region, i, 2, 2]
+        attn = max(2 - dx * dx - dy * dy - dz * dz, 0.0)
+        attn *= attn
+        value += attn * attn * _extrapolate3(perm, perm_grad_index3, xsb + xsv, ysb + ysv, zsb + zsv, dx, dy, dz)
+    return value / NORM_CONSTANT3
+
+
+@njit(cache=True)
+def _noise4_lookup(x, y, z, w, perm, regions, vertices, steps, counts):
+    stretch_offset = (x + y + z + w) * STRETCH_CONSTANT4
+    xs = x + stretch_offset
+    ys = y + stretch_offset
+    zs = z + stretch_offset
+    ws = w + stretch_offset
+    xsb = floor(xs)
+    ysb = floor(ys)
+    zsb = floor(zs)
+    wsb = floor(ws)
+    squish_offset = (xsb + ysb + zsb + wsb) * SQUISH_CONSTANT4
+    dx0 = x - (xsb + squish_offset)
+    dy0 = y - (ysb + squish_offset)
+    dz0 = z - (zsb + squish_offset)
+    dw0 = w - (wsb + squish_offset)
+
+    code, margin = _region4(xs - xsb, ys - ysb, zs - zsb, ws - wsb)
+    region = regions[code]
+    if region < 0 or margin < _LOOKUP_MARGIN:
+        return _noise4(x, y, z, w, perm)
+
+    value = 0.0
+    for i in range(counts[region]):
+        xsv, ysv = vertices[region, i, 0], vertices[region, i, 1]
+        zsv, wsv = vertices[region, i, 2], vertices[region, i, 3]
+        dx = dx0 - steps[region, i, 0, 0] - steps[region, i, 0, 1] - steps[region, i, 0, 2]
+        dy = dy0 - steps[region, i, 1, 0] - steps[region, i, 1, 1] - steps[region, i, 1, 2]
+        dz = dz0 - steps[region, i, 2, 0] - steps[region, i, 2, 1] - steps[region, i, 2, 2]
+        dw = dw0 - steps[region, i, 3, 0] - steps[region, i, 3, 1] - steps[region, i, 3, 2]
+        attn = max(2 - dx * dx - dy * dy - dz * dz - dw * dw, 0.0)
+        attn *= attn
+        value += attn * attn * _extrapolate4(perm, xsb + xsv, ysb + ysv, zsb + zsv, wsb + wsv, dx, dy, dz, dw)
+    return value / NORM_CONSTANT4
+
+
 @njit(cache=True, parallel=True)
-def _noise3a(x, y, z, perm, perm_grad_index3):
-    noise = np.empty((z.size, y.size, x.size), dtype=np.double)
+def _noise3a_lookup(x, y, z, perm, perm_grad_index3, regions, vertices, steps, counts, noise):
     for z_i in prange(z.size):
         for y_i in prange(y.size):
             for x_i in prange(x.size):
-                noise[z_i, y_i, x_i] = _noise3(x[x_i], y[y_i], z[z_i], perm, perm_grad_index3)
+                noise[z_i, y_i, x_i] = _noise3_lookup(
+                    float(x[x_i]),
+                    float(y[y_i]),
+                    float(z[z_i]),
+                    perm,
+                    perm_grad_index3,
+                    regions,
+                    vertices,
+                    steps,
+                    counts,
+                )
     return noise
 
 
 @njit(cache=True, parallel=True)
-def _noise4a(x, y, z, w, perm):
-    noise = np.empty((w.size, z.size, y.size, x.size), dtype=np.double)
+def _noise4a_lookup(x, y, z, w, perm, regions, vertices, steps, counts, noise):
     for w_i in prange(w.size):
         for z_i in prange(z.size):
             for y_i in prange(y.size):
                 for x_i in prange(x.size):
-                    noise[w_i, z_i, y_i, x_i] = _noise4(x[x_i], y[y_i], z[z_i], w[w_i], perm)
+                    noise[w_i, z_i, y_i, x_i] = _noise4_lookup(
+                        float(x[x_i]),
+                        float(y[y_i]),
+                        float(z[z_i]),
+                        float(w[w_i]),
+                        perm,
+                        regions,
+                        vertices,
+                        steps,
+                        counts,
+                    )
     return noise
 
 
@@ -0,0 +1,179 @@
+import functools
+
+from .constants import np
+from .internals import njit, _noise2, _noise3, _noise4
+
+try:
+    from numba import carray, cfunc as _cfunc, types
+except ImportError:
+    _cfunc = None
+
+"""
+Noise functions to be called from code compiled with numba.njit, without going back to Python.
+
+The permutation tables of a seed are passed as a state tuple, as returned by OpenSimplex(seed).jit_state (or
+opensimplex.jit_state() for the current seed of the module). The state is a tuple of two 1D uint8 numpy arrays, and
+can be passed to njit functions as an argument or captured as a global. The functions are compiled as a part of the
+calling function, so they are inlined and run as fast as the array functions of the module.
+
+The state layout and the signatures of these functions are kept stable across releases, the results match
+OpenSimplex(seed).noise2() etc. exactly.
+
+>>> import numba
+>>> @numba.njit
+... def fbm(state, x, y, octaves):
+...     value, amplitude = 0.0, 1.0
+...     for _ in range(octaves):
+...         value += amplitude * opensimplex.jit.noise2(state, x, y)
+...         x, y, amplitude = x * 2.0, y * 2.0, amplitude * 0.5
+...     return value
+>>> fbm(opensimplex.OpenSimplex(42).jit_state, 0.5, 0.5, 4)
+-0.15485924921066668
+"""
+
+
+@njit(cache=True)
+def noise2(state, x, y):
+    """
+    Generate 2D OpenSimplex noise from X,Y coordinates, for the seed of the state.
+    """
+    return _noise2(x, y, state[0])
+
+
+@njit(cache=True)
+def noise3(state, x, y, z):
+    """
+    Generate 3D OpenSimplex noise from X,Y,Z coordinates, for the seed of the state.
+    """
+    return _noise3(x, y, z, state[0], state[1])
+
+
+@njit(cache=True)
+def noise4(state, x, y, z, w):
+    """
+    Generate 4D OpenSimplex noise from X,Y,Z,W coordinates, for the seed of the state.
+    """
+    return _noise4(x, y, z, w, state[0])
+
+
+################################################################################
+# Scalar entry points and C callbacks, for callers outside of numba. The tables of the seed are compiled into the
+# functions as constants, so they take the coordinates only.
+
+
+def scalar(state, dims: int):
+    """
+    Compile a noise function for the seed of the state, called from Python with the coordinates only, as
+    noise(x, y[, z[, w]]). This is the cheapest way to get single samples from Python: it skips the attribute lookups
+    of the module functions and the type dispatch of numba, calling the compiled code directly. The functions of the
+    64 most recently used seeds and dimensions are cached.
+    :param state: state of the seed, see OpenSimplex.jit_state
+    :param dims:  number of dimensions of the noise (2, 3 or 4)
+    :return:      function taking dims floats and returning the noise as a float
+
+    >>> noise2 = opensimplex.jit.scalar(opensimplex.jit_state(), 2)
+    >>> noise2(0.5, 0.5) == opensimplex.noise2(0.5, 0.5)
+    True
+    """
+    if dims not in (2, 3, 4):
+        raise ValueError("Expected 2, 3 or 4 dimensions, got %s" % dims)
+    perm, perm_grad_index3 = state
+    return _scalar(perm.tobytes(), perm_grad_index3.tobytes(), dims)
+
+
+@functools.lru_cache(maxsize=64)
+def _scalar(perm, perm_grad_index3, dims):
+    point, _ = _compile(*_tables(perm, perm_grad_index3), dims)
+    if not hasattr(point, "compile"):
+        return point
+    # The entry point of the compiled overload is a builtin function, unboxing the floats and calling the machine code
+    # without going through the dispatcher. It isn't a public attribute of numba, so the dispatcher is the fallback.
+    signature = (types.double,) * dims
+    point.compile(signature)
+    overload = getattr(point, "overloads", {}).get(signature)
+    return getattr(overload, "entry_point", point)
+
+
+def cfunc(state, dims: int, kind: str = "point"):
+    """
+    Compile a C callback evaluating the noise for the seed of the state. The callbacks of the 64 most recently used
+    seeds, dimensions and kinds are cached. Keep a reference to the returned object for as long as its address is in
+    use, the machine code is freed along with it.
+    :param state: state of the seed, see OpenSimplex.jit_state
+    :param dims:  number of dimensions of the noise (2, 3 or 4)
+    :param kind:  "point" for double noise(double x, double y, ...), or "quad" for double noise(int n, double *xx)
+                  taking the coordinates from xx[0] to xx[dims - 1], as called by scipy.integrate.quad() and nquad()
+                  (returning NaN when n is less than dims)
+    :return:      numba CFunc object, giving the function pointer as .address, a ctypes function as .ctypes, and
+                  usable as scipy.LowLevelCallable(callback.ctypes)
+
+    >>> callback = opensimplex.jit.cfunc(opensimplex.jit_state(), 2)
+    >>> callback.ctypes(0.5, 0.5) == opensimplex.noise2(0.5, 0.5)
+    True
+    """
+    if _cfunc is None:
+        raise ImportError("C callbacks need numba to be installed")
+    if dims not in (2, 3, 4):
+        raise ValueError("Expected 2, 3 or 4 dimensions, got %s" % dims)
+    if kind not in ("point", "quad"):
+        raise ValueError("Unknown kind '%s', expected 'point' or 'quad'" % kind)
+    perm, perm_grad_index3 = state
+    return _callback(perm.tobytes(), perm_grad_index3.tobytes(), dims, kind)
+
+
+@functools.lru_cache(maxsize=64)
+def _callback(perm, perm_grad_index3, dims, kind):
+    point, quad = _compile(*_tables(perm, perm_grad_index3), dims)
+    if kind == "point":
+        return _cfunc(types.double(*[types.double] * dims))(point)
+    return _cfunc(types.double(types.intc, types.CPointer(types.double)))(quad)
+
+
+def _tables(perm, perm_grad_index3):
+    # The tables of a state, from their bytes (as the caches are keyed by).
+    return np.frombuffer(perm, dtype=np.uint8).copy(), np.frombuffer(perm_grad_index3, dtype=np.uint8).copy()
+
+
+def _compile(perm, perm_grad_index3, dims):
+    # Returns the njit functions of a point (taking the coordinates) and of the quad callbacks (taking their number
+    # and a pointer to them, and returning NaN when given fewer than dims), with the tables frozen in.
+    if dims == 2:
+
+        @njit()
+        def point(x, y):
+            return _noise2(x, y, perm)
+
+        @njit()
+        def quad(n, xx):
+            if n < 2:
+                return np.nan
+            coords = carray(xx, (n,))
+            return _noise2(coords[0], coords[1], perm)
+
+    elif dims == 3:
+
+        @njit()
+        def point(x, y, z):
+            return _noise3(x, y, z, perm, perm_grad_index3)
+
+        @njit()
+        def quad(n, xx):
+            if n < 3:
+                return np.nan
+            coords = carray(xx, (n,))
+            return _noise3(coords[0], coords[1], coords[2], perm, perm_grad_index3)
+
+    else:
+
+        @njit()
+        def point(x, y, z, w):
+            return _noise4(x, y, z, w, perm)
+
+        @njit()
+        def quad(n, xx):
+            if n < 4:
+                return np.nan
+            coords = carray(xx, (n,))
+            return _noise4(coords[0], coords[1], coords[2], coords[3], perm)
+
+    return point, quad
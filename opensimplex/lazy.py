@@ -0,0 +1,100 @@
+# Array-like view of the noise sampled on a regular grid, which only generates the elements it is indexed with. Any
+# region of the grid is a product of evenly spaced coordinates along each axis, so it maps directly onto the array
+# kernels (noise2array() etc.).
+
+import math
+import operator
+
+from .constants import np
+
+
+class NoiseArray(object):
+    """
+    Read-only array of noise sampled on a regular grid, generated on demand. The element at index [..., j, i] holds
+    the noise at x = origin[0] + i * step[0], y = origin[1] + j * step[1] (and so on for z and w), so the axes are in
+    the same order as the arrays returned by noise2array(), noise3array() and noise4array().
+    Indexing with integers, slices, Ellipsis and None (numpy's basic indexing) generates only the selected elements,
+    numpy.asarray() generates the whole array.
+    """
+
+    __slots__ = ("_simplex", "_shape", "_origin", "_step")
+
+    def __init__(self, simplex, dims: int, shape, origin, step) -> None:
+        shape = (shape,) if np.ndim(shape) == 0 else tuple(shape)
+        if dims not in (2, 3, 4):
+            raise ValueError("Expected 2, 3 or 4 dimensions, got %s" % dims)
+        if len(shape) != dims:
+            raise ValueError("Expected a shape with %d dimensions, got %s" % (dims, shape))
+        self._simplex = simplex
+        self._shape = tuple(operator.index(n) for n in shape)
+        self._origin = np.broadcast_to(np.asarray(origin, dtype=np.double), (dims,)).copy()
+        self._step = np.broadcast_to(np.asarray(step, dtype=np.double), (dims,)).copy()
+
+    dtype = np.dtype(np.double)
+
+    @property
+    def shape(self) -> tuple:
+        return self._shape
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        return math.prod(self.shape)
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * self.dtype.itemsize
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        origin, step = tuple(self._origin.tolist()), tuple(self._step.tolist())
+        return "NoiseArray(shape=%s, origin=%s, step=%s)" % (self.shape, origin, step)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if sum(k is Ellipsis for k in key) > 1:
+            raise IndexError("an index can only have a single ellipsis ('...')")
+        indexed = sum(k is not None and k is not Ellipsis for k in key)
+        if indexed > self.ndim:
+            message = "too many indices for array: array is %d-dimensional, but %d were indexed"
+            raise IndexError(message % (self.ndim, indexed))
+        at = next((i for i, k in enumerate(key) if k is Ellipsis), len(key))
+        key = key[:at] + (slice(None),) * (self.ndim - indexed) + key[at + 1 :]
+
+        # The coordinates along each axis (in array order), and how to shape the generated noise into the result
+        coords, result = [], []
+        for k in key:
+            if k is None:
+                result.append(None)
+                continue
+            axis, n = len(coords), self.shape[len(coords)]
+            if isinstance(k, slice):
+                indices = np.arange(*k.indices(n))
+                result.append(slice(None))
+            else:
+                try:
+                    i = operator.index(k)
+                except TypeError:
+                    raise IndexError(
+                        "only integers, slices (`:`), ellipsis (`...`) and numpy.newaxis (`None`) are valid indices"
+                    ) from None
+                if not -n <= i < n:
+                    raise IndexError("index %d is out of bounds for axis %d with size %d" % (i, axis, n))
+                indices = np.array([i % n])
+                result.append(0)
+            d = self.ndim - 1 - axis
+            coords.append(self._origin[d] + self._step[d] * indices)
+
+        noise = getattr(self._simplex, "noise%darray" % self.ndim)(*reversed(coords))
+        return noise[tuple(result)]
+
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError("A NoiseArray can't be converted to an array without generating the noise")
+        noise = self[...]
+        return noise if dtype is None else noise.astype(dtype, copy=False)
@@ -0,0 +1,163 @@
+# Fixed-size window of noise sampled on a regular grid, following a moving camera. The window is held in a ring buffer
+# (wrapping around along each axis), so moving it by a few cells only generates the newly exposed rows and columns,
+# the rest of the samples staying where they are in the buffer.
+#
+# The element [..., j, i] of the window (in the same axis order as noise2array() etc.) is held in the buffer at
+# [..., (offset[-2] + j) % shape[-2], (offset[-1] + i) % shape[-1]]. Along any axis, a range of elements of the window
+# is a range of the buffer wrapping around at most once, so it maps onto at most two slices of the buffer.
+
+import itertools
+import operator
+
+from .constants import np
+
+
+def _ring(start, count, n):
+    # Slices of an axis of n elements of the buffer holding count elements from the start (a buffer index), in order.
+    if start + count <= n:
+        return [slice(start, start + count)]
+    return [slice(start, n), slice(0, start + count - n)]
+
+
+class _ScrollingNoise(object):
+    __slots__ = ("_simplex", "_buffer", "_offset", "_position", "_origin", "_step")
+
+    _dims = None
+
+    def __init__(self, simplex, shape, origin, step) -> None:
+        dims = self._dims
+        shape = (shape,) * dims if np.ndim(shape) == 0 else tuple(shape)
+        if len(shape) != dims or min(shape) < 1:
+            raise ValueError("Expected a shape of %d positive dimensions, got %s" % (dims, shape))
+        self._simplex = simplex
+        self._buffer = np.empty(tuple(operator.index(n) for n in shape), dtype=np.double)
+        self._offset = [0] * dims  # In array order, as the shape
+        self._position = [0] * dims  # Grid cell of the first element of the window, in array order
+        self._origin = np.broadcast_to(np.asarray(origin, dtype=np.double), (dims,)).copy()
+        self._step = np.broadcast_to(np.asarray(step, dtype=np.double), (dims,)).copy()
+        self._fill([[slice(0, n)] for n in self._buffer.shape])
+
+    @property
+    def shape(self) -> tuple:
+        return self._buffer.shape
+
+    @property
+    def position(self) -> tuple:
+        """
+        Grid cell of the first element of the window in x, y, z order, its coordinates being origin + position * step.
+        """
+        return tuple(reversed(self._position))
+
+    @property
+    def buffer(self) -> np.ndarray:
+        """
+        The ring buffer itself (read-only), for consumers that can wrap around, as textures with repeat addressing.
+        """
+        view = self._buffer.view()
+        view.flags.writeable = False
+        return view
+
+    @property
+    def offset(self) -> tuple:
+        """
+        Index of the buffer holding the first element of the window, in array order.
+        """
+        return tuple(self._offset)
+
+    def __repr__(self) -> str:
+        origin, step = tuple(self._origin.tolist()), tuple(self._step.tolist())
+        name = type(self).__name__
+        return "%s(shape=%s, position=%s, origin=%s, step=%s)" % (name, self.shape, self.position, origin, step)
+
+    def _coordinates(self, axis, indices):
+        # Coordinates of the elements of the buffer at the indices along an axis (in array order).
+        d = self._dims - 1 - axis
+        window = (indices - self._offset[axis]) % self.shape[axis]
+        return self._origin[d] + self._step[d] * (self._position[axis] + window)
+
+    def _fill(self, regions):
+        # Generates the noise of the boxes of the buffer in the product of the slices along each axis.
+        generate = getattr(self._simplex, "noise%darray" % self._dims)
+        for box in itertools.product(*regions):
+            coords = [self._coordinates(a, np.arange(s.start, s.stop)) for a, s in enumerate(box)]
+            self._buffer[box] = generate(*reversed(coords))
+
+    def _shift(self, deltas):
+        deltas = [operator.index(delta) for delta in reversed(deltas)]  # In array order
+        if len(deltas) != self._dims:
+            raise TypeError("Expected %d deltas, got %d" % (self._dims, len(deltas)))
+        if any(abs(delta) >= n for delta, n in zip(deltas, self.shape)):
+            # Nothing of the window is kept
+            self._position = [p + delta for p, delta in zip(self._position, deltas)]
+            self._offset = [0] * self._dims
+            self._fill([[slice(0, n)] for n in self.shape])
+            return
+        # The exposed elements are split into slabs, one per axis moved along: the slab of an axis spans the exposed
+        # range along it, the kept range along the axes before it (their exposed ranges being in their own slabs) and
+        # the whole window along the axes after it.
+        kept, exposed = [], []
+        for axis, (delta, n) in enumerate(zip(deltas, self.shape)):
+            self._position[axis] += delta
+            self._offset[axis] = (self._offset[axis] + delta) % n
+            first = self._offset[axis] + (n - delta if delta > 0 else 0)
+            exposed.append(_ring(first % n, abs(delta), n))
+            kept.append(_ring((self._offset[axis] + (0 if delta > 0 else -delta)) % n, n - abs(delta), n))
+        for axis, delta in enumerate(deltas):
+            if delta:
+                full = [_ring(0, n, n) for n in self.shape[axis + 1 :]]
+                self._fill(kept[:axis] + [exposed[axis]] + full)
+
+    def window(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        Copies the window out of the ring buffer, in order.
+        :param out: array of the shape of the window to copy it into, instead of a new array
+        :return:    array of the shape of the window
+        """
+        if out is None:
+            out = np.empty(self.shape, dtype=np.double)
+        elif out.shape != self.shape:
+            raise ValueError("Expected out to be an array of shape %s" % (self.shape,))
+        regions = [_ring(offset, n, n) for offset, n in zip(self._offset, self.shape)]
+        for box in itertools.product(*regions):
+            starts = [(s.start - offset) % n for s, offset, n in zip(box, self._offset, self.shape)]
+            target = tuple(slice(i, i + s.stop - s.start) for i, s in zip(starts, box))
+            out[target] = self._buffer[box]
+        return out
+
+    def __array__(self, dtype=None, copy=None):
+        if copy is False:
+            raise ValueError("The window of a scrolling noise can't be converted to an array without a copy")
+        window = self.window()
+        return window if dtype is None else window.astype(dtype, copy=False)
+
+
+class ScrollingNoise2D(_ScrollingNoise):
+    """
+    Window of 2D noise on a regular grid, moved by whole cells with shift(). The element [j, i] of the window holds
+    the noise at x = origin[0] + (position[0] + i) * step[0], y = origin[1] + (position[1] + j) * step[1].
+    """
+
+    __slots__ = ()
+    _dims = 2
+
+    def shift(self, dx: int, dy: int) -> None:
+        """
+        Moves the window by dx cells along x and dy cells along y, generating only the newly exposed samples.
+        """
+        self._shift((dx, dy))
+
+
+class ScrollingNoise3D(_ScrollingNoise):
+    """
+    Window of 3D noise on a regular grid, moved by whole cells with shift(). The element [k, j, i] of the window
+    holds the noise at x = origin[0] + (position[0] + i) * step[0], and so on for y and z.
+    """
+
+    __slots__ = ()
+    _dims = 3
+
+    def shift(self, dx: int, dy: int, dz: int) -> None:
+        """
+        Moves the window by dx, dy and dz cells along x, y and z, generating only the newly exposed samples.
+        """
+        self._shift((dx, dy, dz))
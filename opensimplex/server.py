@@ -0,0 +1,249 @@
+# Local tile server, serving 2D noise tiles over HTTP:
+#
+#   python -m opensimplex.server --port 8000 --workers 4
+#   curl http://localhost:8000/tile/3/2/5.png?seed=42&octaves=4
+#
+# Tiles are addressed as /tile/{z}/{x}/{y}.{npy,f32,png}, where the tile (x, y) of zoom level z spans extent / 2**z
+# units of the noise along each axis (the tile of zoom 0 spans --extent units from the origin). The samples are taken
+# at the top left corner of the pixels, so neighbouring tiles join up. The query takes the seed, octaves, persistence
+# and size (pixels along each side) of the tile.
+#
+# The tiles are rendered by a pool of worker threads (or processes, with --processes) running the array kernels, and
+# the encoded responses are kept in an in-memory LRU cache. A request for a tile already being rendered waits for it
+# instead of rendering it again. The ETag of a tile is derived from its parameters and the version of the module (the
+# noise of a seed never changes within a version), so a conditional request is answered without rendering anything.
+
+import argparse
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import io
+import multiprocessing
+import re
+import sys
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import __version__
+from .api import DEFAULT_SEED, OpenSimplex
+from .constants import np
+from .writers import NpyWriter, PngWriter, RawWriter
+
+_TILE = re.compile(r"^/tile/(\d+)/(\d+)/(\d+)\.(npy|f32|png)$")
+_CONTENT_TYPES = {"npy": "application/octet-stream", "f32": "application/octet-stream", "png": "image/png"}
+_MAX_ZOOM = 30
+_MAX_SIZE = 2048
+_MAX_OCTAVES = 16
+
+
+@functools.lru_cache(maxsize=64)
+def _simplex(seed):
+    return OpenSimplex(seed)
+
+
+def _render(key, extent):
+    # Renders and encodes a tile. A module level function, so it can be run by a process pool.
+    z, x, y, kind, seed, octaves, persistence, size = key
+    span = extent / 2**z
+    step = span / size
+    ix = x * span + step * np.arange(size)
+    iy = y * span + step * np.arange(size)
+    simplex = _simplex(seed)
+    noise = simplex.noise2array(ix, iy)
+    for k in range(1, octaves):
+        noise += simplex.noise2array(ix * 2**k, iy * 2**k) * persistence**k
+    if octaves > 1:
+        noise /= sum(persistence**k for k in range(octaves))
+    body = io.BytesIO()
+    if kind == "png":
+        writer = PngWriter(body, noise.shape)
+    else:
+        writer = (NpyWriter if kind == "npy" else RawWriter)(body, noise.shape, "float32")
+    with writer:
+        writer.write(noise.reshape(-1))
+    return body.getvalue()
+
+
+class _LRU(object):
+    # Least recently used responses, bounded by their total size in bytes.
+    def __init__(self, capacity: int) -> None:
+        self._capacity = capacity
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body: bytes) -> None:
+        if len(body) > self._capacity:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self._capacity:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class TileServer(ThreadingHTTPServer):
+    """
+    HTTP server of noise tiles, see the top of server.py for the endpoints. Each connection is handled by its own
+    thread, the tiles are rendered by the worker pool.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 8000),
+        workers: int = 4,
+        processes: bool = False,
+        cache_size: int = 256 * 2**20,
+        extent: float = 16.0,
+        quiet: bool = False,
+    ) -> None:
+        super().__init__(address, _TileHandler)
+        if processes:
+            # Spawned rather than forked, as forking a process already running the kernels' threads isn't safe
+            context = multiprocessing.get_context("spawn")
+            self.pool = concurrent.futures.ProcessPoolExecutor(workers, mp_context=context)
+        else:
+            self.pool = concurrent.futures.ThreadPoolExecutor(workers)
+        self.cache = _LRU(cache_size)
+        self.extent = float(extent)
+        self.quiet = quiet
+        self._rendering = {}
+        self._lock = threading.Lock()
+
+    def tile(self, key) -> bytes:
+        """
+        Returns the encoded tile of the key, from the cache or rendered by the worker pool.
+        """
+        body = self.cache.get(key)
+        if body is not None:
+            return body
+        with self._lock:
+            future = self._rendering.get(key)
+            submitted = future is None
+            if submitted:
+                future = self._rendering[key] = self.pool.submit(_render, key, self.extent)
+        if submitted:
+            # Outside of the lock, as the callback runs right away (in this thread) if the tile is already rendered
+            future.add_done_callback(functools.partial(self._rendered, key))
+        return future.result()
+
+    def _rendered(self, key, future):
+        with self._lock:
+            del self._rendering[key]
+        if future.exception() is None:
+            self.cache.put(key, future.result())
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "opensimplex/" + __version__
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        match = _TILE.match(url.path)
+        if match is None:
+            self.send_error(404, "Expected /tile/{z}/{x}/{y}.{npy,f32,png}")
+            return
+        try:
+            key = self._key(match, urllib.parse.parse_qs(url.query))
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        etag = '"%s"' % hashlib.sha1(repr((__version__, self.server.extent, key)).encode()).hexdigest()
+        headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+        if etag in (tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")):
+            self._respond(304, headers, b"")
+            return
+        headers["Content-Type"] = _CONTENT_TYPES[key[3]]
+        if key[3] == "f32":
+            headers["X-Tile-Shape"] = "%d,%d" % (key[-1], key[-1])
+        try:
+            body = self.server.tile(key)
+        except Exception as e:
+            self.log_error("Rendering %s failed: %r", url.path, e)
+            self.send_error(500, "Rendering the tile failed")
+            return
+        self._respond(200, headers, body)
+
+    def _key(self, match, query):
+        z, x, y = (int(group) for group in match.groups()[:3])
+        if z > _MAX_ZOOM or x >= 2**z or y >= 2**z:
+            raise ValueError("Tile (%d, %d) is out of range at zoom level %d" % (x, y, z))
+
+        def value(name, default):
+            return query.get(name, [default])[-1]
+
+        seed = int(value("seed", DEFAULT_SEED))
+        octaves = int(value("octaves", 1))
+        persistence = float(value("persistence", 0.5))
+        size = int(value("size", 256))
+        if not (1 <= size <= _MAX_SIZE and 1 <= octaves <= _MAX_OCTAVES):
+            raise ValueError("Expected a size of 1 to %d and 1 to %d octaves" % (_MAX_SIZE, _MAX_OCTAVES))
+        return (z, x, y, match.group(4), seed, octaves, persistence, size)
+
+    def _respond(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m opensimplex.server", description="Serves 2D OpenSimplex noise tiles over HTTP."
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on (default: 8000)")
+    parser.add_argument("--workers", type=int, default=4, help="number of tiles rendered at a time (default: 4)")
+    parser.add_argument("--processes", action="store_true", help="render in worker processes instead of threads")
+    parser.add_argument("--cache", type=float, default=256, help="size of the response cache in MiB (default: 256)")
+    parser.add_argument("--extent", type=float, default=16.0, help="noise units spanned by the zoom 0 tile")
+    parser.add_argument("--quiet", action="store_true", help="don't log the requests")
+    args = parser.parse_args(argv)
+
+    server = TileServer(
+        (args.host, args.port), args.workers, args.processes, int(args.cache * 2**20), args.extent, args.quiet
+    )
+    print("Serving noise tiles on http://%s:%d/tile/{z}/{x}/{y}.png" % server.server_address[:2], file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
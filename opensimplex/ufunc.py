@@ -0,0 +1,99 @@
+from . import api
+from .constants import np
+from .internals import _noise2v, _noise3v, _noise4v
+
+"""
+Noise functions following the calling conventions of Numpy's ufuncs.
+
+The coordinates can be scalars or arrays of any shape, which are broadcasted against each other. Just like a ufunc,
+the functions accept the `out`, `where`, `casting` and `dtype` keyword arguments. The noise is generated using the
+current seed of the module (see opensimplex.seed()).
+"""
+
+
+def noise2(x, y, /, out=None, *, where=True, casting="same_kind", dtype=None):
+    """
+    Generate 2D OpenSimplex noise for the broadcasted X,Y coordinates.
+    :param x:       x coordinates as array_like
+    :param y:       y coordinates as array_like
+    :param out:     optional writeable array to write the noise into, its shape must match the broadcasted
+                    coordinates (and its dtype the dtype argument, if both are given)
+    :param where:   optional boolean array_like, noise is only generated where it's True
+    :param casting: casting rule used for the inputs and output, as in numpy
+    :param dtype:   dtype of the returned array, float64 by default
+    :return:        generated noise, as an array of the broadcasted shape (or a scalar if all inputs are scalars)
+
+    >>> noise2([0.5, 1.5], [[0.5], [1.5]])
+    array([[-0.43906247,  0.2948007 ],
+           [ 0.1237376 , -0.42146064]])
+    """
+    tables = (api._default._perm,)
+    return _apply(_noise2v, (x, y), tables, out, where, casting, dtype)
+
+
+def noise3(x, y, z, /, out=None, *, where=True, casting="same_kind", dtype=None):
+    """
+    Generate 3D OpenSimplex noise for the broadcasted X,Y,Z coordinates.
+    See noise2() for the description of the keyword arguments.
+
+    >>> noise3(0.5, 0.5, [0.5, 1.5])
+    array([ 0.39504956, -0.06307605])
+    """
+    tables = (api._default._perm, api._default._perm_grad_index3)
+    return _apply(_noise3v, (x, y, z), tables, out, where, casting, dtype)
+
+
+def noise4(x, y, z, w, /, out=None, *, where=True, casting="same_kind", dtype=None):
+    """
+    Generate 4D OpenSimplex noise for the broadcasted X,Y,Z,W coordinates.
+    See noise2() for the description of the keyword arguments.
+
+    >>> noise4(0.5, 0.5, 0.5, [0.5, 1.5])
+    array([0.0452036, 0.1731746])
+    """
+    tables = (api._default._perm,)
+    return _apply(_noise4v, (x, y, z, w), tables, out, where, casting, dtype)
+
+
+################################################################################
+
+
+def _apply(kernel, coords, tables, out, where, casting, dtype):
+    coords = [np.asarray(c) for c in coords]
+    for c in coords:
+        if not np.can_cast(c.dtype, np.double, casting):
+            raise TypeError("Cannot cast input from %s to float64 with casting rule '%s'" % (c.dtype, casting))
+
+    if isinstance(out, tuple):
+        if len(out) != 1:
+            raise ValueError("The 'out' tuple must have exactly one entry")
+        out = out[0]
+    shapes = [c.shape for c in coords]
+    if out is not None:
+        shapes.append(out.shape)
+    shape = np.broadcast_shapes(*shapes)
+    if out is not None:
+        if out.shape != shape:
+            raise ValueError("Non-broadcastable output operand with shape %s doesn't match %s" % (out.shape, shape))
+        if not out.flags.writeable:
+            raise ValueError("output array is read-only")
+        if dtype is not None and np.dtype(dtype) != out.dtype:
+            raise TypeError("The output array has dtype %s, which conflicts with dtype=%s" % (out.dtype, dtype))
+    result = out
+    if result is None:
+        result = np.empty(shape, dtype=np.double if dtype is None else dtype)
+
+    flat = [np.broadcast_to(c, shape).astype(np.double, copy=False).ravel() for c in coords]
+    mask = np.broadcast_to(np.asarray(where, dtype=np.bool_), shape).ravel()
+
+    if result.dtype == np.double and result.flags.c_contiguous:
+        # The kernel can write straight into the output array.
+        kernel(*flat, mask, result.reshape(-1), *tables)
+    else:
+        buffer = np.empty(result.size, dtype=np.double)
+        kernel(*flat, mask, buffer, *tables)
+        np.copyto(result, buffer.reshape(shape), casting=casting, where=mask.reshape(shape))
+
+    if out is None and result.ndim == 0:
+        return result[()]
+    return result
@@ -0,0 +1,420 @@
+# Variants of the noise kernels in internals.py, which are derived from the source code of the original kernels
+# instead of being written (and maintained) a second time. The source is parsed, rewritten by an AST transformer
+# and compiled into the namespace of the internals module, so the variants keep using the same helpers and constants.
+#
+# The transformers count the vertices they rewrite (the `if attn > 0:` branches, one per _extrapolate call), and
+# deriving fails if the kernel was changed in a way they no longer recognize, rather than giving a wrong variant.
+
+import ast
+import inspect
+
+from . import internals
+from .internals import njit, prange, np, _noise2, _noise3, _noise4
+
+
+def _derive(func, name, transformer):
+    func = getattr(func, "py_func", func)
+    try:
+        lines, start = inspect.getsourcelines(func)
+    except (OSError, TypeError) as e:
+        raise RuntimeError(
+            "Can't derive %s: the source of %s isn't available, as in installs without the .py files"
+            % (name, func.__name__)
+        ) from e
+    source = "".join(lines)
+    tree = ast.parse(source)
+    function = tree.body[0]
+    function.name = name
+    function.decorator_list = []
+    vertices = sum(1 for node in ast.walk(tree) if isinstance(node, ast.Call) and _is_extrapolation(node))
+    transformer.source = source
+    transformer.line_offset = start - 1
+    transformer.vertices = 0
+    tree = transformer.visit(tree)
+    if transformer.vertices != vertices:
+        raise RuntimeError(
+            "Can't derive %s: matched %d of the %d vertices of %s, the kernel no longer fits the rewrite patterns"
+            % (name, transformer.vertices, vertices, func.__name__)
+        )
+    ast.increment_lineno(tree, start - 1)
+    tree = ast.fix_missing_locations(tree)
+    namespace = {}
+    exec(compile(tree, internals.__file__, "exec"), vars(internals), namespace)
+    return namespace[name]
+
+
+def _statement(code):
+    return ast.parse(code).body[0]
+
+
+def _is_attenuation(test):
+    # Tells if an if statement tests the attenuation of a vertex (`if attn > 0:`), i.e. if the vertex contributes.
+    return isinstance(test, ast.Compare) and getattr(test.left, "id", "").startswith("attn")
+
+
+def _is_extrapolation(call):
+    return getattr(call.func, "id", "").startswith("_extrapolate")
+
+
+def _extrapolation(node):
+    # The _extrapolate call of the body of an attenuation branch.
+    calls = [n for stmt in node.body for n in ast.walk(stmt) if isinstance(n, ast.Call) and _is_extrapolation(n)]
+    if len(calls) != 1:
+        raise RuntimeError(
+            "Expected one _extrapolate call in the branch of line %d, got %d" % (node.lineno, len(calls))
+        )
+    return calls[0]
+
+
+################################################################################
+# Profiling variants, counting how often each branch is taken.
+
+
+class _Profiler(ast.NodeTransformer):
+    # Adds a `counters` argument to the kernel and increments a counter at the start of each branch. Branches testing
+    # an attenuation (`if attn > 0:`) tells if a vertex contributed to the sample, all others are the region tests.
+    def __init__(self):
+        self.labels = ["samples"]
+        self.kinds = ["samples"]
+
+    def visit_FunctionDef(self, node):
+        self.generic_visit(node)
+        node.args.args.append(ast.arg(arg="counters", annotation=None))
+        node.body.insert(0, _statement("counters[0] += 1"))
+        return node
+
+    def visit_If(self, node):
+        label = "%d: %s" % (node.lineno + self.line_offset, ast.get_source_segment(self.source, node.test))
+        is_attn = _is_attenuation(node.test)
+        self.generic_visit(node)
+        if is_attn:
+            _extrapolation(node)
+            self.vertices += 1
+        for branch, outcome in ((node.body, True), (node.orelse, False)):
+            branch.insert(0, _statement("counters[%d] += 1" % len(self.labels)))
+            self.labels.append((label, outcome))
+            self.kinds.append(("contribution" if outcome else "early_out") if is_attn else "branch")
+        return node
+
+
+def _profile_driver(kernel, dims):
+    # Each chunk of samples gets its own row of counters, so the chunks can run in parallel.
+    if dims == 2:
+
+        @njit(parallel=True)
+        def driver(x, y, perm, counters):
+            chunk = -(-x.size // counters.shape[0])
+            for c in prange(counters.shape[0]):
+                for i in range(c * chunk, min(x.size, (c + 1) * chunk)):
+                    kernel(x[i], y[i], perm, counters[c])
+
+    elif dims == 3:
+
+        @njit(parallel=True)
+        def driver(x, y, z, perm, perm_grad_index3, counters):
+            chunk = -(-x.size // counters.shape[0])
+            for c in prange(counters.shape[0]):
+                for i in range(c * chunk, min(x.size, (c + 1) * chunk)):
+                    kernel(x[i], y[i], z[i], perm, perm_grad_index3, counters[c])
+
+    else:
+
+        @njit(parallel=True)
+        def driver(x, y, z, w, perm, counters):
+            chunk = -(-x.size // counters.shape[0])
+            for c in prange(counters.shape[0]):
+                for i in range(c * chunk, min(x.size, (c + 1) * chunk)):
+                    kernel(x[i], y[i], z[i], w[i], perm, counters[c])
+
+    return driver
+
+
+_PROFILE_CHUNKS = 256
+_profilers = {}
+
+
+def _profile(dims, coords, tables):
+    if dims not in _profilers:
+        kernel = {2: _noise2, 3: _noise3, 4: _noise4}[dims]
+        profiler = _Profiler()
+        func = _derive(kernel, "_noise%d_profile" % dims, profiler)
+        _profilers[dims] = (_profile_driver(njit()(func), dims), profiler.labels, profiler.kinds)
+    driver, labels, kinds = _profilers[dims]
+
+    coords = [np.ascontiguousarray(c, dtype=np.double).ravel() for c in coords]
+    if any(c.size != coords[0].size for c in coords):
+        raise ValueError("Expected coordinates of equal sizes, got %s" % ", ".join(str(c.size) for c in coords))
+    counters = np.zeros((min(_PROFILE_CHUNKS, max(coords[0].size, 1)), len(labels)), dtype=np.int64)
+    driver(*coords, *tables, counters)
+    totals = counters.sum(axis=0)
+
+    report = {"samples": int(totals[0]), "vertices": 0, "early_outs": 0, "branches": {}}
+    for label, kind, count in zip(labels[1:], kinds[1:], totals[1:]):
+        if kind == "contribution":
+            report["vertices"] += int(count)
+        elif kind == "early_out":
+            report["early_outs"] += int(count)
+        else:
+            name, outcome = label
+            taken = report["branches"].setdefault(name, [0, 0])
+            taken[0 if outcome else 1] += int(count)
+    branches = sorted(report["branches"].items(), key=lambda item: int(item[0].split(":")[0]))
+    report["branches"] = {name: tuple(taken) for name, taken in branches}
+    return report
+
+
+################################################################################
+# Vertex tables for the lookup kernels (see internals._noise3_lookup()), generated from the original kernels.
+
+
+class _VertexRecorder(ast.NodeTransformer):
+    # Adds a `recorder` argument to the kernel (see _Recorder), which gets the offset (from the super-cell origin) and
+    # the displacements of each lattice vertex the kernel evaluates, in order. The displacements from the origin
+    # (dx0, dy0, ...) are traced, so the recorded displacements tell which constants the kernel subtracted from them.
+    def __init__(self, dims):
+        self.dims = dims
+
+    def visit_FunctionDef(self, node):
+        self.generic_visit(node)
+        node.args.args.append(ast.arg(arg="recorder", annotation=None))
+        origins = ["d%s0" % axis for axis in "xyzw"[: self.dims]]
+        body = []
+        for stmt in node.body:
+            body.append(stmt)
+            name = getattr(stmt.targets[0], "id", None) if isinstance(stmt, ast.Assign) else None
+            if name in origins:
+                body.append(_statement("%s = recorder.trace(%s)" % (name, name)))
+                origins.remove(name)
+        if origins:
+            raise RuntimeError("Expected the kernel to assign %s" % ", ".join(origins))
+        node.body = body
+        return node
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+        if not _is_attenuation(node.test):
+            return node
+        call = _extrapolation(node)
+        self.vertices += 1
+        first = 2 if self.dims == 3 else 1  # Skips the permutation table(s)
+        args = [ast.get_source_segment(self.source, arg) for arg in call.args[first:]]
+        offsets = ["(%s) - %ssb" % (arg, base) for arg, base in zip(args[: self.dims], "xyzw")]
+        record = "recorder.vertex((%s), (%s))" % (", ".join(offsets), ", ".join(args[self.dims :]))
+        # The traced displacements are passed to the compiled _extrapolate as floats
+        call.args[first + self.dims :] = [
+            ast.Call(ast.Name("float", ast.Load()), [arg], []) for arg in call.args[first + self.dims :]
+        ]
+        return [_statement(record), node]
+
+
+class _Displacement(object):
+    # Displacement from a lattice vertex, traced from the displacement from the super-cell origin: the constants
+    # subtracted from it (adding is subtracting the negation, which is exact), in order.
+    __slots__ = ("value", "steps")
+
+    def __init__(self, value, steps=()):
+        self.value = value
+        self.steps = steps
+
+    def __sub__(self, other):
+        return _Displacement(self.value - other, self.steps + (float(other),))
+
+    def __add__(self, other):
+        return _Displacement(self.value + other, self.steps + (-float(other),))
+
+    def __mul__(self, other):
+        return self.value * getattr(other, "value", other)
+
+    __rmul__ = __mul__
+
+    def __float__(self):
+        return float(self.value)
+
+
+class _Recorder(object):
+    def __init__(self):
+        self.vertices = []
+
+    def trace(self, value):
+        return _Displacement(value)
+
+    def vertex(self, offsets, displacements):
+        if not all(isinstance(d, _Displacement) for d in displacements):
+            raise RuntimeError("Expected the displacements of the vertices to be traced from the origin's")
+        self.vertices.append((offsets, [d.steps for d in displacements]))
+
+
+# The rarest regions cover about 0.7% (3D) and 0.03% (4D) of the super-cell.
+_LOOKUP_SAMPLES = {3: 20000, 4: 200000}
+# Constants subtracted from each displacement (unused ones are zero, subtracting zero is exact)
+_LOOKUP_STEPS = 3
+_lookup = {}
+
+
+def _lookup_tables(dims):
+    # Samples the super-cell to find every region code, then records the vertices used by the original kernel for
+    # one point inside each region (the regions were verified to always use the same vertices), along with the
+    # constants subtracted from the displacements, so the lookup kernels can repeat the exact same arithmetic.
+    # Regions that are never found are left at -1 and make the lookup kernels fall back to the original.
+    if dims in _lookup:
+        return _lookup[dims]
+    kernel, region, codes, squish = {
+        3: (_noise3, internals._region3, 2**8, internals.SQUISH_CONSTANT3),
+        4: (_noise4, internals._region4, 2**12, internals.SQUISH_CONSTANT4),
+    }[dims]
+    recorded = _derive(kernel, "_noise%d_vertices" % dims, _VertexRecorder(dims))
+    perm, perm_grad_index3 = internals._init(0)
+    tables = (perm, perm_grad_index3) if dims == 3 else (perm,)
+
+    rng = np.random.default_rng(seed=0)
+    points = {}
+    for ins in rng.uniform(0.001, 0.999, (_LOOKUP_SAMPLES[dims], dims)):
+        code, margin = region(*ins)
+        if code not in points and margin > 0.001:
+            points[code] = ins + ins.sum() * squish  # Undoes the stretch, so the point lands on `ins` in the kernel
+    lists = []
+    for code, point in points.items():
+        recorder = _Recorder()
+        recorded(*point, *tables, recorder)
+        lists.append((code, recorder.vertices))
+
+    size = max(len(vertices) for _, vertices in lists)
+    regions = np.full(codes, -1, dtype=np.int64)
+    offsets = np.zeros((len(lists), size, dims), dtype=np.int64)
+    steps = np.zeros((len(lists), size, dims, _LOOKUP_STEPS), dtype=np.double)
+    counts = np.zeros(len(lists), dtype=np.int64)
+    for i, (code, vertices) in enumerate(lists):
+        regions[code] = i
+        counts[i] = len(vertices)
+        for j, (offset, displacements) in enumerate(vertices):
+            offsets[i, j] = offset
+            for k, constants in enumerate(displacements):
+                if len(constants) > _LOOKUP_STEPS:
+                    raise RuntimeError(
+                        "Expected at most %d steps per displacement, got %d" % (_LOOKUP_STEPS, len(constants))
+                    )
+                steps[i, j, k, : len(constants)] = constants
+    _lookup[dims] = (regions, offsets, steps, counts)
+    return _lookup[dims]
+
+
+################################################################################
+# Multi-component variants, evaluating several noise fields (one permutation table each) at the same point with a
+# single pass over the lattice logic, for vector and curl noise.
+
+
+class _Components(ast.NodeTransformer):
+    # Replaces the permutation table argument(s) with stacked tables (one row for each component) and an `out` array,
+    # which gets the noise of each component instead of `value`. The contribution of each vertex is added by the
+    # `accumulate` helper (see internals._accumulate2()), given the attenuation, the vertex and its displacement.
+    def __init__(self, dims, accumulate):
+        self.dims = dims
+        self.accumulate = accumulate
+        self.tables = ["perms", "grad_indices"] if dims == 3 else ["perms"]
+
+    def visit_FunctionDef(self, node):
+        self.cleared = False
+        self.generic_visit(node)
+        if not self.cleared:
+            raise RuntimeError("Expected the kernel to start from `value = 0`")
+        node.args.args = node.args.args[: self.dims] + [ast.arg(arg=name) for name in self.tables + ["out"]]
+        return node
+
+    def visit_Assign(self, node):
+        if getattr(node.targets[0], "id", None) == "value":
+            self.cleared = True
+            return _statement("out[:] = 0")
+        return node
+
+    def visit_Return(self, node):
+        # `return value / NORM_CONSTANT` becomes `out /= NORM_CONSTANT`
+        value = node.value
+        if not (
+            isinstance(value, ast.BinOp) and isinstance(value.op, ast.Div) and getattr(value.left, "id", "") == "value"
+        ):
+            raise RuntimeError("Expected the kernel to return `value / NORM_CONSTANT`, got line %d" % node.lineno)
+        return ast.AugAssign(target=ast.Name(id="out", ctx=ast.Store()), op=ast.Div(), value=node.value.right)
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+        if not _is_attenuation(node.test):
+            return node
+        call = _extrapolation(node)
+        self.vertices += 1
+        args = [ast.get_source_segment(self.source, arg) for arg in call.args[len(self.tables) :]]
+        code = "%s(out, %s, %s)" % (self.accumulate, node.test.left.id, ", ".join(self.tables + args))
+        node.body = [_statement(code)]
+        return node
+
+
+def _vector_driver(kernel, dims):
+    if dims == 2:
+
+        @njit(parallel=True)
+        def driver(x, y, perms):
+            noise = np.empty((y.size, x.size, perms.shape[0]), dtype=np.double)
+            for y_i in prange(y.size):
+                for x_i in range(x.size):
+                    kernel(float(x[x_i]), float(y[y_i]), perms, noise[y_i, x_i])
+            return noise
+
+    else:
+
+        @njit(parallel=True)
+        def driver(x, y, z, perms, grad_indices):
+            noise = np.empty((z.size, y.size, x.size, perms.shape[0]), dtype=np.double)
+            for z_i in prange(z.size):
+                for y_i in range(y.size):
+                    for x_i in range(x.size):
+                        point = noise[z_i, y_i, x_i]
+                        kernel(float(x[x_i]), float(y[y_i]), float(z[z_i]), perms, grad_indices, point)
+            return noise
+
+    return driver
+
+
+def _curl_driver(kernel, dims):
+    # The gradients of the components are only kept for the point being evaluated, they're turned into the curl
+    # right away: (dn/dy, -dn/dx) in 2D, the curl of the vector potential (n0, n1, n2) in 3D.
+    if dims == 2:
+
+        @njit(parallel=True)
+        def driver(x, y, perms):
+            curl = np.empty((y.size, x.size, 2), dtype=np.double)
+            for y_i in prange(y.size):
+                gradient = np.empty((1, 3), dtype=np.double)
+                for x_i in range(x.size):
+                    kernel(float(x[x_i]), float(y[y_i]), perms, gradient)
+                    curl[y_i, x_i, 0] = gradient[0, 2]
+                    curl[y_i, x_i, 1] = -gradient[0, 1]
+            return curl
+
+    else:
+
+        @njit(parallel=True)
+        def driver(x, y, z, perms, grad_indices):
+            curl = np.empty((z.size, y.size, x.size, 3), dtype=np.double)
+            for z_i in prange(z.size):
+                gradient = np.empty((3, 4), dtype=np.double)
+                for y_i in range(y.size):
+                    for x_i in range(x.size):
+                        kernel(float(x[x_i]), float(y[y_i]), float(z[z_i]), perms, grad_indices, gradient)
+                        curl[z_i, y_i, x_i, 0] = gradient[2, 2] - gradient[1, 3]
+                        curl[z_i, y_i, x_i, 1] = gradient[0, 3] - gradient[2, 1]
+                        curl[z_i, y_i, x_i, 2] = gradient[1, 1] - gradient[0, 2]
+            return curl
+
+    return driver
+
+
+_vectors = {}
+
+
+def _vector(dims, coords, tables, curl=False):
+    if (dims, curl) not in _vectors:
+        kernel = {2: _noise2, 3: _noise3}[dims]
+        suffix = "_gradient" if curl else ""
+        transformer = _Components(dims, "_accumulate%d%s" % (dims, suffix))
+        func = _derive(kernel, "_noise%d_components%s" % (dims, suffix), transformer)
+        _vectors[dims, curl] = (_curl_driver if curl else _vector_driver)(njit()(func), dims)
+    return _vectors[dims, curl](*coords, *tables)
@@ -0,0 +1,92 @@
+# Streaming file writers for the command line generator (see __main__.py). The noise is passed to write() block by
+# block, as flat arrays of samples in C order, so the whole output never has to be held in memory.
+#
+# The writers take either a path, or a binary file object (as an io.BytesIO for the tile server, see server.py) which
+# is left open when the writer is closed.
+
+import abc
+import os
+import struct
+import zlib
+
+from .constants import np
+
+
+class _Writer(abc.ABC):
+    def __init__(self, path) -> None:
+        self._owned = isinstance(path, (str, bytes, os.PathLike))
+        self._file = open(path, "wb") if self._owned else path
+
+    @abc.abstractmethod
+    def write(self, values: np.ndarray) -> None:
+        pass
+
+    def close(self) -> None:
+        if self._owned:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RawWriter(_Writer):
+    # Headerless little-endian samples.
+    def __init__(self, path, shape: tuple, dtype: str = "float32") -> None:
+        super().__init__(path)
+        self._dtype = np.dtype(dtype).newbyteorder("<")
+
+    def write(self, values: np.ndarray) -> None:
+        self._file.write(values.astype(self._dtype).tobytes())
+
+
+class NpyWriter(RawWriter):
+    # The header of the .npy format holds the shape of the whole array, so it can be written up front.
+    def __init__(self, path, shape: tuple, dtype: str = "float32") -> None:
+        super().__init__(path, shape, dtype)
+        header = {"descr": np.lib.format.dtype_to_descr(self._dtype), "fortran_order": False, "shape": tuple(shape)}
+        np.lib.format.write_array_header_2_0(self._file, header)
+
+
+class PngWriter(_Writer):
+    # Grayscale PNG of 8 or 16 bits per sample, mapping the noise range [-1, 1] onto the full range of the samples.
+    # The image is shape[-1] samples wide, the leading dimensions are stacked into its rows. Blocks don't have to end
+    # on a row boundary, the samples of an incomplete row are kept until the rest of the row arrives.
+    def __init__(self, path, shape: tuple, bits: int = 8) -> None:
+        width, height = shape[-1], int(np.prod(shape[:-1]))
+        if not (0 < width < 2**31 and 0 < height < 2**31):
+            raise ValueError("Can't write a PNG image of %d x %d pixels" % (width, height))
+        super().__init__(path)
+        self._width = width
+        self._dtype = np.dtype(np.uint8 if bits == 8 else np.uint16)
+        self._scale = (2**bits - 1) / 2
+        self._pending = np.empty(0, dtype=self._dtype)
+        self._compressor = zlib.compressobj(6)
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bits, 0, 0, 0, 0))
+
+    def write(self, values: np.ndarray) -> None:
+        samples = np.rint((np.clip(values, -1.0, 1.0) + 1.0) * self._scale).astype(self._dtype)
+        samples = np.concatenate([self._pending, samples])
+        rows = samples.size // self._width
+        self._pending = samples[rows * self._width :]
+        # Each row starts with its filter type, 0 (none)
+        stride = self._width * self._dtype.itemsize
+        lines = np.zeros((rows, 1 + stride), dtype=np.uint8)
+        samples = samples[: rows * self._width].astype(self._dtype.newbyteorder(">"))  # PNG samples are big-endian
+        lines[:, 1:] = samples.view(np.uint8).reshape(rows, stride)
+        self._chunk(b"IDAT", self._compressor.compress(lines.tobytes()))
+
+    def close(self) -> None:
+        if self._compressor is not None:
+            self._chunk(b"IDAT", self._compressor.flush())
+            self._chunk(b"IEND", b"", empty=True)
+            self._compressor = None
+        super().close()
+
+    def _chunk(self, kind: bytes, data: bytes, empty: bool = False) -> None:
+        if data or empty:
+            self._file.write(struct.pack(">I", len(data)) + kind + data)
+            self._file.write(struct.pack(">I", zlib.crc32(kind + data)))
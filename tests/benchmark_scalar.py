@@ -0,0 +1,39 @@
+import timeit
+
+import opensimplex as simplex
+from opensimplex.internals import _noise2, _noise3, _noise4
+
+# Latency of single samples through the different entry points, in nanoseconds per call:
+#
+#   PYTHONPATH=. python tests/benchmark_scalar.py
+#
+# "module" is opensimplex.noise2() etc., "method" calls an OpenSimplex instance, "kernel" calls the compiled kernel
+# with the tables (through numba's dispatcher), and "scalar" the functions returned by opensimplex.scalar_noise().
+
+number = 200000
+
+
+def latency(statement, namespace):
+    # Best of 5 runs, in ns per call
+    return min(timeit.repeat(statement, globals=namespace, number=number, repeat=5)) / number * 1e9
+
+
+if __name__ == "__main__":
+    simplex.seed(0)
+    gen = simplex.OpenSimplex(0)
+    perm, perm_grad_index3 = gen.jit_state
+    namespace = dict(globals(), gen=gen, perm=perm, perm_grad_index3=perm_grad_index3)
+    args = {2: "0.5, 0.25", 3: "0.5, 0.25, 0.125", 4: "0.5, 0.25, 0.125, 0.0625"}
+    tables = {2: "perm", 3: "perm, perm_grad_index3", 4: "perm"}
+    print("%-4s %10s %10s %10s %10s" % ("", "module", "method", "kernel", "scalar"))
+    for dims in (2, 3, 4):
+        namespace["fast"] = simplex.scalar_noise(dims)
+        statements = [
+            "simplex.noise%d(%s)" % (dims, args[dims]),
+            "gen.noise%d(%s)" % (dims, args[dims]),
+            "_noise%d(%s, %s)" % (dims, args[dims], tables[dims]),
+            "fast(%s)" % args[dims],
+        ]
+        for statement in statements:
+            eval(statement, namespace)  # Compiles the kernels (or loads them from the cache)
+        print("%-4s %10.0f %10.0f %10.0f %10.0f" % (("%dD" % dims,) + tuple(latency(s, namespace) for s in statements)))
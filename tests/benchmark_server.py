@@ -0,0 +1,61 @@
+import argparse
+import concurrent.futures
+import random
+import threading
+import time
+import urllib.request
+
+from opensimplex.server import TileServer
+
+# Load test of the tile server (see opensimplex/server.py), measuring the tiles served per second by concurrent
+# clients. Starts a local server unless --url points at a running one:
+#
+#   PYTHONPATH=. python tests/benchmark_server.py --clients 8 --requests 400
+#
+# Each round requests tiles picked at random among the tiles of a zoom level. The first round fetches every tile
+# once (cold, all rendered), the second picks them at random again (warm, served from the cache).
+
+
+def fetch(url):
+    with urllib.request.urlopen(url) as response:
+        return len(response.read())
+
+
+def run(base, tiles, clients, label):
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(clients) as pool:
+        size = sum(pool.map(fetch, [base + tile for tile in tiles]))
+    seconds = time.perf_counter() - start
+    rates = (len(tiles) / seconds, size / seconds / 2**20)
+    print("%-5s %5d tiles in %6.2f s: %7.1f tiles/s, %6.1f MiB/s" % ((label, len(tiles), seconds) + rates))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of the tile server.")
+    parser.add_argument("--url", help="base url of a running server (default: start one)")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients (default: 8)")
+    parser.add_argument("--requests", type=int, default=400, help="tiles requested per round (default: 400)")
+    parser.add_argument("--zoom", type=int, default=5, help="zoom level of the tiles (default: 5)")
+    parser.add_argument("--format", choices=("npy", "f32", "png"), default="png", help="tile format (default: png)")
+    parser.add_argument("--query", default="size=256&octaves=4", help="query of the requests")
+    parser.add_argument("--workers", type=int, default=4, help="workers of the local server (default: 4)")
+    parser.add_argument("--processes", action="store_true", help="render in processes on the local server")
+    args = parser.parse_args()
+
+    server = None
+    if args.url is None:
+        server = TileServer(("127.0.0.1", 0), args.workers, args.processes, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.url = "http://127.0.0.1:%d" % server.server_address[1]
+    base = args.url.rstrip("/") + "/tile/"
+
+    rng = random.Random(0)
+    count = 2**args.zoom
+    tiles = ["%d/%d/%d.%s?%s" % (args.zoom, i % count, i // count, args.format, args.query) for i in range(count**2)]
+    rng.shuffle(tiles)
+    fetch(base + tiles[0])  # Compiles the kernels (or loads them from the cache)
+    run(base, tiles[1 : args.requests + 1], args.clients, "cold")
+    run(base, [rng.choice(tiles[: args.requests + 1]) for _ in range(args.requests)], args.clients, "warm")
+    if server is not None:
+        server.shutdown()
+        server.server_close()
@@ -4,11 +4,27 @@
 # 2021-10-04: As of today his project was still operating under a
 # "Unlicense" license, so I see no problem with stealing the samples.
 
+import concurrent.futures
+import ctypes
 import gzip
+import io
 import json
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
 import unittest
+import urllib.error
+import urllib.request
+import zlib
 import numpy as np
 import opensimplex as simplex
+from opensimplex import internals, variants
+from opensimplex.__main__ import main
+from opensimplex.internals import njit
+from opensimplex.server import TileServer
 
 test_seeds = (
     # No reason for picking these seeds. They're just "big".
@@ -18,6 +34,19 @@ test_seeds = (
 )
 
 
+class _InlineExecutor(concurrent.futures.Executor):
+    # Runs the tasks in the submitting thread, or fails them with the error if set.
+    error = None
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(fn(*args, **kwargs))
+        return future
+
+
 class TestOpensimplex(unittest.TestCase):
     def test_seeds(self):
         for row in test_seeds:
@@ -85,6 +114,583 @@ class TestOpensimplex(unittest.TestCase):
         self.assertEqual(True, np.array_equal(l3, n3))
         self.assertEqual(True, np.array_equal(l4, n4))
 
+    def test_array_inputs(self):
+        rng = np.random.default_rng(seed=0)
+        coords = rng.random(24) * 10
+        ix, iy, iz = coords[::2], coords[1:8:3], coords[12:16]
+        simplex.seed(0)
+        want = simplex.noise3array(ix.copy(), iy.copy(), iz.copy())
+        self.assertEqual(True, np.array_equal(want, simplex.noise3array(ix, memoryview(iy), list(iz))))
+        f32 = [c.astype(np.float32) for c in (ix, iy, iz)]
+        want = simplex.noise3array(*(c.astype(np.double) for c in f32))
+        self.assertEqual(True, np.array_equal(want, simplex.noise3array(*f32)))
+        self.assertEqual((2, 3), simplex.noise2array(np.arange(3), np.frombuffer(np.arange(2.0).tobytes())).shape)
+        # Mixed layouts and dtypes share the two builds of each kernel
+        simplex.noise3array(ix, iy.copy(), iz[::2])
+        simplex.noise3array(f32[0][::2], f32[1], f32[2])
+        if hasattr(internals._noise3a, "overloads"):
+            self.assertEqual(2, len(internals._noise3a.overloads))
+
+    def test_masks(self):
+        rng = np.random.default_rng(seed=0)
+        ix, iy, iz, iw = rng.random(7) * 9, rng.random(5) * 9, rng.random(4) * 9, rng.random(3) * 9
+        simplex.seed(0)
+        n3 = simplex.noise3array(ix, iy, iz)
+        mask = rng.random(n3.shape) < 0.2
+        values, indices = simplex.noise3array(ix, iy, iz, mask=mask)
+        self.assertEqual(True, np.array_equal(n3[mask], values))
+        self.assertEqual(True, np.array_equal(np.flatnonzero(mask), indices))
+
+        n4 = simplex.noise4array(ix, iy, iz, iw)
+        mask = rng.random(n4.shape) < 0.2
+        out = np.full(n4.shape, np.nan)
+        self.assertIs(out, simplex.noise4array(ix, iy, iz, iw, mask=np.nonzero(mask), out=out))
+        self.assertEqual(True, np.array_equal(n4[mask], out[mask]))
+        self.assertEqual(True, np.all(np.isnan(out[~mask])))
+        # Without a mask, the grid is written into out directly (float64 or float32, C-contiguous) or copied into it
+        for out in (np.empty(n3.shape), np.empty(n3.shape, dtype=np.float32), np.empty(n3.shape[::-1]).T):
+            self.assertIs(out, simplex.noise3array(ix, iy, iz, out=out))
+            self.assertEqual(True, np.array_equal(n3.astype(out.dtype), out))
+        out = np.empty(n4.shape, dtype=np.float32)
+        self.assertIs(out, simplex.noise4array(ix, iy, iz, iw, out=out))
+        self.assertEqual(True, np.array_equal(n4.astype(np.float32), out))
+
+        values, indices = simplex.noise2array(ix, iy, mask=[-1, 3])
+        self.assertEqual(True, np.array_equal(simplex.noise2array(ix, iy).ravel()[[34, 3]], values))
+        with self.assertRaises(IndexError):
+            simplex.noise2array(ix, iy, mask=[35])
+        with self.assertRaises(ValueError):
+            simplex.noise3array(ix, iy, iz, kernel="lookup", mask=[0])
+
+    def test_chunked(self):
+        rng = np.random.default_rng(seed=0)
+        ix, iy, iz, iw = rng.random(13), rng.random(7), rng.random(5), rng.random(3)
+        calls = []
+
+        def progress(done, total):
+            calls.append((done, total))
+
+        # Chunks of a few rows, of single rows and of whole slabs along the outer axes
+        noise = simplex.noise4array_chunked(ix, iy, iz, iw, progress=progress, chunk_size=40)
+        self.assertEqual(True, np.array_equal(simplex.noise4array(ix, iy, iz, iw), noise))
+        self.assertEqual([(39, 1365), (78, 1365), (91, 1365)], calls[:3])
+        self.assertEqual((1365, 1365), calls[-1])
+        noise = simplex.noise3array_chunked(ix, iy, iz, chunk_size=5)
+        self.assertEqual(True, np.array_equal(simplex.noise3array(ix, iy, iz), noise))
+        noise = simplex.noise2array_chunked(ix, iy, chunk_size=1000)
+        self.assertEqual(True, np.array_equal(simplex.noise2array(ix, iy), noise))
+        self.assertEqual((3, 0), simplex.noise2array_chunked(np.arange(0.0), np.arange(3.0)).shape)
+
+        cancel, out = threading.Event(), np.full((5, 7, 13), np.nan)
+        with self.assertRaises(simplex.Cancelled):
+            simplex.noise3array_chunked(ix, iy, iz, lambda done, total: cancel.set(), cancel, chunk_size=91, out=out)
+        self.assertEqual(91, np.count_nonzero(~np.isnan(out)))
+        with self.assertRaises(TimeoutError):
+            simplex.noise3array_chunked(ix, iy, iz, deadline=time.monotonic() - 1.0)
+
+    def test_ufuncs(self):
+        rng = np.random.default_rng(seed=0)
+        ix, iy, iz, iw = rng.random(5), rng.random((3, 1)), rng.random(5), rng.random((3, 1))
+        simplex.seed(0)
+        n2 = simplex.ufunc.noise2(ix, iy)
+        self.assertEqual((3, 5), n2.shape)
+        self.assertEqual(simplex.noise2(ix[4], iy[2, 0]), n2[2, 4])
+        n3 = simplex.ufunc.noise3(ix, iy, iz)
+        self.assertEqual(simplex.noise3(ix[1], iy[0, 0], iz[1]), n3[0, 1])
+        n4 = simplex.ufunc.noise4(ix, iy, iz, iw)
+        self.assertEqual(simplex.noise4(ix[3], iy[1, 0], iz[3], iw[1, 0]), n4[1, 3])
+        self.assertEqual(simplex.noise2(0.5, 0.5), simplex.ufunc.noise2(0.5, 0.5))
+
+        where = ix > 0.5
+        out = np.zeros((3, 5), dtype=np.float32)
+        got = simplex.ufunc.noise2(ix, iy, out=out, where=where)
+        self.assertIs(out, got)
+        self.assertEqual(True, np.array_equal(n2.astype(np.float32)[:, where], out[:, where]))
+        self.assertEqual(True, np.all(out[:, ~where] == 0))
+        with self.assertRaises(TypeError):
+            simplex.ufunc.noise2(ix, iy, out=np.zeros((3, 5), dtype=np.int64))
+        with self.assertRaises(TypeError):
+            simplex.ufunc.noise2(ix, iy, out=out, dtype=np.float64)
+        out.flags.writeable = False
+        with self.assertRaises(ValueError):
+            simplex.ufunc.noise2(ix, iy, out=out)
+
+    def test_jit(self):
+        @njit()
+        def total(state, x, y, z, w):
+            jit = simplex.jit
+            return jit.noise2(state, x, y) + jit.noise3(state, x, y, z) + jit.noise4(state, x, y, z, w)
+
+        noise = simplex.OpenSimplex(17)
+        state = noise.jit_state
+        self.assertEqual((np.uint8, np.uint8), tuple(table.dtype for table in state))
+        want = noise.noise2(0.1, 0.2) + noise.noise3(0.1, 0.2, 0.3) + noise.noise4(0.1, 0.2, 0.3, 0.4)
+        self.assertEqual(want, total(state, 0.1, 0.2, 0.3, 0.4))
+        simplex.seed(0)
+        self.assertEqual(simplex.noise3(1.5, 2.5, 3.5), simplex.jit.noise3(simplex.jit_state(), 1.5, 2.5, 3.5))
+
+    def test_scalar_noise(self):
+        rng = np.random.default_rng(seed=0)
+        points = rng.normal(size=(20, 4)) * 10
+        gen = simplex.OpenSimplex(17)
+        for dims in (2, 3, 4):
+            noise = simplex.scalar_noise(dims, seed=17)
+            method = getattr(gen, "noise%d" % dims)
+            for point in points:
+                self.assertEqual(method(*point[:dims]), noise(*point[:dims]))
+            self.assertEqual(method(*range(1, dims + 1)), noise(*range(1, dims + 1)))
+        self.assertIs(noise, gen.scalar_noise(4))
+        with self.assertRaises(ValueError):
+            gen.scalar_noise(5)
+
+    @unittest.skipIf(simplex.jit._cfunc is None, "C callbacks need numba")
+    def test_cfunc(self):
+        noise = simplex.OpenSimplex(17)
+        for dims in (2, 3, 4):
+            coords = (0.3, -1.2, 4.5, 2.0)[:dims]
+            want = getattr(noise, "noise%d" % dims)(*coords)
+            self.assertEqual(want, simplex.jit.cfunc(noise.jit_state, dims).ctypes(*coords))
+            quad = simplex.jit.cfunc(noise.jit_state, dims, kind="quad")
+            self.assertEqual(want, quad.ctypes(dims, (ctypes.c_double * dims)(*coords)))
+            self.assertEqual(True, np.isnan(quad.ctypes(dims - 1, (ctypes.c_double * dims)(*coords))))
+        self.assertIs(quad, simplex.jit.cfunc(noise.jit_state, 4, kind="quad"))
+        with self.assertRaises(ValueError):
+            simplex.jit.cfunc(noise.jit_state, 2, kind="filter")
+
+    def test_pyramid(self):
+        ix, iy = np.linspace(0, 2, 13), np.linspace(-1, 1, 9)
+        octaves, persistence = 3, 0.5
+        simplex.seed(0)
+        pyramid = simplex.noise2pyramid(ix, iy, levels=4, octaves=octaves, persistence=persistence)
+        self.assertEqual([(9, 13), (5, 7), (3, 4), (2, 2)], [level.shape for level in pyramid])
+        scale = sum(persistence**k for k in range(octaves))
+        for lod, level in enumerate(pyramid):
+            x, y = ix[:: 2**lod], iy[:: 2**lod]
+            want = np.zeros((y.size, x.size))
+            for k in range(max(octaves - lod, 1)):
+                want += simplex.noise2array(x * 2**k, y * 2**k) * (persistence**k / scale)
+            self.assertEqual(True, np.allclose(want, level, rtol=0, atol=1e-15))
+
+    def test_vector_noise(self):
+        rng = np.random.default_rng(seed=0)
+        ix, iy, iz = rng.random(6) * 9, rng.random(5) * 9, rng.random(4) * 9
+        simplex.seed(0)
+        n3 = simplex.vector3array(ix, iy, iz)
+        self.assertEqual((4, 5, 6, 3), n3.shape)
+        for c in range(3):
+            self.assertEqual(True, np.array_equal(simplex.OpenSimplex(c).noise3array(ix, iy, iz), n3[..., c]))
+        n2 = simplex.vector2array(ix, iy)
+        self.assertEqual(True, np.array_equal(simplex.OpenSimplex(1).noise2array(ix, iy), n2[..., 1]))
+
+        # Compared to central differences
+        h = 1e-6
+        dx = (simplex.noise2array(ix + h, iy) - simplex.noise2array(ix - h, iy)) / (2 * h)
+        dy = (simplex.noise2array(ix, iy + h) - simplex.noise2array(ix, iy - h)) / (2 * h)
+        curl = simplex.curl2array(ix, iy)
+        self.assertEqual(True, np.allclose(np.stack([dy, -dx], axis=-1), curl, rtol=0, atol=1e-7))
+        grad = np.empty((3, 3, 4, 5, 6))
+        for c in range(3):
+            noise = simplex.OpenSimplex(c).noise3array
+            grad[c, 0] = (noise(ix + h, iy, iz) - noise(ix - h, iy, iz)) / (2 * h)
+            grad[c, 1] = (noise(ix, iy + h, iz) - noise(ix, iy - h, iz)) / (2 * h)
+            grad[c, 2] = (noise(ix, iy, iz + h) - noise(ix, iy, iz - h)) / (2 * h)
+        want = np.stack([grad[2, 1] - grad[1, 2], grad[0, 2] - grad[2, 0], grad[1, 0] - grad[0, 1]], axis=-1)
+        self.assertEqual(True, np.allclose(want, simplex.curl3array(ix, iy, iz), rtol=0, atol=1e-7))
+
+    def test_lazy_array(self):
+        simplex.seed(0)
+        lazy = simplex.lazy_array(3, (4, 5, 6), origin=(1.0, 2.0, 3.0), step=(0.5, 0.25, 2.0))
+        self.assertEqual(((4, 5, 6), 3, np.double), (lazy.shape, lazy.ndim, lazy.dtype))
+        want = simplex.noise3array(1.0 + 0.5 * np.arange(6), 2.0 + 0.25 * np.arange(5), 3.0 + 2.0 * np.arange(4))
+        self.assertEqual(True, np.array_equal(want, np.asarray(lazy)))
+        for key in (1, (slice(None, None, -2), 2), (Ellipsis, 3), (None, 1, Ellipsis), (-1, -1, -1), (slice(1, 3),)):
+            self.assertEqual(True, np.array_equal(want[key], lazy[key]))
+        with self.assertRaises(IndexError):
+            lazy[4]
+        with self.assertRaises(IndexError):
+            lazy[[1, 2]]
+        huge = simplex.lazy_array(2, (10**9, 10**9), origin=-5e8, seed=5)
+        self.assertEqual(simplex.OpenSimplex(5).noise2(-5e8 + 2, -5e8 + 1), huge[1, 2])
+        self.assertEqual(10**36 * 8, simplex.lazy_array(4, (10**9,) * 4).nbytes)  # Past the range of int64
+
+    def test_scrolling_window(self):
+        gen = simplex.OpenSimplex(9)
+        # Including shifts wrapping around the ring, and past the size of the window
+        windows = (((6, 8), [(3, -2), (-1, 5), (0, 0), (9, 1), (-7, 0)]), ((3, 4, 5), [(2, -1, 1), (0, 4, -2)]))
+        for shape, shifts in windows:
+            dims = len(shape)
+            view = gen.scrolling_window(dims, shape, origin=0.5, step=(0.3, 0.2, 0.4)[:dims])
+            for deltas in shifts:
+                view.shift(*deltas)
+                coords = [0.5 + (0.3, 0.2, 0.4)[d] * (view.position[d] + np.arange(shape[-1 - d])) for d in range(dims)]
+                noise = getattr(gen, "noise%darray" % dims)(*coords)
+                self.assertEqual(True, np.array_equal(noise, view.window()))
+                ring = np.roll(view.buffer, [-offset for offset in view.offset], axis=tuple(range(dims)))
+                self.assertEqual(True, np.array_equal(noise, ring))
+        self.assertEqual((2, 3, -1), view.position)
+        with self.assertRaises(ValueError):
+            view.buffer[0, 0, 0] = 0.0
+        with self.assertRaises(ValueError):
+            gen.scrolling_window(4, (2, 2, 2, 2))
+
+    def test_graph(self):
+        graph = simplex.graph
+        ix, iy, iz = np.linspace(0, 3, 17), np.linspace(-1, 2, 11), np.linspace(0, 1, 3)
+        a, b = simplex.OpenSimplex(1), simplex.OpenSimplex(2)
+        mask = graph.clamp(graph.noise(seed=2, frequency=0.5) * 2.0 + 0.5, 0.0, 1.0)
+        terrain = graph.curve(graph.fbm(seed=1, octaves=3) * mask, [-1.0, 0.0, 1.0], [0.0, 0.2, 1.0])
+        fbm = sum(a.noise2array(ix * 2**k, iy * 2**k) * 0.5**k for k in range(3)) / 1.75
+        want = np.interp(fbm * np.clip(b.noise2array(ix * 0.5, iy * 0.5) * 2 + 0.5, 0, 1), [-1, 0, 1], [0, 0.2, 1])
+        kernel = terrain.compile(2)
+        self.assertEqual(True, np.allclose(want, kernel(ix, iy), rtol=0, atol=1e-12))
+        self.assertEqual(True, np.allclose(want, kernel.sample(ix, iy[:, None]), rtol=0, atol=1e-12))
+
+        # Warping, with a node used both at the original and at the warped coordinates
+        offset = graph.noise(seed=2) * 0.5
+        warped = graph.warp(graph.lerp(graph.noise(seed=1), -abs(offset), offset), offset, 1.0, 0.0).compile(3)
+        x, y, z = np.meshgrid(ix, iy, iz, indexing="ij")
+        shift = np.vectorize(b.noise3)(x, y, z) * 0.5
+        a1, b1 = np.vectorize(a.noise3)(x + shift, y + 1.0, z), np.vectorize(b.noise3)(x + shift, y + 1.0, z) * 0.5
+        lerp = a1 + (-np.abs(b1) - a1) * b1
+        self.assertEqual(True, np.allclose(lerp.transpose(2, 1, 0), warped(ix, iy, iz), rtol=0, atol=1e-12))
+
+        # Graphs differing only by their parameters share their kernel
+        other = graph.fbm(seed=5, octaves=3, frequency=3.0) * graph.clamp(graph.noise(8, 0.1) * 3.0 + 1.0, -1.0, 2.0)
+        other = graph.curve(other, [0.0, 0.5, 1.0], [1.0, 0.0, 1.0])
+        self.assertIs(kernel._kernels, other.compile(2)._kernels)
+        with self.assertRaises(ValueError):
+            graph.warp(graph.noise(), 1.0).compile(2)
+        with self.assertRaises(TypeError):
+            graph.noise() + "1"
+        with self.assertRaises(ValueError):
+            graph.ridged(octaves=0)
+
+    def test_bake(self):
+        simplex.seed(0)
+        baked = simplex.bake(2, [(0.0, 4.0), (-2.0, 2.0)], (41, 21))
+        self.assertEqual((21, 41), baked.samples.shape)
+        want = simplex.noise2array(np.linspace(0.0, 4.0, 41), np.linspace(-2.0, 2.0, 21))
+        self.assertEqual(True, np.array_equal(want, baked.samples))
+        self.assertAlmostEqual(simplex.noise2(1.3, 0.4), baked(1.3, 0.4), places=12)
+        self.assertEqual(baked(0.0, 2.0), baked(-1.0, 3.0))
+        x, y = np.linspace(0.0, 4.0, 7), np.linspace(-2.0, 2.0, 5)[:, None]
+        values = baked.sample(x, y)
+        self.assertEqual((5, 7), values.shape)
+        self.assertEqual(baked(x[3], y[2, 0]), values[2, 3])
+        error = baked.error(points=500)
+        self.assertLess(error["mean"], error["max"])
+        self.assertLess(error["max"], 0.05)
+        self.assertGreater(error["max"], simplex.bake(2, [(0.0, 4.0), (-2.0, 2.0)], (81, 41)).error(points=500)["max"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baked.npy")
+            baked = simplex.bake(3, [(0.0, 1.0)] * 3, 9, interpolation="linear", octaves=2, path=path, seed=7)
+            self.assertEqual(True, np.array_equal(np.load(path), baked.samples))
+            self.assertLess(baked.error(points=200)["max"], 0.2)
+            del baked
+        with self.assertRaises(ValueError):
+            simplex.bake(2, [(0.0, 1.0)] * 2, 5, interpolation="nearest")
+        with self.assertRaises(ValueError):
+            simplex.bake(2, [(0.0, 1.0)] * 2, 1)
+        with self.assertRaises(ValueError):
+            simplex.bake(2, [(0.0, 1.0), (2.0, 2.0)], 5)
+
+    def test_adaptive_sample(self):
+        simplex.seed(0)
+        tree = simplex.adaptive_sample(2, [(0.0, 4.0), (-2.0, 2.0)], 4, tolerance=0.02, max_depth=4)
+        points, values = tree["points"], tree["values"]
+        self.assertEqual(len(points), len(values))
+        self.assertEqual(True, np.array_equal(simplex.ufunc.noise2(points[:, 0], points[:, 1]), values))
+        self.assertEqual(True, np.array_equal([1.0, 1.0], tree["cell_size"]))
+        sizes = tree["cell_size"] / 2.0 ** tree["levels"][:, None]
+        self.assertAlmostEqual(16.0, np.sum(np.prod(sizes, axis=1)))
+        # The leaves above the maximum depth interpolate within the tolerance
+        for corner, size in zip(tree["leaves"][tree["levels"] < 4], sizes[tree["levels"] < 4]):
+            x, y = corner[0] + [0, size[0], 0, size[0]], corner[1] + [0, 0, size[1], size[1]]
+            center = simplex.noise2(corner[0] + size[0] / 2, corner[1] + size[1] / 2)
+            self.assertLessEqual(abs(center - np.mean(simplex.ufunc.noise2(x, y))), 0.02)
+        self.assertLess(len(values), (4 * 2**4 + 1) ** 2 // 2)
+        coarse = simplex.adaptive_sample(2, [(0.0, 4.0), (-2.0, 2.0)], 4, tolerance=0.05, max_depth=4)
+        self.assertLess(len(coarse["values"]), len(values))
+
+        tree = simplex.adaptive_sample(3, [(0.0, 1.0)] * 3, 2, tolerance=0.01, max_depth=2, seed=5)
+        self.assertEqual(3, tree["points"].shape[1])
+        with self.assertRaises(ValueError):
+            simplex.adaptive_sample(2, [(0.0, 1.0)], 4)
+
+    def test_command_line(self):
+        ix, iy, iz = 1.0 + 0.1 * np.arange(70), 2.0 + 0.2 * np.arange(50), 5.0 + np.arange(3)
+        noise = simplex.OpenSimplex(7).noise3array(ix, iy, iz)
+        options = ["--shape", "3", "50", "70", "--origin", "1", "2", "5", "--step", "0.1", "0.2", "1", "--seed", "7"]
+        # A tiny memory budget, to split the output into many blocks (not ending on row boundaries)
+        options += ["--memory", "0.001", "--quiet"]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "noise.npy")
+            self.assertEqual(0, main([path, "--dtype", "float64"] + options))
+            self.assertEqual(True, np.array_equal(noise, np.load(path)))
+
+            path = os.path.join(directory, "noise.png")
+            self.assertEqual(0, main([path, "--bits", "16"] + options))
+            with open(path, "rb") as f:
+                png = f.read()
+        chunks, pos = {}, 8
+        while pos < len(png):
+            (size,) = struct.unpack(">I", png[pos : pos + 4])
+            chunks.setdefault(png[pos + 4 : pos + 8], []).append(png[pos + 8 : pos + 8 + size])
+            pos += 12 + size
+        self.assertEqual((70, 150, 16), struct.unpack(">IIB", chunks[b"IHDR"][0][:9]))
+        rows = np.frombuffer(zlib.decompress(b"".join(chunks[b"IDAT"])), dtype=np.uint8).reshape(150, 141)
+        image = rows[:, 1:].copy().view(">u2").reshape(noise.shape)
+        self.assertEqual(True, np.array_equal(np.rint((noise + 1) * 65535 / 2), image))
+
+    def test_tile_server(self):
+        server = TileServer(("127.0.0.1", 0), workers=2, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = "http://127.0.0.1:%d/tile/" % server.server_address[1]
+        try:
+            # Tile (1, 0) of zoom level 1 spans [8, 16) x [0, 8) of the noise with the default extent
+            query = "?size=40&seed=5&octaves=2"
+            response = urllib.request.urlopen(base + "1/1/0.f32" + query)
+            tile = np.frombuffer(response.read(), dtype="<f4").reshape(40, 40)
+            ix, iy = 8.0 + 0.2 * np.arange(40), 0.2 * np.arange(40)
+            noise = simplex.OpenSimplex(5).noise2array(ix, iy)
+            noise = (noise + simplex.OpenSimplex(5).noise2array(ix * 2, iy * 2) * 0.5) / 1.5
+            self.assertEqual(True, np.array_equal(noise.astype(np.float32), tile))
+
+            etag = response.headers["ETag"]
+            request = urllib.request.Request(base + "1/1/0.f32" + query, headers={"If-None-Match": etag})
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(request)
+            self.assertEqual(304, context.exception.code)
+            npy = urllib.request.urlopen(base + "1/1/0.npy" + query).read()
+            self.assertEqual(True, np.array_equal(tile, np.load(io.BytesIO(npy))))
+            urllib.request.urlopen(base + "1/1/0.npy" + query).read()
+            self.assertEqual((1, 2), (server.cache.hits, server.cache.misses))
+            self.assertEqual(b"\x89PNG\r\n\x1a\n", urllib.request.urlopen(base + "0/0/0.png?size=8").read()[:8])
+
+            for path, code in (("1/2/0.png", 400), ("0/0/0.png?size=0", 400), ("0/0/0.gif", 404)):
+                with self.assertRaises(urllib.error.HTTPError) as context:
+                    urllib.request.urlopen(base + path)
+                self.assertEqual(code, context.exception.code)
+
+            # Renders finishing before their callback is added (run inline here) or failing
+            pool, server.pool = server.pool, _InlineExecutor()
+            self.assertEqual(b"\x89PNG\r\n\x1a\n", urllib.request.urlopen(base + "0/0/0.png?size=4").read()[:8])
+            server.pool.error = RuntimeError("Out of memory")
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(base + "0/0/0.png?size=5")
+            self.assertEqual(500, context.exception.code)
+            server.pool = pool
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_stats(self):
+        calls = []
+        simplex.reset_stats()
+        simplex.enable_stats(lambda *args: calls.append(args))
+        try:
+            simplex.noise2(0.5, 0.5)
+            simplex.noise3array(np.arange(3.0), np.arange(2.0), np.arange(4.0))
+            simplex.noise2array(np.arange(4.0), np.arange(3.0), mask=[0, 5])
+            simplex.noise2array(np.arange(4.0), np.arange(3.0), mask=[0, 5], out=np.empty((3, 4)))
+            ix = np.linspace(0, 4, 32)
+            noise, _ = simplex.noise3array_culled(ix, ix, ix, threshold=0.5, block_size=8)
+            simplex.noise2array_chunked(np.arange(4.0), np.arange(3.0), chunk_size=4)
+        finally:
+            simplex.disable_stats()
+        simplex.noise2(0.5, 0.5)
+
+        got = simplex.stats()["functions"]
+        self.assertEqual(
+            {"noise2", "noise2array", "noise3array", "noise3array_culled", "noise2array_chunked"}, set(got)
+        )
+        # The culled cells were never evaluated
+        self.assertEqual(np.count_nonzero(~np.isnan(noise)), got["noise3array_culled"]["points"])
+        self.assertLess(got["noise3array_culled"]["points"], noise.size)
+        self.assertEqual((1, 1, 0), (got["noise2"]["calls"], got["noise2"]["points"], got["noise2"]["bytes"]))
+        self.assertEqual(24, got["noise3array"]["points"])
+        self.assertEqual(24 * 8, got["noise3array"]["bytes"])
+        # Only the selected cells are counted, and only the (values, indices) of the first call are allocated
+        self.assertEqual((2, 4, 2 * 16), tuple(got["noise2array"][key] for key in ("calls", "points", "bytes")))
+        # The chunks of a chunked call aren't recorded as noise2array() calls of their own
+        self.assertEqual(
+            (1, 12, 12 * 8), tuple(got["noise2array_chunked"][key] for key in ("calls", "points", "bytes"))
+        )
+        names = ["noise2", "noise3array", "noise2array", "noise2array", "noise3array_culled", "noise2array_chunked"]
+        self.assertEqual(names, [name for name, *_ in calls])
+        self.assertEqual(False, hasattr(simplex.OpenSimplex.noise2, "__wrapped__"))
+        simplex.reset_stats()
+        self.assertEqual({}, simplex.stats()["functions"])
+
+    def test_reductions(self):
+        simplex.seed(0)
+        # Samples are placed in the cell centers, i.e. at -9, -7, ..., 9 and -5, -3, ..., 5
+        ix, iy = np.arange(-9.0, 10.0, 2.0), np.arange(-5.0, 6.0, 2.0)
+        n2 = simplex.noise2array(ix, iy)
+        got = simplex.noise_stats(2, [(-10, 10), (-6, 6)], (10, 6))
+        self.assertEqual(n2.size, got["count"])
+        self.assertEqual((n2.min(), n2.max()), (got["min"], got["max"]))
+        self.assertAlmostEqual(n2.mean(), got["mean"], places=12)
+        self.assertAlmostEqual(n2.var(), got["var"], places=12)
+        hist, edges = simplex.noise_histogram(2, [(-10, 10), (-6, 6)], (10, 6), bins=8)
+        want, want_edges = np.histogram(n2, bins=8, range=(-1.0, 1.0))
+        self.assertEqual(True, np.array_equal(want, hist))
+        self.assertEqual(True, np.array_equal(want_edges, edges))
+
+        n4 = simplex.noise4array(ix[:3], iy[:2], iy[:2], ix[:3])
+        got = simplex.noise_stats(4, [(-10, -4), (-6, -2), (-6, -2), (-10, -4)], (3, 2, 2, 3))
+        self.assertEqual((n4.size, n4.min(), n4.max()), (got["count"], got["min"], got["max"]))
+
+    def test_profile(self):
+        rng = np.random.default_rng(seed=0)
+        simplex.seed(0)
+        for dims, profile in ((2, simplex.profile_noise2), (3, simplex.profile_noise3), (4, simplex.profile_noise4)):
+            report = profile(*(rng.random((dims, 50)) * 100))
+            self.assertEqual(50, report["samples"])
+            self.assertLessEqual(50, report["vertices"])
+            # The first branch always splits the samples between the two halves of the super-cell.
+            first = next(iter(report["branches"].values()))
+            self.assertEqual(50, sum(first))
+        with self.assertRaises(ValueError):
+            simplex.profile_noise2(np.arange(3.0), np.arange(2.0))
+
+    def test_derived_variants(self):
+        # Every rewrite pattern still matches all the vertices of the kernels
+        for dims, kernel in ((2, internals._noise2), (3, internals._noise3), (4, internals._noise4)):
+            transformers = [variants._Profiler()]
+            transformers += [variants._VertexRecorder(dims)] if dims > 2 else []
+            transformers += [variants._Components(dims, "_accumulate%d" % dims)] if dims < 4 else []
+            for transformer in transformers:
+                variants._derive(kernel, "_variant", transformer)
+                self.assertEqual(transformer.vertices, {2: 4, 3: 16, 4: 33}[dims])
+
+        # A kernel changed in a way the patterns don't recognize fails instead of giving a wrong variant
+        source = "def kernel(x, y, perm):\n    value = 0\n    attn0 = 2 - x * x - y * y\n"
+        source += "    if 0 < attn0:\n        value += attn0 * _extrapolate2(perm, 0, 0, x, y)\n"
+        source += "    return value / NORM_CONSTANT2\n"
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "kernel.py")
+            with open(path, "w") as f:
+                f.write(source)
+            namespace = {}
+            exec(compile(source, path, "exec"), namespace)
+            with self.assertRaises(RuntimeError):
+                variants._derive(namespace["kernel"], "_variant", variants._Components(2, "_accumulate2"))
+        # So does a kernel without its source
+        namespace = {}
+        exec(source, namespace)
+        with self.assertRaises(RuntimeError):
+            variants._derive(namespace["kernel"], "_variant", variants._Profiler())
+
+    def test_raymarch(self):
+        rng = np.random.default_rng(seed=0)
+        origins, directions = rng.random((2, 3, 3)) * 4, rng.normal(size=(2, 3, 3))
+        gen = simplex.OpenSimplex(11)
+        t = (np.arange(12) + 0.5) * 0.2
+        points = (origins[..., None, :] + directions[..., None, :] * t[:, None]).transpose(3, 0, 1, 2)
+        noise = (np.vectorize(gen.noise3)(*points) + np.vectorize(gen.noise3)(*points * 2) * 0.5) / 1.5
+        depth = np.clip(noise + 0.2, 0, None).sum(axis=-1) * 0.2
+        marched = gen.noise3_raymarch(origins, directions, 0.2, 12, octaves=2, bias=0.2, output="depth")
+        self.assertEqual(True, np.allclose(depth, marched, rtol=0, atol=1e-12))
+        transmittance = gen.noise3_raymarch(origins, directions, 0.2, 12, 2, bias=0.2, absorption=3.0, cutoff=0)
+        self.assertEqual(True, np.allclose(np.exp(-3.0 * depth), transmittance, rtol=0, atol=1e-12))
+        # Rays are stopped once opaque, the directions are broadcasted against the origins
+        opaque = gen.noise3_raymarch(origins, (1.0, 0.0, 0.0), 0.1, 1000, bias=1.0, cutoff=0.01)
+        self.assertEqual(True, np.all((opaque < 0.01) & (opaque > 0.01 * np.exp(-0.2))))
+        self.assertEqual((), gen.noise3_raymarch((0.0, 0.0, 0.0), (0.0, 0.0, 1.0), 0.1, 4).shape)
+        with self.assertRaises(ValueError):
+            gen.noise3_raymarch(origins[..., :2], directions[..., :2], 0.1, 4)
+
+    def test_thresholds(self):
+        rng = np.random.default_rng(seed=0)
+        ix, iy, iz, iw = rng.random(13) * 9, rng.random(5) * 9, rng.random(4) * 9, rng.random(3) * 9
+        simplex.seed(0)
+        n3 = simplex.noise3array(ix, iy, iz)
+        self.assertEqual(True, np.array_equal(n3 > 0.1, simplex.noise3array_threshold(ix, iy, iz, 0.1).view(bool)))
+        packed = simplex.noise3array_threshold(ix, iy, iz, 0.1, packed=True)
+        self.assertEqual((4, 5, 2), packed.shape)
+        self.assertEqual(True, np.array_equal(np.packbits(n3 > 0.1, axis=-1), packed))
+        labels = simplex.noise2array_threshold(ix, iy, [-0.2, 0.0, 0.2])
+        self.assertEqual(True, np.array_equal(np.searchsorted([-0.2, 0.0, 0.2], simplex.noise2array(ix, iy)), labels))
+        n4 = simplex.noise4array(ix, iy, iz, iw)
+        self.assertEqual(True, np.array_equal(n4 > 0, simplex.noise4array_threshold(ix, iy, iz, iw, 0.0)))
+        with self.assertRaises(ValueError):
+            simplex.noise2array_threshold(ix, iy, [0.2, -0.2])
+        with self.assertRaises(ValueError):
+            simplex.noise2array_threshold(ix, iy, [-0.2, 0.2], packed=True)
+
+    def test_culling(self):
+        simplex.seed(0)
+        rng = np.random.default_rng(seed=0)
+        for size in (0.05, 0.3):
+            for origin in rng.uniform(-20.0, 20.0, (10, 3)):
+                low, high = simplex.noise3_bounds(origin, size)
+                noise = simplex.noise3array(*(np.linspace(o, o + size, 6) for o in origin))
+                self.assertLessEqual(low, noise.min())
+                self.assertGreaterEqual(high, noise.max())
+
+        ix, iy, iz = np.linspace(0.0, 2.0, 20), np.linspace(1.0, 2.0, 12), np.linspace(0.0, 1.0, 10)
+        noise, classes = simplex.noise3array_culled(ix, iy, iz, 0.3, block_size=4)
+        self.assertEqual((3, 3, 5), classes.shape)
+        want = simplex.noise3array(ix, iy, iz)
+        generated = np.repeat(np.repeat(np.repeat(classes, 4, 0), 4, 1), 4, 2)[:10]
+        self.assertEqual(True, np.array_equal(want[generated == 0], noise[generated == 0]))
+        self.assertEqual(True, np.all(np.isnan(noise[generated != 0])))
+        self.assertEqual(True, np.all(want[generated == -1] < 0.3))
+        self.assertEqual(True, np.all(want[generated == 1] > 0.3))
+        self.assertGreater(np.count_nonzero(classes), 0)
+
+    def test_lookup_kernels(self):
+        simplex.seed(0)
+        for s in self.load_samples():
+            if len(s) == 4:
+                got = simplex.noise3array(*(np.array([v]) for v in s[:3]), kernel="lookup")
+            elif len(s) == 5:
+                got = simplex.noise4array(*(np.array([v]) for v in s[:4]), kernel="lookup")
+            else:
+                continue
+            self.assertEqual(s[-1], got.item())
+
+        rng = np.random.default_rng(seed=0)
+        ix, iy, iz, iw = rng.random(11) * 10, rng.random(7) * 10, rng.random(5) * 10, rng.random(3) * 10
+        n3 = simplex.noise3array(ix, iy, iz, kernel="lookup")
+        self.assertEqual(True, np.array_equal(simplex.noise3array(ix, iy, iz), n3))
+        n4 = simplex.noise4array(ix, iy, iz, iw, kernel="lookup")
+        self.assertEqual(True, np.array_equal(simplex.noise4array(ix, iy, iz, iw), n4))
+        with self.assertRaises(ValueError):
+            simplex.noise3array(ix, iy, iz, kernel="simd")
+
+    @unittest.skipIf(simplex.jit._cfunc is None, "millions of samples take minutes without numba")
+    def test_lookup_kernels_random(self):
+        # Grids of about 2M points, the 4D kernel used to differ by an ulp far (up to 0.025) from region boundaries
+        rng = np.random.default_rng(seed=1)
+        simplex.seed(0)
+        for scale in (1.0, 10.0):
+            coords = [rng.random(128) * scale for _ in range(3)]
+            self.assertEqual(
+                True, np.array_equal(simplex.noise3array(*coords), simplex.noise3array(*coords, kernel="lookup"))
+            )
+            coords = [rng.random(38) * scale for _ in range(4)]
+            self.assertEqual(
+                True, np.array_equal(simplex.noise4array(*coords), simplex.noise4array(*coords, kernel="lookup"))
+            )
+
+    def test_pickle(self):
+        noise = simplex.OpenSimplex(1000000000)
+        self.assertEqual(False, hasattr(noise, "__dict__"))
+        self.assertEqual(np.uint8, noise._perm.dtype)
+        for shared in (False, True):
+            original = simplex.OpenSimplex(1000000000, shared=shared)
+            copy = pickle.loads(pickle.dumps(original))
+            self.assertEqual(1000000000, copy.get_seed())
+            self.assertEqual(noise.noise2(0.5, 0.5), copy.noise2(0.5, 0.5))
+            self.assertEqual(noise.noise3(0.5, 1.5, 2.5), copy.noise3(0.5, 1.5, 2.5))
+            self.assertEqual(noise.noise4(0.5, 1.5, 2.5, 3.5), copy.noise4(0.5, 1.5, 2.5, 3.5))
+        # Instances of the same seed attach to the same tables
+        self.assertEqual(True, np.shares_memory(original._perm, copy._perm))
+        self.assertLess(len(pickle.dumps(original)), 128)
+
 
 ################################################################################
 